@@ -0,0 +1,33 @@
+# Benchmarks for calendar_utils on daily zonal mean data
+
+from dycoreutils import calendar_utils as cal
+
+from . import synthetic
+
+class SeasonMean:
+    params = (list(synthetic.SIZES), ['all', 'DJF'])
+    param_names = ['size', 'season']
+
+    def setup(self, size, season):
+        nyears, nlev, nlat, nlon = synthetic.SIZES[size]
+        self.uzm = synthetic.zonalmean_daily(nyears, nlev, nlat)
+
+    def time_season_mean(self, size, season):
+        cal.season_mean(self.uzm, season=season, cal='noleap').load()
+
+    def peakmem_season_mean(self, size, season):
+        cal.season_mean(self.uzm, season=season, cal='noleap').load()
+
+class GroupSeasonDaily:
+    params = list(synthetic.SIZES)
+    param_names = ['size']
+
+    def setup(self, size):
+        nyears, nlev, nlat, nlon = synthetic.SIZES[size]
+        self.uzm = synthetic.zonalmean_daily(nyears, nlev, nlat)
+
+    def time_group_season_daily(self, size):
+        cal.group_season_daily(self.uzm, 'DJF')
+
+    def peakmem_group_season_daily(self, size):
+        cal.group_season_daily(self.uzm, 'DJF')
@@ -0,0 +1,44 @@
+# Benchmarks for interpolating model zonal means to a reference (ERA5-like) grid:
+# xarray's interp for each experiment against the cached weights of compare_utils
+
+import numpy as np
+import xarray as xr
+
+from dycoreutils import compare_utils as compare
+
+from . import synthetic
+
+# (number of experiments, nmonths) of monthly zonal means on the same model grid
+COMPARESIZES = {'small': (2, 120),
+                'large': (6, 480)}
+
+class BiasFields:
+    params = (list(COMPARESIZES), ['interp', 'weights'])
+    param_names = ['size', 'method']
+    timeout = 600
+
+    def setup(self, size, method):
+        nexp, nmonths = COMPARESIZES[size]
+        rng = np.random.default_rng(5)
+        lev = synthetic.pressure(70)
+        lat = synthetic.latitude(192)
+        self.experiments = {'exp'+str(iexp): xr.DataArray(rng.standard_normal((nmonths, lev.size, lat.size)),
+                                                          dims=('time', 'lev', 'lat'),
+                                                          coords={'lev': lev, 'lat': lat})
+                            for iexp in range(nexp)}
+        pre = np.array([1000., 850., 700., 500., 300., 200., 100., 50., 30., 20., 10., 7., 5., 3., 2., 1.])
+        self.reference = xr.DataArray(rng.standard_normal((nmonths, pre.size, 181)), dims=('time', 'pre', 'lat'),
+                                      coords={'pre': pre, 'lat': np.linspace(90., -90., 181)})
+
+    def _bias(self, method):
+        if (method == 'weights'):
+            return compare.bias_fields(self.experiments, self.reference)
+        logpre = np.log(self.reference.pre.values)
+        return [dat.assign_coords(lev=np.log(dat.lev.values)).interp(lev=logpre, lat=self.reference.lat.values)
+                - self.reference.values for dat in self.experiments.values()]
+
+    def time_bias_fields(self, size, method):
+        self._bias(method)
+
+    def peakmem_bias_fields(self, size, method):
+        self._bias(method)
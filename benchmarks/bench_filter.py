@@ -0,0 +1,20 @@
+# Benchmarks for filter_utils
+
+from dycoreutils import filter_utils as filt
+
+from . import synthetic
+
+class CalcSeasonNharm:
+    params = list(synthetic.SIZES)
+    param_names = ['size']
+
+    def setup(self, size):
+        nyears, nlev, nlat, nlon = synthetic.SIZES[size]
+        uzm = synthetic.zonalmean_daily(nyears, nlev, nlat)
+        self.clim = uzm.groupby('time.dayofyear').mean('time')
+
+    def time_calc_season_nharm(self, size):
+        filt.calc_season_nharm(self.clim, 4, dimtime=0)
+
+    def peakmem_calc_season_nharm(self, size):
+        filt.calc_season_nharm(self.clim, 4, dimtime=0)
@@ -0,0 +1,11 @@
+# Import time of the package and its modules, each in a fresh interpreter.
+# The non-plotting modules shouldn't pull in matplotlib (see dycoreutils/__init__.py).
+
+class ImportTime:
+    params = ['dycoreutils', 'dycoreutils.calendar_utils', 'dycoreutils.readdata_utils',
+              'dycoreutils.filter_utils', 'dycoreutils.ssw_utils', 'dycoreutils.tem_utils',
+              'dycoreutils.variability_utils', 'dycoreutils.plot_utils']
+    param_names = ['module']
+
+    def timeraw_import(self, module):
+        return "import "+module
@@ -0,0 +1,53 @@
+# Benchmarks for plot_utils.plotlatlogpre: a 3x3 page of (pre, lat) panels saved as a
+# pdf with the filled contours as vectors, rasterized, or from decimated latitudes
+
+import io
+
+import numpy as np
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+from dycoreutils import plot_utils as myplots
+
+from . import synthetic
+
+# (nlev, nlat) of each panel
+PLOTSIZES = {'small': (32, 96),
+             'large': (83, 768)}
+
+MODES = {'vector': {},
+         'rasterize': {'rasterize': True},
+         'decimate': {'decimate': 4}}
+
+class PlotLatLogPre:
+    params = (list(PLOTSIZES), list(MODES))
+    param_names = ['size', 'mode']
+    timeout = 600
+
+    def setup(self, size, mode):
+        nlev, nlat = PLOTSIZES[size]
+        rng = np.random.default_rng(6)
+        self.pre = synthetic.pressure(nlev)
+        self.lat = synthetic.latitude(nlat)
+        pp, ll = np.meshgrid(np.log10(self.pre), np.deg2rad(self.lat), indexing='ij')
+        # jets plus small scale noise, which is what makes the contours expensive
+        jets = 40.*np.cos(ll)**2*np.sin(2.*ll)*np.exp(-(pp - 1.)**2)
+        self.fields = [jets + rng.standard_normal(jets.shape) for i in range(9)]
+
+    def _page(self, mode):
+        fig = Figure(figsize=(16, 16))
+        FigureCanvasAgg(fig)
+        x1, x2, y1, y2 = myplots.get3by3coords()
+        for i, field in enumerate(self.fields):
+            myplots.plotlatlogpre(fig, field, self.lat, self.pre, 5, -50, 50, 'panel '+str(i),
+                                  x1[i], x2[i], y1[i], y2[i], **MODES[mode])
+        buf = io.BytesIO()
+        fig.savefig(buf, format='pdf')
+        return buf
+
+    def time_plot_pdf(self, size, mode):
+        self._page(mode)
+
+    def track_pdf_bytes(self, size, mode):
+        return self._page(mode).getbuffer().nbytes
+    track_pdf_bytes.unit = 'bytes'
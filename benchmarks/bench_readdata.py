@@ -0,0 +1,58 @@
+# Benchmarks for readdata_utils on multi-file CESM-like monthly output
+
+import os
+
+from dycoreutils import readdata_utils as read
+
+from . import synthetic
+
+class ReadCesmZonalmean:
+    params = list(synthetic.SIZES)
+    param_names = ['size']
+    timeout = 600
+
+    def setup_cache(self):
+        files = {}
+        for size in synthetic.SIZES:
+            files[size] = synthetic.write_cesm_monthly(os.path.join('cesm_monthly', size),
+                                                       *synthetic.SIZES[size])
+        return files
+
+    def _read(self, files, size):
+        nyears = synthetic.SIZES[size][0]
+        dat = read.read_cesm_zonalmean(files[size], str(synthetic.YSTART)+'-01',
+                                       str(synthetic.YSTART+nyears-1)+'-12')
+        return dat.U.load()
+
+    def time_read_cesm_zonalmean(self, files, size):
+        self._read(files, size)
+
+    def peakmem_read_cesm_zonalmean(self, files, size):
+        self._read(files, size)
+
+class ReadPrefetch:
+    """ zonal mean of monthly CESM files with an artificial latency of 0.1 s per file,
+    reading the files one by one (nprefetch=0) or prefetching them in threads """
+    params = [0, 2, 8]
+    param_names = ['nprefetch']
+    timeout = 600
+    latency = 0.1
+
+    def setup_cache(self):
+        # 2 years of monthly files, as CESM writes the h0 history
+        nyears, nlev, nlat, nlon = synthetic.SIZES['small']
+        return synthetic.write_cesm_monthly('cesm_monthly_files', nyears, nlev, nlat, nlon,
+                                            nfiles=12*nyears)
+
+    def _read(self, files, nprefetch):
+        nyears = synthetic.SIZES['small'][0]
+        with synthetic.file_latency(self.latency):
+            dat = read.read_prefetch(files, str(synthetic.YSTART)+'-01', str(synthetic.YSTART+nyears-1)+'-12',
+                                     reduce=lambda dat: dat.mean('lon'), cesm=True, nprefetch=nprefetch)
+        return dat.U
+
+    def time_read_prefetch(self, files, nprefetch):
+        self._read(files, nprefetch)
+
+    def peakmem_read_prefetch(self, files, nprefetch):
+        self._read(files, nprefetch)
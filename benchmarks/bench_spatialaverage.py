@@ -0,0 +1,19 @@
+# Benchmarks for spatialaverage_utils
+
+from dycoreutils import spatialaverage_utils as avg
+
+from . import synthetic
+
+class CosWeightLat:
+    params = list(synthetic.SIZES)
+    param_names = ['size']
+
+    def setup(self, size):
+        nyears, nlev, nlat, nlon = synthetic.SIZES[size]
+        self.uzm = synthetic.zonalmean_daily(nyears, nlev, nlat)
+
+    def time_cosweightlat(self, size):
+        avg.cosweightlat(self.uzm, -5, 5).load()
+
+    def peakmem_cosweightlat(self, size):
+        avg.cosweightlat(self.uzm, -5, 5).load()
@@ -0,0 +1,19 @@
+# Benchmarks for ssw_utils
+
+from dycoreutils import ssw_utils as ssw
+
+from . import synthetic
+
+class SswCp:
+    params = [20, 40, 100]
+    param_names = ['nyears']
+    timeout = 600
+
+    def setup(self, nyears):
+        self.u1060 = synthetic.u1060_daily(nyears)
+
+    def time_ssw_cp(self, nyears):
+        ssw.ssw_cp(self.u1060)
+
+    def peakmem_ssw_cp(self, nyears):
+        ssw.ssw_cp(self.u1060)
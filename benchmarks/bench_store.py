@@ -0,0 +1,90 @@
+# Benchmarks for reading point time series of TEM diagnostics from netcdf and from
+# the timeseries layout of a Zarr store, and for extracting points and slabs from a
+# single TEM file with xarray and with memory maps
+
+import os
+
+import numpy as np
+import xarray as xr
+
+from dycoreutils import store_utils as store
+from dycoreutils import tem_utils as tem
+
+from . import synthetic
+from .bench_tem import TEMSIZES
+
+LATS = [60., -60., 0.]
+PRES = [10., 10., 50.]
+
+class PointTimeseries:
+    params = (list(TEMSIZES), ['netcdf', 'zarr'])
+    param_names = ['size', 'format']
+    timeout = 600
+
+    def setup_cache(self):
+        files = {}
+        os.makedirs('tem_store', exist_ok=True)
+        for size in TEMSIZES:
+            temdiags = tem.calc_tem(synthetic.tem_fluxes(*TEMSIZES[size]))
+            files[size] = os.path.join('tem_store', size)
+            temdiags.to_netcdf(files[size]+'.nc')
+            store.write_zarr(temdiags, files[size]+'.zarr')
+        return files
+
+    def _read(self, files, size, format):
+        if (format == 'zarr'):
+            return store.point_timeseries(files[size]+'.zarr', LATS, PRES, ['epfz'])
+        with xr.open_dataset(files[size]+'.nc') as dat:
+            return dat[['epfz']].sel(lat=xr.DataArray(LATS, dims='point'),
+                                     pre=xr.DataArray(PRES, dims='point'), method='nearest').load()
+
+    def time_point_timeseries(self, files, size, format):
+        self._read(files, size, format)
+
+    def peakmem_point_timeseries(self, files, size, format):
+        self._read(files, size, format)
+
+# (nyears, nlev, nlat) of daily TEM output files
+PRODUCTSIZES = {'10years': (10, 58, 96),
+                '40years': (40, 58, 96)}
+
+class MemmapExtraction:
+    """ extracting points and a seasonal slab from a single TEM file with xarray
+    (open_dataset and sel) and with the memory mapped store_utils.open_memmap """
+    params = (list(PRODUCTSIZES), ['xarray', 'memmap'])
+    param_names = ['size', 'reader']
+    timeout = 1200
+
+    def setup_cache(self):
+        files = {}
+        os.makedirs('tem_product', exist_ok=True)
+        for size in PRODUCTSIZES:
+            files[size] = synthetic.write_tem_product(os.path.join('tem_product', size+'.nc'),
+                                                      *PRODUCTSIZES[size])
+        return files
+
+    # the extracted values are averaged so that both readers actually read them
+
+    def _points(self, files, size, reader):
+        if (reader == 'memmap'):
+            points = store.memmap_points(files[size], LATS, PRES, ['epfz'])
+            return [np.mean(point.epfz.values) for point in points]
+        with xr.open_dataset(files[size]) as dat:
+            return [np.mean(dat.epfz.sel(lat=lat, pre=pre, method='nearest').values)
+                    for lat, pre in zip(LATS, PRES)]
+
+    def _slab(self, files, size, reader):
+        # the first winter (time, pre, lat)
+        if (reader == 'memmap'):
+            return np.mean(store.open_memmap(files[size], ['epfz']).epfz.isel(time=slice(334, 424)).values)
+        with xr.open_dataset(files[size]) as dat:
+            return np.mean(dat.epfz.isel(time=slice(334, 424)).values)
+
+    def time_points(self, files, size, reader):
+        self._points(files, size, reader)
+
+    def time_slab(self, files, size, reader):
+        self._slab(files, size, reader)
+
+    def peakmem_points(self, files, size, reader):
+        self._points(files, size, reader)
@@ -0,0 +1,32 @@
+# Benchmarks for the seasonal mean and std of daily zonal mean data: masking and
+# reducing each season as in the notebooks, against stream_utils in one pass
+
+from dycoreutils import stream_utils as stream
+
+from . import synthetic
+
+SEASONS = ['DJF', 'MAM', 'JJA', 'SON']
+
+class SeasonalStats:
+    params = (list(synthetic.SIZES), ['masked', 'stream'])
+    param_names = ['size', 'method']
+    timeout = 600
+
+    def setup(self, size, method):
+        nyears, nlev, nlat, nlon = synthetic.SIZES[size]
+        self.uzm = synthetic.zonalmean_daily(nyears, nlev, nlat)
+
+    def _stats(self, method):
+        if (method == 'stream'):
+            return stream.stream_stats(self.uzm).seasonal()
+        stats = []
+        for season in SEASONS:
+            masked = self.uzm.where(self.uzm['time.season'] == season)
+            stats.append((masked.mean('time'), masked.std('time')))
+        return stats
+
+    def time_seasonal_stats(self, size, method):
+        self._stats(method)
+
+    def peakmem_seasonal_stats(self, size, method):
+        self._stats(method)
@@ -0,0 +1,43 @@
+# Benchmarks for the TEM calculation
+
+import numpy as np
+
+from dycoreutils import tem_utils as tem
+
+from . import synthetic
+
+# (nyears, nlev, nlat) of daily data.  Smaller than synthetic.SIZES as calc_tem
+# holds ~30 full size arrays at once
+TEMSIZES = {'small': (1, 32, 48),
+            'medium': (2, 58, 96),
+            'large': (4, 83, 96)}
+
+class CalcTem:
+    params = (list(TEMSIZES), ['float64', 'float32'], ['numpy', 'numba'])
+    param_names = ['size', 'dtype', 'engine']
+    timeout = 600
+
+    def setup(self, size, dtype, engine):
+        if (engine == 'numba'):
+            try:
+                import numba
+            except ImportError:
+                raise NotImplementedError("numba isn't installed")
+        # float32 input as in the CESM history files
+        self.fluxes = synthetic.tem_fluxes(*TEMSIZES[size]).astype('float32')
+        # compile the numba kernel outside of the timing
+        tem.calc_tem(self.fluxes.isel(time=slice(0, 2)), dtype=dtype, engine=engine)
+
+    def time_calc_tem(self, size, dtype, engine):
+        tem.calc_tem(self.fluxes, dtype=dtype, engine=engine)
+
+    def peakmem_calc_tem(self, size, dtype, engine):
+        tem.calc_tem(self.fluxes, dtype=dtype, engine=engine)
+
+    def track_max_relative_error(self, size, dtype, engine):
+        """ largest error of any TEM variable relative to its maximum, against float64 numpy """
+        ref = tem.calc_tem(self.fluxes, dtype='float64', engine='numpy')
+        result = tem.calc_tem(self.fluxes, dtype=dtype, engine=engine)
+        return max(float(np.abs(result[var] - ref[var]).max()/np.abs(ref[var]).max()) for var in ref)
+
+    track_max_relative_error.unit = 'relative error'
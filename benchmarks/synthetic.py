@@ -0,0 +1,158 @@
+# Synthetic CESM-like data for the benchmarks.  Everything is generated locally
+# with a fixed seed, on a noleap calendar, so results are comparable across commits.
+
+import contextlib
+import os
+import time
+
+import numpy as np
+import xarray as xr
+import cftime
+
+# (nyears, nlev, nlat, nlon) for each benchmark size
+SIZES = {'small': (2, 32, 48, 96),
+         'medium': (5, 58, 96, 144),
+         'large': (10, 83, 96, 144)}
+
+YSTART = 1979
+
+def noleap_days(nyears):
+    """ daily noleap time axis starting on Jan 1st YSTART """
+    start = str(YSTART)+'-01-01'
+    if hasattr(xr, 'date_range'):
+        return xr.date_range(start, periods=365*nyears, freq='D', calendar='noleap', use_cftime=True)
+    # xarray < 2023.04, cftime_range is deprecated after that
+    return xr.cftime_range(start, periods=365*nyears, freq='D', calendar='noleap')
+
+def pressure(nlev):
+    return np.logspace(-2, 3, nlev)
+
+def latitude(nlat):
+    return np.linspace(-90, 90, nlat)
+
+def write_cesm_monthly(dirname, nyears, nlev, nlat, nlon, nfiles=None):
+    """ Write monthly CESM history-like files of U(time, lev, lat, lon) with time_bnds and
+    time at the end of the averaging period as CESM does.  One file per year by default.
+    Returns a glob for the files.
+    """
+    os.makedirs(dirname, exist_ok=True)
+    rng = np.random.default_rng(0)
+    nfiles = nyears if (nfiles is None) else nfiles
+
+    lev = pressure(nlev)
+    lat = latitude(nlat)
+    lon = np.linspace(0, 360, nlon, endpoint=False)
+    units = 'days since '+str(YSTART)+'-01-01 00:00:00'
+
+    # month boundaries in days since the start
+    dpm = np.array([31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31])
+    edges = np.concatenate(([0], np.cumsum(np.tile(dpm, nyears)))).astype(float)
+    bnds = np.stack([edges[:-1], edges[1:]], axis=1)
+
+    ubase = (30.*np.cos(np.deg2rad(lat))[None,:,None]*np.ones((nlev, 1, nlon))).astype('float32')
+
+    for ifile, months in enumerate(np.array_split(np.arange(12*nyears), nfiles)):
+        u = ubase[None,...] + rng.standard_normal((months.size, nlev, nlat, nlon), dtype='float32')
+        ds = xr.Dataset({'U': (('time', 'lev', 'lat', 'lon'), u),
+                         'time_bnds': (('time', 'nbnd'), bnds[months])},
+                        coords={'time': ('time', bnds[months,1]), 'lev': lev, 'lat': lat, 'lon': lon})
+        ds.time.attrs = {'units': units, 'calendar': 'noleap', 'bounds': 'time_bnds'}
+        ds.time_bnds.attrs = {'units': units, 'calendar': 'noleap'}
+        ds.to_netcdf(os.path.join(dirname, 'hist.'+str(ifile).zfill(4)+'.nc'))
+
+    return os.path.join(dirname, 'hist.*.nc')
+
+def zonalmean_daily(nyears, nlev, nlat, name='uzm'):
+    """ daily zonal mean zonal wind (time, pre, lat) with a seasonal cycle and noise """
+    rng = np.random.default_rng(1)
+    time = noleap_days(nyears)
+    pre = pressure(nlev)
+    lat = latitude(nlat)
+    seas = np.cos(2.*np.pi*np.arange(time.size)/365.)
+    u = (20.*seas[:,None,None]*np.sin(np.deg2rad(lat))[None,None,:] +
+         5.*rng.standard_normal((time.size, nlev, nlat)))
+    return xr.DataArray(u, coords=[('time', time), ('pre', pre), ('lat', lat)], name=name)
+
+def u1060_daily(nyears):
+    """ daily 10hPa 60N zonal wind with a winter vortex and occasional reversals """
+    rng = np.random.default_rng(2)
+    time = noleap_days(nyears)
+    seas = 25.*np.cos(2.*np.pi*(np.arange(time.size) - 15.)/365.)
+    # red noise so that reversals last for a while
+    noise = np.zeros(time.size)
+    eps = rng.standard_normal(time.size)
+    for i in range(1, time.size):
+        noise[i] = 0.95*noise[i-1] + 4.*eps[i]
+    return xr.DataArray(seas + 5. + noise, coords=[('time', time)], name='u1060')
+
+def tem_fluxes(nyears, nlev, nlat):
+    """ daily zonal mean fluxes as used by tem_utils.calc_tem """
+    rng = np.random.default_rng(3)
+    time = noleap_days(nyears)
+    pre = pressure(nlev)
+    lat = latitude(nlat)
+    # stay away from the poles where cos(lat) = 0
+    lat = lat.clip(-89., 89.)
+    ntime = time.size
+
+    pp, ll = np.meshgrid(pre, lat, indexing='ij')
+    coslat = np.cos(np.deg2rad(ll))
+    th = 300.*(1000./pp)**0.286
+
+    def field(base, scale):
+        return base[None,:,:] + scale*rng.standard_normal((ntime, nlev, nlat))
+
+    dims = ('time', 'pre', 'lat')
+    fluxes = xr.Dataset({'Uzm': (dims, field(20.*coslat, 1.)),
+                         'THzm': (dims, field(th, 0.1)),
+                         'VTHzm': (dims, field(np.sin(np.deg2rad(2.*ll)), 0.5)),
+                         'Vzm': (dims, field(0.*ll, 0.3)),
+                         'UVzm': (dims, field(5.*np.sin(np.deg2rad(2.*ll)), 1.)),
+                         'UWzm': (dims, field(0.*ll, 1e-3)),
+                         'Wzm': (dims, field(0.*ll, 1e-3))},
+                        coords={'time': time, 'pre': pre, 'lat': lat})
+    return fluxes
+
+def write_tem_product(filename, nyears, nlev, nlat, varnames=('epfz', 'utendepfd')):
+    """ Write a single netcdf file of daily TEM output (time, pre, lat) in float32, stored
+    contiguously as calc_tem output written with to_netcdf is.  Written one year at a
+    time so long records don't need to fit in memory.
+    """
+    import netCDF4
+
+    rng = np.random.default_rng(4)
+    pre = pressure(nlev)
+    lat = latitude(nlat)
+    time = np.arange(365*nyears, dtype='float64')
+
+    with netCDF4.Dataset(filename, 'w') as nc:
+        for name, coord in zip(['time', 'pre', 'lat'], [time, pre, lat]):
+            nc.createDimension(name, coord.size)
+            nc.createVariable(name, 'f8', (name,))[:] = coord
+        nc['time'].units = 'days since '+str(YSTART)+'-01-01 00:00:00'
+        nc['time'].calendar = 'noleap'
+        for var in varnames:
+            ncvar = nc.createVariable(var, 'f4', ('time', 'pre', 'lat'), contiguous=True)
+            for iyear in range(nyears):
+                ncvar[365*iyear:365*(iyear+1)] = rng.standard_normal((365, nlev, nlat), dtype='float32')
+
+    return filename
+
+@contextlib.contextmanager
+def file_latency(seconds):
+    """ Artificial latency on every file read by readdata_utils.read_prefetch, to mimic a
+    parallel filesystem with a high cost per file on a local disk.  The sleep releases the
+    GIL like waiting on the filesystem does.
+    """
+    from dycoreutils import readdata_utils as read
+
+    readfile = read._readfile
+    def _slowreadfile(path):
+        time.sleep(seconds)
+        return readfile(path)
+
+    read._readfile = _slowreadfile
+    try:
+        yield
+    finally:
+        read._readfile = readfile
@@ -0,0 +1,37 @@
+# dycoreutils: diagnostic tools for evaluating CESM dycore candidates.
+#
+# The submodules are loaded lazily, on first access, so that e.g.
+#     import dycoreutils
+#     dycoreutils.calendar_utils.season_mean(...)
+# only imports what is used.  In particular matplotlib is only imported by the
+# plotting modules (plot_utils, colorbar_utils, colormap_utils, batchplot_utils).
+
+import importlib
+import sys
+import types
+
+__version__ = '0.1'
+
+submodules = ['batchplot_utils', 'budget_utils', 'calendar_utils', 'colorbar_utils',
+              'colormap_utils', 'compare_utils', 'composite_utils', 'dask_utils',
+              'filter_utils', 'operator_utils', 'pdf_utils', 'plot_utils',
+              'precision_utils', 'profile_utils', 'qbo_utils', 'readdata_utils',
+              'registry_utils', 'resample_utils', 'spatialaverage_utils', 'ssw_utils',
+              'store_utils', 'stream_utils', 'tem_utils', 'tracer_utils',
+              'variability_utils']
+
+__all__ = list(submodules)
+
+class _LazyModule(types.ModuleType):
+    """ module that imports its submodules on first attribute access
+    (module level __getattr__ isn't available before python 3.7)
+    """
+    def __getattr__(self, name):
+        if name in submodules:
+            return importlib.import_module('.'+name, __name__)
+        raise AttributeError("module "+repr(__name__)+" has no attribute "+repr(name))
+
+    def __dir__(self):
+        return sorted(set(list(self.__dict__) + submodules))
+
+sys.modules[__name__].__class__ = _LazyModule
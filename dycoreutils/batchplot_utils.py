@@ -0,0 +1,96 @@
+# routines for rendering many figures in parallel, headless (Agg canvas)
+#
+# Data loading is kept separate from drawing.  The data for each panel is
+# read and reduced in the calling process (e.g. the notebook) and put into a
+# figure spec, a plain dictionary of numpy arrays and plotting options.
+# The specs are then drawn and saved by a pool of worker processes.
+#
+# A figure spec looks like
+#     spec = {'filename': 'uzm_djf.pdf',
+#             'plotfunc': 'plotlatlogpre_to0p01',  # name of a plot_utils function
+#             'layout': '4by4',                    # '3by3', '4by4' or (x1, x2, y1, y2)
+#             'panels': [panel(data, lat, pre, 2, -30, 30, 'exp1'), ...],
+#             'figsize': (16,16),                  # optional
+#             'colorbar': {...},                   # optional, plotcolorbar arguments
+#             'savekw': {'dpi': 300}}              # optional, passed to savefig
+# Individual panels can override plotfunc with panel(..., plotfunc='plotddamp').
+
+import multiprocessing
+import pickle
+import sys
+
+import numpy as np
+
+def panel(*args, **kwargs):
+    """ Set up one panel of a figure spec.
+    args and kwargs are those of the plot_utils function that draws the panel,
+    leaving out fig and the panel position (x1, x2, y1, y2).  xarray/dask
+    arguments are computed here, so that the workers only receive numpy arrays.
+    """
+    plotfunc = kwargs.pop('plotfunc', None)
+    args = [np.asarray(arg) if hasattr(arg, 'dims') else arg for arg in args]
+    kwargs = {key: (np.asarray(val) if hasattr(val, 'dims') else val) for key, val in kwargs.items()}
+
+    return {'args': args, 'kwargs': kwargs, 'plotfunc': plotfunc}
+
+def render_figure(spec):
+    """ Draw and save one figure from a figure spec.  Returns the file name.
+    The figure is drawn on its own Agg canvas rather than through pyplot, so the
+    matplotlib backend of the calling process (e.g. inline in a notebook) is left alone.
+    """
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from dycoreutils import plot_utils as dycoreplt
+
+    layout = spec.get('layout', '4by4')
+    if (layout == '3by3'):
+        x1, x2, y1, y2 = dycoreplt.get3by3coords()
+    elif (layout == '4by4'):
+        x1, x2, y1, y2 = dycoreplt.get4by4coords()
+    else:
+        x1, x2, y1, y2 = layout
+
+    panels = spec['panels']
+    if (len(panels) > len(x1)):
+        raise ValueError(spec['filename']+": more panels ("+str(len(panels))+") than positions ("+str(len(x1))+")")
+
+    fig = Figure(figsize=spec.get('figsize', (16,16)))
+    FigureCanvasAgg(fig)
+
+    for ipanel, thispanel in enumerate(panels):
+        plotfunc = getattr(dycoreplt, thispanel['plotfunc'] or spec['plotfunc'])
+        plotfunc(fig, *thispanel['args'], x1=x1[ipanel], x2=x2[ipanel], y1=y1[ipanel], y2=y2[ipanel],
+                 **thispanel['kwargs'])
+
+    if ('colorbar' in spec):
+        from dycoreutils import colorbar_utils as cbar
+        cbar.plotcolorbar(fig, **spec['colorbar'])
+
+    fig.savefig(spec['filename'], **spec.get('savekw', {}))
+
+    return spec['filename']
+
+def render_figures(specs, nprocs=None):
+    """ Render a list of figure specs in a pool of nprocs processes
+    (default = number of cores).  Returns the list of file names.
+    If nprocs = 1, the figures are rendered serially in this process.
+    """
+    if (nprocs == 1):
+        return [render_figure(spec) for spec in specs]
+
+    # spawn rather than fork so that workers don't inherit the notebook's
+    # matplotlib state or any threads (e.g. from dask).  multiprocessing.Pool rather
+    # than ProcessPoolExecutor, whose mp_context needs python 3.7
+    with multiprocessing.get_context('spawn').Pool(processes=nprocs) as pool:
+        filenames = pool.map(render_figure, specs, chunksize=1)
+
+    return filenames
+
+if __name__ == "__main__":
+    # headless entry point: python -m dycoreutils.batchplot_utils specs.pkl [nprocs]
+    # where specs.pkl is a pickled list of figure specs
+    with open(sys.argv[1], 'rb') as f:
+        specs = pickle.load(f)
+    nprocs = int(sys.argv[2]) if (len(sys.argv) > 2) else None
+    for filename in render_figures(specs, nprocs=nprocs):
+        print(filename)
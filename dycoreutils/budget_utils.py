@@ -0,0 +1,193 @@
+# Zonal momentum budget and downward control diagnostics built on the TEM output of
+# tem_utils.calc_tem (as written by preprocessing/TEMdiags).
+#
+# The TEM zonal momentum equation is
+#     du/dt = utendepfd + utendvtem + utendwtem + (parameterized gravity wave tendencies) + residual
+# and in the steady state v* = -F/fhat, with F the total wave forcing and
+# fhat = f - (1/acos(phi)) d(u cos(phi))/dphi, so the mass stream function can be
+# estimated from the forcing above each level (downward control, Haynes et al. 1991):
+#     psi_dc(p) = (2 pi a cos(phi)/g) * int_0^p (-F/fhat) dp'
+# which is integrated with the same cached operator as psitem in calc_tem so the two
+# can be compared directly.
+#
+# Everything is lazy until the seasonal climatologies are computed, which is done
+# for all the terms at once in a single pass through the data of each experiment.
+
+import os
+
+import numpy as np
+import xarray as xr
+
+from dycoreutils import compare_utils as compare
+from dycoreutils import dask_utils
+from dycoreutils import operator_utils as ops
+from dycoreutils import readdata_utils as read
+from dycoreutils import store_utils as store
+from dycoreutils.profile_utils import profiled
+
+a=6.371e6
+om=7.29212e-5
+g0=9.80665
+
+temterms = ['utendepfd', 'utendvtem', 'utendwtem']
+
+def _along_last(arr, op):
+    return ops.apply_operator(op, arr, -1)
+
+@profiled
+def read_tem(path, layout='snapshot', target_mb=128):
+    """ open TEM output lazily, either a Zarr store written by store_utils (path ending
+    in .zarr) or a netcdf file.  A netcdf file is chunked in time (chunks of about
+    target_mb, see dask_utils) so that the climatologies are computed a chunk at a time
+    rather than from whole variables """
+    if path.rstrip('/').endswith('.zarr'):
+        return store.open_zarr(path, layout=layout)
+    if not os.path.exists(path):
+        raise FileNotFoundError(path)
+    return dask_utils.rechunk(xr.open_dataset(path, chunks={}), 'seasonal_budget', target_mb=target_mb)
+
+@profiled
+def read_gwtend(path, tem=None, levname="lev", prename="pre"):
+    """ zonal mean gravity wave tendencies from CESM history files, with the time at the
+    midpoint of time_bnds as for the TEM output (see readdata_utils.read_cesm_zonalmean).
+    Input: tem = optional TEM output to put the tendencies on the (prename, lat) grid of.
+                 They are interpolated linearly in log-pressure (see compare_utils) from
+                 the model levels levname, taken at their reference pressures (hPa) as for
+                 the TEM fluxes on model levels, and are NaN outside the levels of the file
+    Output: xarray.Dataset of the (time, levname, lat) variables, or (time, prename, lat) on
+            the TEM grid if tem is given
+    """
+    dat = read.read_cesm_zonalmean(path, None, None)
+    vertical = levname if (levname in dat.dims) else prename
+    dat = dat[[var for var in dat.data_vars if set(['time', vertical, 'lat']) <= set(dat[var].dims)]]
+    if (tem is None):
+        return dat
+    return xr.Dataset({var: compare.to_reference(dat[var], tem.lat, tem[prename], prename=vertical,
+                                                 refprename=prename)
+                       for var in dat.data_vars})
+
+def _time_tendency(darray):
+    """ d/dt in units per second.  For dask backed data every time chunk needs at least
+    two times for the gradient, so short chunks (e.g. the last one) are merged into their
+    neighbours first """
+    if (darray.chunks is not None):
+        chunks = []
+        for size in darray.chunks[darray.get_axis_num('time')]:
+            if chunks and ((size < 2) or (chunks[-1] < 2)):
+                chunks[-1] += size
+            else:
+                chunks.append(size)
+        darray = darray.chunk({'time': tuple(chunks)})
+    return darray.differentiate('time', datetime_unit='s')
+
+def _check_grid(tem, term, darray):
+    """ raise if darray isn't on the (vertical, lat) grid of the TEM terms """
+    dims = [dim for dim in tem.uzm.dims if dim != 'time']
+    extra = [dim for dim in darray.dims if dim not in tem.uzm.dims]
+    if extra:
+        raise ValueError(term+" has dimensions "+str(extra)+" that the TEM terms don't, the TEM "
+                         "terms are on "+str(dims))
+    for dim in dims:
+        if (dim not in darray.dims) or (darray[dim].size != tem[dim].size) or \
+           not np.allclose(darray[dim], tem[dim]):
+            raise ValueError(term+" isn't on the "+dim+" grid of the TEM terms, interpolate it first")
+
+@profiled
+def momentum_budget(tem, gwtend=None):
+    """ The terms of the TEM zonal momentum budget.
+    Input: tem = xarray.Dataset from tem_utils.calc_tem (or read_tem)
+           gwtend = optional xarray.Dataset (or dict) of parameterized zonal wind tendencies
+                    on the same grid e.g. {'UTGWORO': ..., 'UTGWSPEC': ..., 'BUTGWSPEC': ...}.
+                    Raises ValueError if they aren't on the lat and pressure grid of tem
+    Output: xarray.Dataset with uzm, the TEM terms, the gravity wave terms, dudt (the
+            tendency of uzm with time), forcing (utendepfd plus the gravity wave terms)
+            and residual (dudt minus the sum of all the terms), all in m/s2
+    """
+    gwtend = {} if (gwtend is None) else dict(gwtend)
+
+    budget = xr.Dataset({'uzm': tem.uzm})
+    for term in temterms:
+        budget[term] = tem[term]
+    for term in gwtend:
+        _check_grid(tem, term, gwtend[term])
+        budget[term] = gwtend[term]
+
+    budget['dudt'] = _time_tendency(tem.uzm)
+    budget['dudt'].attrs = {'long_name': 'tendency of zonal mean zonal wind', 'units': 'm/s2'}
+
+    budget['forcing'] = sum([budget[term] for term in ['utendepfd']+list(gwtend)])
+    budget['forcing'].attrs = {'long_name': 'resolved plus parameterized wave forcing', 'units': 'm/s2'}
+
+    budget['residual'] = budget['dudt'] - sum([budget[term] for term in temterms+list(gwtend)])
+    budget['residual'].attrs = {'long_name': 'residual of the TEM zonal momentum budget', 'units': 'm/s2'}
+
+    return budget
+
+@profiled
+def downward_control(forcing, uzm=None, prename="pre"):
+    """ Downward control estimate of the mass stream function from the wave forcing.
+    Input: forcing = (..., pre, lat) total wave forcing in m/s2, pressure in hPa
+           uzm = zonal mean zonal wind to include the meridional gradient of angular
+                 momentum in fhat.  If None, fhat = f
+           prename = name of the pressure coordinate
+    Output: psi_dc (..., pre, lat) in kg/s, with the same sign convention as psitem.
+            Not meaningful close to the equator where fhat goes to zero.
+    """
+    latrad = np.deg2rad(np.array(forcing.lat, dtype='float64'))
+    coslat = xr.DataArray(np.cos(latrad), dims=['lat'])
+    fhat = xr.DataArray(2.*om*np.sin(latrad), dims=['lat'])
+
+    if (uzm is not None):
+        ddphi = ops.gradient_matrix(latrad)
+        dudphi = xr.apply_ufunc(_along_last, uzm*coslat, kwargs={'op': ddphi},
+                                input_core_dims=[['lat']], output_core_dims=[['lat']],
+                                dask='parallelized', output_dtypes=[uzm.dtype])
+        fhat = fhat - dudphi/(a*coslat)
+
+    vstar = -1.*forcing/fhat
+
+    intp = ops.cumtrapz_matrix(np.array(forcing[prename], dtype='float64')*100.)
+    intv = xr.apply_ufunc(_along_last, vstar, kwargs={'op': intp},
+                          input_core_dims=[[prename]], output_core_dims=[[prename]],
+                          dask='parallelized', output_dtypes=['float64'])
+
+    psidc = (2.*np.pi*a*coslat/g0)*intv
+    psidc = psidc.transpose(*forcing.dims).rename('psi_dc')
+    psidc.attrs = {'long_name': 'downward control mass stream function', 'units': 'kg/s'}
+    return psidc
+
+@profiled
+def seasonal_budget(tem, gwtend=None, seasons=('DJF', 'MAM', 'JJA', 'SON'), prename="pre"):
+    """ Seasonal climatologies of the momentum budget terms, psitem and the downward
+    control stream function (calculated from the seasonal mean forcing and wind).
+    All the terms are computed together in one pass through the data.
+    Input: tem, gwtend = see momentum_budget
+           seasons = seasons to return
+    Output: xarray.Dataset (season, pre, lat)
+    """
+    budget = momentum_budget(tem, gwtend=gwtend)
+    budget['psitem'] = tem.psitem
+
+    clim = budget.groupby('time.season').mean('time').sel(season=list(seasons)).compute()
+    clim['psi_dc'] = downward_control(clim.forcing, uzm=clim.uzm, prename=prename)
+    return clim
+
+@profiled
+def seasonal_budget_experiments(paths, gwpaths=None, seasons=('DJF', 'MAM', 'JJA', 'SON'),
+                                prename="pre", layout='snapshot'):
+    """ seasonal_budget for a dictionary of experiments {expname: path to TEM output}
+    Input: gwpaths = optional {expname: path} of CESM history files with the gravity wave
+                     tendencies, read with read_gwtend and interpolated to the TEM grid
+    Output: xarray.Dataset with dimensions (exp, season, pre, lat)
+    """
+    clims = []
+    for iexp in paths:
+        tem = read_tem(paths[iexp], layout=layout)
+        gwtend = None
+        if (gwpaths is not None) and (iexp in gwpaths):
+            gwtend = read_gwtend(gwpaths[iexp], tem=tem, prename=prename)
+        clims.append(seasonal_budget(tem, gwtend=gwtend, seasons=seasons, prename=prename))
+
+    clims = xr.concat(clims, dim="exp", join="outer")
+    clims = clims.assign_coords(exp=list(paths))
+    return clims
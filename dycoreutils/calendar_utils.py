@@ -1,9 +1,15 @@
 ## routines for calculating seasonal climatology and seasonal timeseries
+## extra dimensions such as an ensemble member dimension are carried through
+import itertools
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 import xarray as xr
 import numpy as np
 from datetime import timedelta, datetime
 import pandas as pd
 from math import nan
+from dycoreutils.profile_utils import profiled
+from dycoreutils.precision_utils import get_precision
+from dycoreutils import stream_utils as stream
 
 dpm = {'noleap': [0, 31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31],
        '365_day': [0, 31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31],
@@ -36,6 +42,7 @@ def leap_year(year, calendar='standard'):
             leap = False
     return leap
 
+@profiled
 def get_days_per_mon(time, calendar='standard'):
     """
     return a array of days per month corresponding to the months provided in `months`
@@ -43,7 +50,7 @@ def get_days_per_mon(time, calendar='standard'):
     Args: time (CFTimeIndex): ie. ds.time.to_index()
           calendar (str): default 'standard'
     """
-    month_length = np.zeros(len(time), dtype=np.int)
+    month_length = np.zeros(len(time), dtype=int)
 
     cal_days = dpm[calendar]
 
@@ -54,29 +61,48 @@ def get_days_per_mon(time, calendar='standard'):
     return month_length
 
 
-def season_mean(ds, var=None, season = "all", cal = "none"):
+def _season_reduce(ds, season, dtype=None):
+    """ mean over time for each season (season="all") or for one season """
+    if season == "all":
+        return ds.groupby('time.season').mean('time', dtype=dtype)
+    return ds.where(ds['time.season'] == season).mean('time', dtype=dtype)
+
+@profiled
+def season_mean(ds, var=None, season = "all", cal = "none", dtype=None):
     """ calculate climatological mean by season
     Args: ds (xarray.Dataset): dataset
           var (str): variable to use
           season (str): "all", 'DJF', "MAM", "JJA", "SON"
           cal (str): "none"(default) or calendar used for weighting months by number of days
+          Other dimensions (e.g. member) are kept
+          dtype (str): precision of the floating point output (default from precision_utils,
+                       or the precision of the input if none is set).  The means are always
+                       accumulated in float64.  Other variables of a Dataset (e.g. time_bnds
+                       and date) are averaged without the month weights and keep their type
     """
-
     try:
         ds = ds[var]
     except:
         pass
 
+    if isinstance(ds, xr.Dataset):
+        floatvars = [ivar for ivar in ds.data_vars if np.issubdtype(ds[ivar].dtype, np.floating)]
+        others = [ivar for ivar in ds.data_vars if ivar not in floatvars]
+        if others:
+            smean = season_mean(ds[floatvars], season=season, cal=cal, dtype=dtype)
+            othermean = _season_reduce(ds[others], season)
+            for ivar in others:
+                smean[ivar] = othermean[ivar]
+            return smean[list(ds.data_vars)]
+        like = np.result_type(*[ds[ivar].dtype for ivar in floatvars]) if floatvars else None
+    else:
+        like = ds.dtype
+    dtype = get_precision(dtype, like=like)
+
     ## no weighting of months: 
     if cal == "none":
-        if season == "all":
-            ## calculate mean for all season
-            smean = ds.groupby('time.season').mean('time')
-        else :
-            ## calculate mean for specified season
-            smean = ds.where(ds['time.season'] == season).mean('time')
-
-        return smean
+        smean = _season_reduce(ds, season, dtype='float64')
+        return smean.astype(dtype)
     ## weighted months
     else:
         ## create array of month_length (number of days in each month)
@@ -85,16 +111,12 @@ def season_mean(ds, var=None, season = "all", cal = "none"):
                                  coords=[ds.time], name='month_length')
         ## Calculate the weights by grouping by 'time.season'
         weights = month_length.groupby('time.season') / month_length.groupby('time.season').sum()
+        weights = weights.astype(dtype)
 
-        if season == "all":
-            ## calculate weighted mean for all season
-            smean = (ds * weights).groupby('time.season').mean('time')
-        else :
-            ## calculate weighted mean for specified season
-            smean = (ds * weights).where(ds['time.season'] == season).mean('time')
-
-        return smean
+        smean = _season_reduce(ds * weights, season, dtype='float64')
+        return smean.astype(dtype)
 
+@profiled
 def season_ts(ds, var, season):
     """ calculate timeseries of seasonal averages
     Args: ds (xarray.Dataset): dataset
@@ -121,6 +143,28 @@ def season_ts(ds, var, season):
 #
     return ds_season
 
+@profiled
+def season_mask_daily(time, season):
+    """ boolean mask of the days that fall in season, leaving out the incomplete
+    DJF seasons at the start and end of the record in the same way as group_season_daily
+    Args: time (xarray.DataArray): the time coordinate
+          season (str): 'DJF', 'MAM', 'JJA', 'SON'
+    """
+    years = time.dt.year
+    months = time.dt.month
+    mask = (time.dt.season == season)
+
+    if (season == 'DJF'):
+        ybeg = np.array(years[0])
+        yend = np.array(years[len(years)-1])
+        if (np.array(months[0]) < 12):
+            mask = mask & ~((years == ybeg) & ((months == 1) | (months == 2)))
+        if (np.array(months[len(months)-1]) > 2):
+            mask = mask & ~((years == yend) & (months == 12))
+
+    return mask
+
+@profiled
 def group_season_daily(ds,  season):
     """ Group daily data in to seasons 
     """
@@ -162,7 +206,7 @@ def group_season_daily(ds,  season):
     outcoords = [('year', ybeg + np.arange(nyears)), ('day', np.arange(dpseas[season]))]
     for icoord in range(1,len(dims)):
         dimout.append(dims[icoord])
-        outcoords.append( (dims[icoord], ds[dims[icoord]]))
+        outcoords.append( (dims[icoord], np.array(ds[dims[icoord]])))
 
     # check you have an integer number of years
     if (nyears == int(nyears)):
@@ -184,6 +228,7 @@ def group_season_daily(ds,  season):
 
     return datout 
 
+@profiled
 def fracofyear2date(time, caltype='standard'):
     """Convert a time series that is in terms of fractions of a year
     """
@@ -200,18 +245,57 @@ def fracofyear2date(time, caltype='standard'):
     #date = d + d1
     return date 
 
+@profiled
 def date2fracofyear_monthly(date, caltype='365_day'):
     """Convert a date time series to a timeseries of the fractions of a year
     only works for monthly data
     """
-    dayspermon = dpm[caltype]
-    year = date.dt.year
+    dayspermon = np.array(dpm[caltype])
+    year = np.array(date.dt.year)
     month = np.array(date.dt.month).astype(int)
-    dayofyear = [ (np.sum(dayspermon[0:i]) + dayspermon[i]/2.) for i in month] 
-    time = [ np.array(year[i]) + (dayofyear[i]/365.) for i in np.arange(0,year.size,1)]
+    # days before the start of each month plus half the month
+    dayofyear = np.cumsum(dayspermon)[month-1] + dayspermon[month]/2.
+    time = year + (dayofyear/365.)
     return time
 
-
-
-
-
+def _open_member(path):
+    return xr.open_mfdataset(path, coords="minimal", join="override", decode_times=True)
+
+@profiled
+def ensemble_reduce(members, reduce, opener=None, nthreads=4, ddof=1):
+    """ Ensemble mean and spread of a reduction of each member (e.g. season_mean), with
+    nthreads members opened and reduced at once in threads.  The results are combined
+    with a streaming accumulator as they finish, so at most nthreads members are in
+    memory at any time.
+    Args: members (dict or list) = paths or globs of the members, {name: path} or [path, ...]
+          reduce (function) = xarray.Dataset of one member -> xarray.DataArray e.g.
+                              lambda ds: season_mean(ds, "U", cal="noleap")
+          opener (function) = path -> xarray.Dataset, default open_mfdataset
+          nthreads (int) = number of members processed at once
+          ddof (int) = delta degrees of freedom of the spread, 1 for the sample std
+    Output: xarray.Dataset of mean, std (the spread), var and count over the members
+    """
+    opener = _open_member if (opener is None) else opener
+    paths = list(members.values()) if isinstance(members, dict) else list(members)
+
+    def _reduce_member(path):
+        ds = opener(path)
+        try:
+            return reduce(ds).load()
+        finally:
+            ds.close()
+
+    acc = stream.Accumulator()
+    with ThreadPoolExecutor(max_workers=nthreads) as pool:
+        remaining = iter(paths)
+        running = {pool.submit(_reduce_member, path) for path in itertools.islice(remaining, nthreads)}
+        while running:
+            done, running = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                acc.update(future.result())
+                # start the next member in place of the one that finished
+                path = next(remaining, None)
+                if (path is not None):
+                    running.add(pool.submit(_reduce_member, path))
+
+    return acc.result(ddof=ddof)
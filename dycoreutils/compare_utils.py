@@ -0,0 +1,114 @@
+# Model vs reference (e.g. ERA5) comparisons of zonal mean (lat, pressure) fields.
+#
+# Each model grid (lev, lat) is interpolated to the reference grid (pre, lat), linearly
+# in log-pressure and latitude, with a 2-D sparse weight matrix (the Kronecker product
+# of the 1-D interpolation matrices from operator_utils).  The weights only depend on
+# the two grids so they are built once and cached: every variable, time chunk and
+# experiment on the same grid reuses them, and interpolating is one sparse matmul over
+# all the other dimensions at once.  bias_fields does all the experiments together,
+# stacking those that share a grid into a single matmul.
+#
+# Points of the reference grid outside the model grid (e.g. pressures below the lowest
+# model level) are NaN, as with xarray's interp.
+
+from functools import lru_cache
+
+import numpy as np
+import xarray as xr
+
+from dycoreutils import operator_utils as ops
+from dycoreutils.profile_utils import profiled
+
+@lru_cache(maxsize=32)
+def _interp_weights(grids):
+    from scipy import sparse
+
+    srclat, srcpre, dstlat, dstpre = [np.frombuffer(grid) for grid in grids]
+    prematrix, preinside = ops.interp_matrix(np.log(srcpre), np.log(dstpre))
+    latmatrix, latinside = ops.interp_matrix(srclat, dstlat)
+    weights = sparse.kron(prematrix, latmatrix, format='csr')
+    inside = (preinside[:,None] & latinside[None,:]).ravel()
+    return weights, inside
+
+@profiled
+def interp_weights(srclat, srcpre, dstlat, dstpre):
+    """ 2-D (pressure, lat) interpolation weights from one grid to another, linear in
+    log-pressure and latitude, cached on the grids.
+    Output: weights = sparse matrix (ndstpre*ndstlat, nsrcpre*nsrclat) that interpolates
+                      (pre, lat) fields flattened in C order
+            inside = boolean (ndstpre*ndstlat), False for destination points outside the
+                     source grid (where the interpolated values should be NaN)
+    """
+    grids = tuple(np.ascontiguousarray(grid, dtype='float64').tobytes()
+                  for grid in [srclat, srcpre, dstlat, dstpre])
+    return _interp_weights(grids)
+
+def _apply_weights(arr, weights, inside, shape, nblock=32):
+    """ interpolate the last two axes of arr to shape with the weights.  The sparse matmul
+    wants the grid first, so the fields are transposed nblock at a time, which keeps the
+    copies in cache (transposing everything at once takes ~10x as long as the matmul)
+    """
+    flat = arr.reshape(-1, arr.shape[-2]*arr.shape[-1])
+    out = np.empty((flat.shape[0], weights.shape[0]), dtype='float64')
+    for i in range(0, flat.shape[0], nblock):
+        out[i:i+nblock] = (weights @ np.ascontiguousarray(flat[i:i+nblock].T)).T
+    out[:, ~inside] = np.nan
+    return out.reshape(arr.shape[:-2]+shape)
+
+@profiled
+def to_reference(darray, reflat, refpre, prename="lev", refprename="pre"):
+    """ Interpolate zonal mean data (..., prename, lat) to a reference (refpre, reflat) grid.
+    Input: darray = xarray.DataArray, can be dask backed (each chunk is interpolated
+                    separately, so lev and lat each need to be in a single chunk)
+           reflat, refpre = latitudes and pressures (same units as darray[prename]) of
+                            the reference grid
+    Output: xarray.DataArray (..., refprename, lat)
+    """
+    reflat = np.asarray(reflat, dtype='float64')
+    refpre = np.asarray(refpre, dtype='float64')
+    weights, inside = interp_weights(darray.lat, darray[prename], reflat, refpre)
+
+    interp = xr.apply_ufunc(_apply_weights, darray,
+                            kwargs={'weights': weights, 'inside': inside, 'shape': (refpre.size, reflat.size)},
+                            input_core_dims=[[prename, 'lat']], output_core_dims=[['_refpre', '_reflat']],
+                            dask='parallelized', output_dtypes=['float64'],
+                            dask_gufunc_kwargs={'output_sizes': {'_refpre': refpre.size, '_reflat': reflat.size}})
+
+    interp = interp.rename({'_refpre': refprename, '_reflat': 'lat'})
+    return interp.assign_coords({refprename: refpre, 'lat': reflat})
+
+@profiled
+def bias_fields(experiments, reference, prename="lev", refprename="pre"):
+    """ Model minus reference on the reference grid for a set of experiments at once.
+    Experiments on the same (lev, lat) grid, with the same shape, are interpolated
+    together in one matmul.
+    Input: experiments = {expname: xarray.DataArray (..., prename, lat)}, e.g. climatologies
+                         with a season dimension.  Their other coordinates (e.g. season
+                         or time) have to be the same, and the same as the reference's
+           reference = xarray.DataArray (..., refprename, lat), e.g. the ERA5 climatology
+    Output: xarray.DataArray (exp, ..., refprename, lat)
+    Raises ValueError if the coordinates away from the (pressure, lat) grids differ
+    """
+    groups = {}
+    for iexp in experiments:
+        dat = experiments[iexp].transpose(..., prename, 'lat')
+        key = (np.asarray(dat[prename]).tobytes(), np.asarray(dat.lat).tobytes(), dat.shape)
+        groups.setdefault(key, []).append(iexp)
+
+    onref = {}
+    for names in groups.values():
+        stacked = xr.concat([experiments[iexp].transpose(..., prename, 'lat') for iexp in names], dim='exp',
+                            coords='minimal', compat='override', join='exact')
+        interp = to_reference(stacked, reference.lat, reference[refprename], prename=prename,
+                              refprename=refprename)
+        for i, iexp in enumerate(names):
+            onref[iexp] = interp.isel(exp=i, drop=True)
+
+    model = xr.concat([onref[iexp] for iexp in experiments], dim='exp', coords='minimal',
+                      compat='override', join='exact')
+    model = model.assign_coords(exp=list(experiments))
+    reference = reference.transpose(..., refprename, 'lat').drop_vars(['lat', refprename])
+    model, reference = xr.align(model, reference, join='exact')
+    bias = model - reference
+    bias.attrs = dict(experiments[list(experiments)[0]].attrs)
+    return bias
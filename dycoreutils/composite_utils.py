@@ -0,0 +1,86 @@
+# routines for lag composites around events, e.g. the SSW central dates from ssw_utils.ssw_cp
+
+import xarray as xr
+import numpy as np
+
+from dycoreutils import resample_utils as resample
+from dycoreutils.profile_utils import profiled
+
+@profiled
+def event_indices(time, dates):
+    """ convert event dates to integer indices on the time axis
+    Args: time (xarray.DataArray) = the time coordinate
+          dates = list of event dates, either 0-d DataArrays (as returned by ssw_cp)
+                  or datetime/cftime objects
+    """
+    dates = [date.values.item() if hasattr(date, 'values') else date for date in dates]
+    index = time.to_index()
+    if np.issubdtype(index.dtype, np.datetime64):
+        dates = np.array(dates, dtype='datetime64[ns]')
+    ievent = index.get_indexer(dates)
+    if (ievent < 0).any():
+        raise ValueError("event dates not on the time axis: "+str(np.array(dates)[ievent < 0]))
+    return ievent
+
+@profiled
+def lag_composite(darray, dates, lagmin=-30, lagmax=60):
+    """ Gather lagged windows around every event in one vectorized selection.
+    Input: darray = data with a time dimension (can be dask backed, stays lazy)
+           dates = event dates (see event_indices)
+           lagmin, lagmax = window in time steps relative to the event date
+    Output: (event, lag, ...) array.  Lags that fall off either end of the
+            record are NaN.
+    """
+    ievent = event_indices(darray.time, dates)
+    lags = np.arange(lagmin, lagmax+1)
+
+    # (event, lag) matrix of time indices
+    itime = ievent[:,None] + lags[None,:]
+    valid = (itime >= 0) & (itime < darray.time.size)
+    itime = np.clip(itime, 0, darray.time.size-1)
+
+    comp = darray.isel(time=xr.DataArray(itime, dims=['event', 'lag']))
+    comp = comp.rename({'time': 'eventtime'}) if 'time' in comp.coords else comp
+    comp = comp.where(xr.DataArray(valid, dims=['event', 'lag']))
+    comp = comp.assign_coords(lag=lags, eventdate=('event', darray.time.values[ievent]))
+
+    return comp
+
+# (nboot, nevent) resample counts, defined once in resample_utils
+bootstrap_weights = resample.resample_weights
+
+def _boot_quantiles(dat, weights, quantiles):
+    """ quantiles of the resampled means of (..., event) data """
+    bootmeans = resample.weighted_means(dat, weights)
+    return np.moveaxis(np.nanquantile(bootmeans, quantiles, axis=-1), 0, -1)
+
+@profiled
+def bootstrap_composite(comp, nboot=1000, siglevel=0.05, seed=0):
+    """ Bootstrap significance of the composite mean by resampling events with replacement.
+    All nboot resamples are drawn at once and applied to the data with one matmul
+    (see resample_utils).
+    Works chunk by chunk for dask backed composites.
+    Input: comp = (event, ...) composite from lag_composite
+           nboot = number of resamples
+           siglevel = two sided significance level
+           seed = random number seed
+    Output: xarray.Dataset with the composite mean, the lower and upper bounds of the
+            bootstrap confidence interval and a mask that is True where the interval excludes zero
+    """
+    weights = resample.resample_weights(comp.event.size, nboot=nboot, seed=seed)
+    quantiles = [siglevel/2., 1.-siglevel/2.]
+
+    if comp.chunks is not None:
+        comp = comp.chunk({'event': -1})
+
+    bounds = xr.apply_ufunc(_boot_quantiles, comp, kwargs={'weights': weights, 'quantiles': quantiles},
+                            input_core_dims=[['event']], output_core_dims=[['quantile']],
+                            dask='parallelized', output_dtypes=[float],
+                            dask_gufunc_kwargs={'output_sizes': {'quantile': 2}})
+    lower = bounds.isel(quantile=0, drop=True)
+    upper = bounds.isel(quantile=1, drop=True)
+
+    boot = xr.Dataset({'mean': comp.mean('event'), 'lower': lower, 'upper': upper,
+                       'sig': (lower > 0) | (upper < 0)})
+
+    return boot
@@ -0,0 +1,126 @@
+# dask scheduler and chunking helpers.
+#
+# get_client() starts a dask.distributed cluster the first time it is called and
+# returns the same client afterwards.  By default this is a LocalCluster.  To use a
+# batch system instead set DYCOREUTILS_CLUSTER (or pass cluster=) to one of the
+# dask_jobqueue cluster types ('pbs', 'slurm', ...).  The queue, account, cores and
+# memory of the jobs then come from the usual dask_jobqueue configuration
+# (~/.config/dask/jobqueue.yaml) or keyword arguments.
+#
+# The routines in dycoreutils need different chunking for dask backed data:
+#     'time'   chunked in time with the whole (pre, lat) grid in each chunk, for
+#              calculations done independently at each time e.g. tem_utils.calc_tem,
+#              or that stream through the time axis e.g. pdf_utils.point_pdfs (which
+#              reads tchunk days at a time)
+#     'column' the whole time axis in each chunk, chunked over the other dimensions,
+#              for calculations along time e.g. filter_utils.calc_season_nharm,
+#              variability_utils, resample_utils
+# heuristics says which one each routine wants and rechunk/open_mfdataset apply it.
+
+import os
+
+import numpy as np
+import xarray as xr
+from dycoreutils.profile_utils import profiled
+
+heuristics = {'calc_tem': 'time',
+              'calc_season_nharm': 'column',
+              'deseasonalize_daily': 'column',
+              'annular_mode_index': 'column',
+              'autocorrelation': 'column',
+              'point_pdfs': 'time',
+              'seasonal_budget': 'time',
+              'bootstrap_diff': 'column'}
+
+_client = [None]
+
+@profiled
+def get_client(cluster=None, nworkers=None, **kwargs):
+    """ Start a dask cluster and client, or return the one already running.
+    Args: cluster = 'local' or a dask_jobqueue cluster type ('pbs', 'slurm', 'lsf', 'sge',
+                    'htcondor', 'moab', 'oar').  Default DYCOREUTILS_CLUSTER or 'local'
+          nworkers = number of workers (local) or jobs (jobqueue).  Default: one worker
+                     per 4 cores for a LocalCluster, 1 job for jobqueue
+          kwargs = passed to the cluster e.g. memory_limit, threads_per_worker, queue, walltime
+    """
+    from dask.distributed import Client, LocalCluster
+
+    client = _client[0]
+    if (client is not None) and (client.status == 'running'):
+        return client
+
+    cluster = os.environ.get('DYCOREUTILS_CLUSTER', 'local') if (cluster is None) else cluster
+    if (cluster == 'local'):
+        if (nworkers is None):
+            nworkers = max(1, (os.cpu_count() or 1)//4)
+        kwargs.setdefault('threads_per_worker', max(1, (os.cpu_count() or 1)//nworkers))
+        clusterobj = LocalCluster(n_workers=nworkers, **kwargs)
+    else:
+        import dask_jobqueue
+        clustertypes = {name.lower().replace('cluster', ''): getattr(dask_jobqueue, name)
+                        for name in dir(dask_jobqueue) if name.endswith('Cluster') and name != 'JobQueueCluster'}
+        if cluster not in clustertypes:
+            raise ValueError("unknown cluster "+str(cluster)+", use 'local' or one of "+str(sorted(clustertypes)))
+        clusterobj = clustertypes[cluster](**kwargs)
+        clusterobj.scale(jobs=1 if (nworkers is None) else nworkers)
+
+    _client[0] = Client(clusterobj)
+    return _client[0]
+
+def close_client():
+    """ shut down the client and cluster started by get_client """
+    client = _client[0]
+    if (client is not None):
+        cluster = client.cluster
+        client.close()
+        if (cluster is not None):
+            cluster.close()
+    _client[0] = None
+
+def _itemsize(dat):
+    if isinstance(dat, xr.Dataset):
+        return sum(dat[var].dtype.itemsize for var in dat.data_vars)
+    return dat.dtype.itemsize
+
+def chunk_sizes(dat, kind, target_mb=128, timedim='time'):
+    """ chunk sizes for dat for one of the kinds of chunking (see heuristics)
+    Args: dat = xarray.DataArray or Dataset
+          kind = 'time' or 'column', or the name of a routine in heuristics
+          target_mb = approximate size of each chunk in MB (summed over the variables of a Dataset)
+    """
+    kind = heuristics.get(kind, kind)
+    if kind not in ['time', 'column']:
+        raise ValueError("unknown chunking "+str(kind)+", use 'time', 'column' or one of "+str(sorted(heuristics)))
+
+    target = target_mb*1e6/_itemsize(dat)
+    otherdims = [dim for dim in dat.dims if dim != timedim]
+    ncolumn = int(np.prod([dat.sizes[dim] for dim in otherdims]))
+
+    if (kind == 'time'):
+        chunks = {dim: -1 for dim in otherdims}
+        if timedim in dat.dims:
+            chunks[timedim] = int(min(dat.sizes[timedim], max(1, target//ncolumn)))
+        return chunks
+
+    # column: split the non-time dimensions, the outermost first, until the chunks are small enough
+    chunks = {timedim: -1} if timedim in dat.dims else {}
+    ncols = max(1, target//dat.sizes.get(timedim, 1))
+    for dim in otherdims:
+        inner = int(np.prod([dat.sizes[d] for d in otherdims[otherdims.index(dim)+1:]]))
+        chunks[dim] = int(min(dat.sizes[dim], max(1, ncols//inner)))
+    return chunks
+
+@profiled
+def rechunk(dat, kind, target_mb=128, timedim='time'):
+    """ rechunk dat (lazily) with the chunking for kind (see chunk_sizes) """
+    return dat.chunk(chunk_sizes(dat, kind, target_mb=target_mb, timedim=timedim))
+
+@profiled
+def open_mfdataset(filepath, kind='time', target_mb=128, **kwargs):
+    """ open_mfdataset with the chunking for kind (see chunk_sizes) instead of one chunk
+    per file.  Defaults to coords="minimal", join="override" as elsewhere in dycoreutils.
+    """
+    kwargs.setdefault('coords', 'minimal')
+    kwargs.setdefault('join', 'override')
+    dat = xr.open_mfdataset(filepath, **kwargs)
+    return rechunk(dat, kind, target_mb=target_mb)
@@ -1,23 +1,37 @@
 import numpy as np
-from scipy.fft import fft, ifft
 import xarray as xr
 import sys
+from dycoreutils.profile_utils import profiled
+from dycoreutils.precision_utils import get_precision
 
-def calc_season_nharm(darray, nharms, dimtime=0):
+@profiled
+def calc_season_nharm(darray, nharms, dimtime=0, dtype=None):
     """ calculate the seasonal cycle defined as the first n-harmonics of the annual 
         time series.  Assumes the first dimension is time unless specified
 
     Input: darray = a data array 
-    output: seascycle = the seasonal cycle
+           dtype = precision to compute in (default from precision_utils, or the
+                   precision of darray if none is set).  The time mean is taken out
+                   in float64 before the fft so float32 is ok for long records
+    output: seascycle = the seasonal cycle.  For dask backed input this is calculated
+            chunk by chunk (with time in a single chunk) when it's computed
     !!!! Not totally confident this works for arrays with >2 dimensions at this point!!!
 
     """
+    from scipy.fft import fft, ifft
+
+    dtype = get_precision(dtype, like=darray.dtype)
+    if darray.chunks is not None:
+        darray = darray.chunk({darray.dims[dimtime]: -1})
+        return xr.map_blocks(calc_season_nharm, darray, args=[nharms], kwargs={'dimtime': dimtime, 'dtype': dtype},
+                             template=darray.astype(dtype))
+
     # get the dimensions of the input array
     dims = darray.dims
 
 
     # convert to a numpy array
-    darray_np = np.array(darray)
+    darray_np = np.array(darray, dtype=dtype)
 
     # reorder the axes if dimtime != 0
     if (dimtime != 0):
@@ -52,6 +66,10 @@ def calc_season_nharm(darray, nharms, dimtime=0):
             darray_np[:] = np.interp(i,i[mask],darray_np[mask])
 
 
+    # remove the time mean (accumulated in float64) so that the fft only sees the anomalies
+    tmean = np.mean(darray_np, axis=0, dtype='float64')
+    darray_np = darray_np - tmean.astype(dtype)
+
     tempft = fft(darray_np, axis=0)
     tempft2 = np.zeros_like(tempft)
 #    tempft2[0:nharms,:] = tempft[0:nharms,:]
@@ -61,7 +79,7 @@ def calc_season_nharm(darray, nharms, dimtime=0):
 
 
 
-    darray_filtered = np.real(ifft(tempft2, axis=0))
+    darray_filtered = np.real(ifft(tempft2, axis=0)) + tmean.astype(dtype)
 
     # reshape array to expand dimensions out again
     darray_filtered = darray_filtered.reshape(shapein)
@@ -0,0 +1,143 @@
+# Finite difference and integration operators on (pre, lat) grids as sparse matrices.
+#
+# The operators only depend on the grid, so they are built once and cached on the
+# coordinate values (as float64, so equal grids share operators whatever their dtype or
+# byte order): every variable, time chunk and experiment on the same grid (mid levels or
+# ilev interfaces) reuses them.  Applying an operator is one sparse matmul
+# over all the other dimensions at once.  Derivatives use the same stencil as
+# np.gradient (edge_order=1) so the results match the np.gradient based code.
+
+from functools import lru_cache
+
+import numpy as np
+from dycoreutils.profile_utils import profiled
+
+# for log-pressure height
+p0=101325.
+H=7000.
+
+def gradient_coefs(x):
+    """ np.gradient (edge_order=1) along a coordinate x as a 3 point stencil:
+    df/dx[i] = sum_n coef[i,n]*f[idx[i,n]]
+    Output: idx (len(x), 3) ints, coef (len(x), 3) in the dtype of x
+    """
+    n = x.size
+    dx = np.diff(x)
+    idx = np.stack([np.arange(n)-1, np.arange(n), np.arange(n)+1], axis=1)
+    coef = np.zeros((n, 3), dtype=x.dtype)
+
+    # second order accurate centered differences on the non-uniform grid
+    dx1 = dx[0:n-2]
+    dx2 = dx[1:n-1]
+    coef[1:n-1,0] = -dx2/(dx1*(dx1 + dx2))
+    coef[1:n-1,1] = (dx2 - dx1)/(dx1*dx2)
+    coef[1:n-1,2] = dx1/(dx2*(dx1 + dx2))
+
+    # one sided first order differences at the ends
+    idx[0] = [0, 0, 1]
+    coef[0] = [0., -1./dx[0], 1./dx[0]]
+    idx[n-1] = [n-2, n-1, n-1]
+    coef[n-1] = [-1./dx[n-2], 1./dx[n-2], 0.]
+
+    return idx, coef
+
+def _key(x):
+    """ cache key for the coordinate x: its values as native float64 bytes """
+    return np.ascontiguousarray(x, dtype='float64').tobytes()
+
+@lru_cache(maxsize=64)
+def _gradient_matrix(xbytes, dtype):
+    from scipy import sparse
+
+    if (dtype != 'float64'):
+        # the same operator, only stored in lower precision
+        return _gradient_matrix(xbytes, 'float64').astype(dtype)
+
+    x = np.frombuffer(xbytes, dtype='float64')
+    idx, coef = gradient_coefs(x)
+    rows = np.repeat(np.arange(x.size), 3)
+    # the zero end coefficients are summed into an existing entry
+    return sparse.csr_matrix((coef.ravel(), (rows, idx.ravel())), shape=(x.size, x.size))
+
+@profiled
+def gradient_matrix(x):
+    """ (n, n) sparse matrix D such that D @ f = np.gradient(f, x), cached on the values of x.
+    Float32 for a float32 x, otherwise float64.  The matrix is shared between callers so
+    don't modify it.
+    """
+    x = np.asarray(x)
+    single = (x.dtype.kind == 'f') and (x.dtype.itemsize == 4)
+    return _gradient_matrix(_key(x), 'float32' if single else 'float64')
+
+@lru_cache(maxsize=64)
+def _cumtrapz_matrix(xbytes, x0):
+    from scipy import sparse
+
+    x = np.frombuffer(xbytes, dtype='float64')
+    # widths of the intervals from x0 (where the integrand is taken to be 0) down to each x
+    dx = np.diff(np.concatenate(([x0], x)))
+    # the integrand at x[j] gets half of the interval above it and half of the one below it
+    weights = 0.5*(dx + np.concatenate((dx[1:], [0.])))
+    lower = np.tril(np.tile(weights, (x.size, 1)), k=-1)
+    lower[np.diag_indices(x.size)] = 0.5*dx
+    return sparse.csr_matrix(lower)
+
+@profiled
+def cumtrapz_matrix(x, x0=0.):
+    """ (n, n) sparse lower triangular matrix I such that I @ v is the cumulative trapezoidal
+    integral of v along x, starting from x0 where v is taken to be zero, i.e. the same as
+    cumulative_trapezoid(concatenate(([0], v)), concatenate(([x0], x))).  e.g. the integral
+    from the model top (pre=0) down for the TEM stream function.  Always float64 so
+    that the sums are accumulated in double precision.  Cached on the values of x.
+    """
+    return _cumtrapz_matrix(_key(x), float(x0))
+
+@lru_cache(maxsize=64)
+def _interp_matrix(xbytes, xnewbytes):
+    from scipy import sparse
+
+    x = np.frombuffer(xbytes, dtype='float64')
+    xnew = np.frombuffer(xnewbytes, dtype='float64')
+    order = np.argsort(x)
+    xsort = x[order]
+
+    # interval [xsort[i], xsort[i+1]] containing each new point, NaN outside the range
+    i = np.clip(np.searchsorted(xsort, xnew, side='right') - 1, 0, x.size-2)
+    frac = (xnew - xsort[i])/(xsort[i+1] - xsort[i])
+    inside = (xnew >= xsort[0]) & (xnew <= xsort[-1])
+
+    rows = np.repeat(np.arange(xnew.size)[inside], 2)
+    cols = order[np.stack([i, i+1], axis=1)[inside]].ravel()
+    vals = np.stack([1. - frac, frac], axis=1)[inside].ravel()
+    matrix = sparse.csr_matrix((vals, (rows, cols)), shape=(xnew.size, x.size))
+    return matrix, inside
+
+@profiled
+def interp_matrix(x, xnew):
+    """ (len(xnew), len(x)) sparse matrix L such that L @ f is f(x) linearly interpolated
+    to xnew, as np.interp but for x in any order.  Also returns the boolean array of
+    the xnew inside the range of x (the rows of L outside it are empty, the values there
+    should be set to NaN).  Cached on the values of x and xnew, so don't modify the output.
+    """
+    return _interp_matrix(_key(x), _key(xnew))
+
+@profiled
+def apply_operator(op, arr, axis):
+    """ apply an (m, n) operator matrix along an axis of arr (of length n) in one matmul
+    over all the other dimensions.  The output has the dtype of op and arr combined.
+    """
+    axis = axis % arr.ndim
+    if (axis == arr.ndim-1):
+        # the axis is contiguous, multiply from the right
+        out = np.asarray(arr.reshape(-1, arr.shape[-1]) @ op.T)
+        return out.reshape(arr.shape[:-1]+(op.shape[0],))
+
+    moved = np.moveaxis(arr, axis, 0)
+    out = np.asarray(op @ moved.reshape(moved.shape[0], -1))
+    return np.moveaxis(out.reshape((op.shape[0],)+moved.shape[1:]), 0, axis)
+
+def logp_height(pre):
+    """ log-pressure height H*ln(p0/p) in m for pressure in hPa, the vertical coordinate
+    that epfz and wtem are scaled to
+    """
+    return H*np.log(p0/(np.asarray(pre, dtype='float64')*100.))
@@ -0,0 +1,83 @@
+# routines for calculating PDFs (histograms) of daily data at many points at once
+
+import xarray as xr
+import numpy as np
+
+from dycoreutils import calendar_utils as cal
+from dycoreutils.profile_utils import profiled
+
+@profiled
+def point_pdfs(darray, lats, pres, binmin, binmax, binint, seasons=("DJF",), scale=None, tchunk=3650):
+    """ Calculate PDFs of daily data for many (lat, pre) points and seasons in one pass.
+    The points are picked out with a single nearest neighbour selection, then the data
+    are read in blocks of tchunk days (so dask backed data are only computed a block at
+    a time) and the bin counts for every season and point are accumulated with one bincount.
+    The bins and normalization are the same as plotposneghisto.
+    Args: darray (xarray.DataArray): daily data with time, lat and pre dimensions
+          lats, pres (lists): latitudes and pressures of the points
+          binmin, binmax, binint: bins are np.arange(binmin, binmax, binint)
+          seasons (tuple): seasons to calculate PDFs for ('DJF', 'MAM', 'JJA', 'SON')
+          scale (list): optional factor to divide the data by at each point
+          tchunk (int): number of days read at once
+    Output: pdfs (xarray.DataArray): percentage of days in each bin (season, point, bin).
+            The bin coordinate is the left bin edge.
+    """
+    binedges = np.arange(binmin, binmax, binint)
+    nbins = binedges.size - 1
+    npoints = len(lats)
+    nseas = len(seasons)
+
+    points = darray.sel(lat=xr.DataArray(lats, dims="point"), pre=xr.DataArray(pres, dims="point"),
+                        method="nearest").transpose("time", "point")
+
+    if (scale is None):
+        scale = np.ones(npoints)
+    scale = np.array(scale, dtype='float64')
+
+    # season index of each day (-1 = not used)
+    seasidx = np.full(points.time.size, -1)
+    for iseas, season in enumerate(seasons):
+        seasidx[np.array(cal.season_mask_daily(points.time, season))] = iseas
+    ndays = np.array([np.count_nonzero(seasidx == iseas) for iseas in range(nseas)])
+
+    counts = np.zeros(nseas*npoints*nbins, dtype='int64')
+    pointidx = np.arange(npoints)
+    for tbeg in range(0, points.time.size, tchunk):
+        seasblock = seasidx[tbeg:tbeg+tchunk]
+        use = seasblock >= 0
+        if not use.any():
+            continue
+        block = np.array(points.isel(time=slice(tbeg, tbeg+tchunk)))[use] / scale
+
+        # same bin edges as np.histogram: left closed, except the last bin which is closed
+        binidx = np.searchsorted(binedges, block, side="right") - 1
+        binidx[block == binedges[-1]] = nbins - 1
+        valid = (binidx >= 0) & (binidx < nbins)
+
+        flatidx = (seasblock[use][:,None]*npoints + pointidx[None,:])*nbins + binidx
+        counts += np.bincount(flatidx[valid], minlength=counts.size)
+
+    pdfs = counts.reshape(nseas, npoints, nbins) / ndays[:,None,None] * 100.
+
+    pdfs = xr.DataArray(pdfs, dims=["season", "point", "bin"],
+                        coords={"season": list(seasons), "bin": binedges[0:nbins],
+                                "lat": ("point", np.array(points.lat)),
+                                "pre": ("point", np.array(points.pre))},
+                        name="pdf", attrs={"units": "%", "binint": binint})
+
+    return pdfs
+
+@profiled
+def point_pdfs_experiments(dats, lats, pres, binmin, binmax, binint, seasons=("DJF",), scale=None, tchunk=3650):
+    """ Run point_pdfs for a dictionary of experiments {expname: darray}.
+    Output: pdfs (xarray.DataArray) with dimensions (exp, season, point, bin)
+    """
+    pdfs = []
+    for iexp in dats:
+        pdfs.append(point_pdfs(dats[iexp], lats, pres, binmin, binmax, binint, seasons=seasons,
+                               scale=scale, tchunk=tchunk))
+
+    pdfs = xr.concat(pdfs, dim="exp")
+    pdfs["exp"] = list(dats.keys())
+
+    return pdfs
@@ -1,6 +1,7 @@
 import matplotlib.pyplot as plt
 import numpy as np
 from dycoreutils import colormap_utils as mycolors
+from functools import lru_cache
 import sys
 
 def get3by3coords():
@@ -21,215 +22,219 @@ def get4by4coords():
  
     return x1, x2, y1, y2
 
-def plotlatlinearp(fig, data, lat, pre, ci, cmin, cmax, titlestr, x1=0.1, x2=0.9, y1=0.1, y2=0.9, cmap='blue2red'):
-    """
-    Plot a pressure versus latitude contour plot up to 0.01hPa.
+@lru_cache(maxsize=None)
+def get_clevs_cmap(ci, cmin, cmax, cmap='blue2red'):
+    """ contour levels and color map for a contour interval and range.
+    Cached on (ci, cmin, cmax, cmap) so that all the panels of a figure share
+    the same levels and colormap.  The returned levels are read only.
     """
-
-
-    # set up contour levels and color map
     nlevs = (cmax-cmin)/ci + 1
     clevs = np.arange(cmin, cmax+ci, ci)
+    clevs.flags.writeable = False
+
+    return clevs, get_cmap(nlevs, cmap)
 
+@lru_cache(maxsize=None)
+def get_cmap(nlevs, cmap='blue2red'):
+    """ cached color map with nlevs contour levels (blue2red or precip) """
     if (cmap == 'blue2red'):
         mymap = mycolors.blue2red_cmap(nlevs)
-
-    if (cmap == 'precip'):
+    elif (cmap == 'precip'):
         mymap = mycolors.precip_cmap(nlevs)
+    else:
+        raise ValueError("unknown cmap "+str(cmap)+", use blue2red or precip")
 
+    return mymap
 
+@lru_cache(maxsize=32)
+def _logpre(prebytes, shape):
+    logpre = -1.*np.log10(np.frombuffer(prebytes).reshape(shape))
+    logpre.flags.writeable = False
+    return logpre
 
+def get_logpre(pre):
+    """ -log10(pre) for the vertical axis, cached on the pressure values """
+    pre = np.ascontiguousarray(pre, dtype='float64')
+    return _logpre(pre.tobytes(), pre.shape)
 
-    plt.rcParams['font.size'] = '12'
-    
-    ax = fig.add_axes([x1, y1, x2-x1, y2-y1])
-
-    ax.contourf(lat,-1*pre, data, levels=clevs, cmap=mymap, extend='max')
-    ax.contour(lat,-1*pre, data, levels=clevs[ clevs != 0], colors='black', linewidths=0.5)
-    ax.set_ylim(-1000.,-np.log10(10))
-    ax.set_yticks([-1000,-800,-600,-400,-200,0])
-    ax.set_yticklabels(['1000','800','600','400','200','0'])
-    ax.set_ylabel('Pressure (hPa)')
-    ax.set_title(titlestr, fontsize=16)
-    ax.set_xlabel('Latitude $^{\circ}$N')
-
-    return ax
-
-
-
-
-def plotlatlogpre_to10(fig, data, lat, pre, ci, cmin, cmax, titlestr, x1=0.1, x2=0.9, y1=0.1, y2=0.9):
+def plotpanels(fig, datalist, lat, pre, ci, cmin, cmax, titles, plotfunc=None, coords=None, **kwargs):
     """
-    Plot a pressure versus latitude contour plot up to 0.01hPa.
+    Plot many lat-pressure panels (e.g. one per experiment) on one figure.
+    The contour levels, colormap and pressure axis are built once and shared
+    by all the panels.
+    Inputs:
+        fig = the figure page
+        datalist = list of (pre, lat) data arrays, one per panel
+        lat, pre = the latitude and pressure axes.  Either a single axis shared
+                   by all panels or a list with one per panel
+        ci, cmin, cmax = contour interval and range
+        titles = list of panel titles
+        plotfunc = the panel plotting function (default plotlatlogpre_to0p01)
+        coords = (x1, x2, y1, y2) lists of panel positions (default get4by4coords())
+        kwargs = passed on to plotfunc (e.g. cmap)
+    Output: axes = list of the panel axes
     """
+    if (plotfunc is None):
+        plotfunc = plotlatlogpre_to0p01
+    if (coords is None):
+        coords = get4by4coords()
+    x1, x2, y1, y2 = coords
 
-    # set up contour levels and color map
-    nlevs = (cmax-cmin)/ci + 1
-    clevs = np.arange(cmin, cmax+ci, ci)
-    mymap = mycolors.blue2red_cmap(nlevs)
-
-    plt.rcParams['font.size'] = '12'
-    
-    ax = fig.add_axes([x1, y1, x2-x1, y2-y1])
-
-    ax.contourf(lat,-1.*np.log10(pre), data, levels=clevs, cmap=mymap, extend='max')
-    ax.contour(lat,-1.*np.log10(pre), data, levels=clevs[ clevs != 0], colors='black', linewidths=0.5)
-    ax.set_ylim(-np.log10(1000.),-np.log10(10))
-    ax.set_yticks([-np.log10(1000),-np.log10(300),-np.log10(100),-np.log10(30),-np.log10(10)])
-    ax.set_yticklabels(['1000','300','100','30','10'])
-    ax.set_ylabel('Pressure (hPa)')
-    ax.set_title(titlestr, fontsize=16)
-    ax.set_xlabel('Latitude $^{\circ}$N')
-
-    return ax
+    if (len(datalist) > len(x1)):
+        raise ValueError("more panels ("+str(len(datalist))+") than positions ("+str(len(x1))+")")
 
+    axes = []
+    for ipanel, data in enumerate(datalist):
+        latp = lat[ipanel] if isinstance(lat, list) else lat
+        prep = pre[ipanel] if isinstance(pre, list) else pre
+        ax = plotfunc(fig, data, latp, prep, ci, cmin, cmax, titles[ipanel],
+                      x1=x1[ipanel], x2=x2[ipanel], y1=y1[ipanel], y2=y2[ipanel], **kwargs)
+        axes.append(ax)
 
+    return axes
 
-def plotlatlogpre_to1(fig, data, lat, pre, ci, cmin, cmax, titlestr, x1=0.1, x2=0.9, y1=0.1, y2=0.9, cmap='blue2red'):
+def plotlatlinearp(fig, data, lat, pre, ci, cmin, cmax, titlestr, x1=0.1, x2=0.9, y1=0.1, y2=0.9, cmap='blue2red'):
     """
     Plot a pressure versus latitude contour plot up to 0.01hPa.
     """
 
+
     # set up contour levels and color map
-    nlevs = (cmax-cmin)/ci + 1
-    clevs = np.arange(cmin, cmax+ci, ci)
+    clevs, mymap = get_clevs_cmap(ci, cmin, cmax, cmap)
 
-    if (cmap == 'blue2red'):
-        mymap = mycolors.blue2red_cmap(nlevs)
 
-    if (cmap == 'precip'):
-        mymap = mycolors.precip_cmap(nlevs)
 
-    mymap = mycolors.blue2red_cmap(nlevs)
 
     plt.rcParams['font.size'] = '12'
     
     ax = fig.add_axes([x1, y1, x2-x1, y2-y1])
 
-    ax.contourf(lat,-1.*np.log10(pre), data, levels=clevs, cmap=mymap, extend='max')
-    ax.contour(lat,-1.*np.log10(pre), data, levels=clevs, colors='black', linewidths=0.5)
-    ax.set_ylim(-np.log10(1000.),-np.log10(1))
-    ax.set_yticks([-np.log10(1000),-np.log10(100),-np.log10(10),-np.log10(1)])
-    ax.set_yticklabels(['1000','100','10','1'])
+    ax.contourf(lat,-1*pre, data, levels=clevs, cmap=mymap, extend='max')
+    ax.contour(lat,-1*pre, data, levels=clevs[ clevs != 0], colors='black', linewidths=0.5)
+    ax.set_ylim(-1000.,-np.log10(10))
+    ax.set_yticks([-1000,-800,-600,-400,-200,0])
+    ax.set_yticklabels(['1000','800','600','400','200','0'])
     ax.set_ylabel('Pressure (hPa)')
     ax.set_title(titlestr, fontsize=16)
     ax.set_xlabel('Latitude $^{\circ}$N')
 
     return ax
 
-  
-def plotlatlogpre_to0p01(fig, data, lat, pre, ci, cmin, cmax, titlestr, x1=0.1, x2=0.9, y1=0.1, y2=0.9, cmap='blue2red'):
-    """
-    Plot a pressure versus latitude contour plot up to 0.01hPa.
-    """
-
-    # set up contour levels and color map
-    nlevs = (cmax-cmin)/ci + 1
-    clevs = np.arange(cmin, cmax+ci, ci)
-
-    if (cmap == 'blue2red'):
-        mymap = mycolors.blue2red_cmap(nlevs)
 
-    if (cmap == 'precip'):
-        mymap = mycolors.precip_cmap(nlevs)
 
-    plt.rcParams['font.size'] = '12'
-    
-    ax = fig.add_axes([x1, y1, x2-x1, y2-y1])
-
-    ax.contourf(lat,-1.*np.log10(pre), data, levels=clevs, cmap=mymap, extend='max')
-    ax.contour(lat,-1.*np.log10(pre), data, levels=clevs, colors='black', linewidths=0.5)
-    ax.set_ylim(-np.log10(1000.),-np.log10(0.01))
-    ax.set_yticks([-np.log10(1000),-np.log10(100),-np.log10(10),-np.log10(1),-np.log10(0.1),-np.log10(0.01)])
-    ax.set_yticklabels(['1000','100','10','1','0.1','0.01'])
-    ax.set_ylabel('Pressure (hPa)')
-    ax.set_title(titlestr, fontsize=16)
-    ax.set_xlabel('Latitude $^{\circ}$N')
 
-    return ax
+# pressure tick marks for each (bottom, top) pressure range of plotlatlogpre
+preticks = {(1000, 10): [1000, 300, 100, 30, 10],
+            (1000, 1): [1000, 100, 10, 1],
+            (1000, 0.01): [1000, 100, 10, 1, 0.1, 0.01],
+            (0.1, 0.01): [0.1, 0.03, 0.01],
+            (100, 0.01): [100, 10, 1, 0.1, 0.01]}
 
-def plotlatlogpre_0p1to0p01(fig, data, lat, pre, ci, cmin, cmax, titlestr, x1=0.1, x2=0.9, y1=0.1, y2=0.9):
+def plotlatlogpre(fig, data, lat, pre, ci, cmin, cmax, titlestr, x1=0.1, x2=0.9, y1=0.1, y2=0.9, cmap='blue2red',
+                  prange=(1000, 0.01), clevs=None, zerocontour=True, rasterize=False, decimate=None):
     """
-    Plot a pressure versus latitude contour plot up to 0.01hPa.
+    Plot a pressure versus latitude contour plot with a log pressure axis.
+    Inputs:
+        fig = the figure page
+        data = the (pre, lat) data
+        lat, pre = the latitude and pressure (hPa) axes
+        ci, cmin, cmax = contour interval and range (ignored if clevs is given)
+        titlestr = the title
+        x1, x2, y1, y2 = the panel edges (in fractions of the page)
+        cmap = blue2red or precip
+        prange = (bottom, top) pressure range in hPa
+        clevs = optional contour levels to use instead of ci, cmin, cmax
+        zerocontour = if False, don't draw the zero contour line
+        rasterize = if True, the filled contours are rasterized when saving to 
+                    a vector format while the axes, labels and contour lines stay vector.
+                    Makes multi-panel pdfs much smaller and faster to open
+        decimate = optional integer stride to thin the latitudes before contouring
     """
 
     # set up contour levels and color map
-    nlevs = (cmax-cmin)/ci + 1
-    clevs = np.arange(cmin, cmax+ci, ci)
-    mymap = mycolors.blue2red_cmap(nlevs)
+    if (clevs is None):
+        clevs, mymap = get_clevs_cmap(ci, cmin, cmax, cmap)
+    else:
+        clevs = np.asarray(clevs)
+        mymap = get_cmap(len(clevs), cmap)
+
+    if (decimate):
+        lat = np.asarray(lat)[::decimate]
+        data = np.asarray(data)[:, ::decimate]
 
     plt.rcParams['font.size'] = '12'
     
     ax = fig.add_axes([x1, y1, x2-x1, y2-y1])
 
-    ax.contourf(lat,-1.*np.log10(pre), data, levels=clevs, cmap=mymap, extend='max')
-    ax.contour(lat,-1.*np.log10(pre), data, levels=clevs, colors='black', linewidths=0.5)
-    ax.set_ylim(-np.log10(0.1),-np.log10(0.01))
-    ax.set_yticks([-np.log10(0.1),-np.log10(0.03),-np.log10(0.01)])
-    ax.set_yticklabels(['0.1','0.03','0.01'])
+    logpre = get_logpre(pre)
+    cf = ax.contourf(lat,logpre, data, levels=clevs, cmap=mymap, extend='max')
+    if (rasterize):
+        try:
+            cf.set_rasterized(True)
+        except AttributeError:
+            # matplotlib < 3.8, the contour set isn't an artist itself
+            for collection in cf.collections:
+                collection.set_rasterized(True)
+
+    if (zerocontour):
+        ax.contour(lat,logpre, data, levels=clevs, colors='black', linewidths=0.5)
+    else:
+        ax.contour(lat,logpre, data, levels=clevs[ clevs != 0], colors='black', linewidths=0.5)
+
+    ticks = preticks.get(tuple(prange))
+    if (ticks is None):
+        ticks = [10.**i for i in np.arange(np.ceil(np.log10(prange[1])), np.floor(np.log10(prange[0]))+1)[::-1]]
+    ax.set_ylim(-np.log10(prange[0]),-np.log10(prange[1]))
+    ax.set_yticks(-np.log10(ticks))
+    ax.set_yticklabels(['%g' % tick for tick in ticks])
     ax.set_ylabel('Pressure (hPa)')
     ax.set_title(titlestr, fontsize=16)
     ax.set_xlabel('Latitude $^{\circ}$N')
 
     return ax
 
-
-
-
-def plotlatlogpre_100to0p01(fig, data, lat, pre, ci, cmin, cmax, titlestr, x1=0.1, x2=0.9, y1=0.1, y2=0.9):
+def plotlatlogpre_to10(fig, data, lat, pre, ci, cmin, cmax, titlestr, x1=0.1, x2=0.9, y1=0.1, y2=0.9, **kwargs):
     """
-    Plot a pressure versus latitude contour plot up to 0.01hPa.
+    Plot a pressure versus latitude contour plot up to 10hPa.  See plotlatlogpre.
     """
+    return plotlatlogpre(fig, data, lat, pre, ci, cmin, cmax, titlestr, x1, x2, y1, y2,
+                         prange=(1000, 10), zerocontour=False, **kwargs)
 
-    # set up contour levels and color map
-    nlevs = (cmax-cmin)/ci + 1
-    clevs = np.arange(cmin, cmax+ci, ci)
-    mymap = mycolors.blue2red_cmap(nlevs)
-
-    plt.rcParams['font.size'] = '12'
-    
-    ax = fig.add_axes([x1, y1, x2-x1, y2-y1])
-
-    ax.contourf(lat,-1.*np.log10(pre), data, levels=clevs, cmap=mymap, extend='max')
-    ax.contour(lat,-1.*np.log10(pre), data, levels=clevs, colors='black', linewidths=0.5)
-    ax.set_ylim(-np.log10(100.),-np.log10(0.01))
-    ax.set_yticks([-np.log10(100),-np.log10(10),-np.log10(1),-np.log10(0.1),-np.log10(0.01)])
-    ax.set_yticklabels(['100','10','1','0.1','0.01'])
-    ax.set_ylabel('Pressure (hPa)')
-    ax.set_title(titlestr, fontsize=16)
-    ax.set_xlabel('Latitude $^{\circ}$N')
-
-    return ax
-
+def plotlatlogpre_to1(fig, data, lat, pre, ci, cmin, cmax, titlestr, x1=0.1, x2=0.9, y1=0.1, y2=0.9, cmap='blue2red', **kwargs):
+    """
+    Plot a pressure versus latitude contour plot up to 1hPa.  See plotlatlogpre.
+    """
+    return plotlatlogpre(fig, data, lat, pre, ci, cmin, cmax, titlestr, x1, x2, y1, y2, cmap=cmap,
+                         prange=(1000, 1), **kwargs)
+  
+def plotlatlogpre_to0p01(fig, data, lat, pre, ci, cmin, cmax, titlestr, x1=0.1, x2=0.9, y1=0.1, y2=0.9, cmap='blue2red', **kwargs):
+    """
+    Plot a pressure versus latitude contour plot up to 0.01hPa.  See plotlatlogpre.
+    """
+    return plotlatlogpre(fig, data, lat, pre, ci, cmin, cmax, titlestr, x1, x2, y1, y2, cmap=cmap,
+                         prange=(1000, 0.01), **kwargs)
 
+def plotlatlogpre_0p1to0p01(fig, data, lat, pre, ci, cmin, cmax, titlestr, x1=0.1, x2=0.9, y1=0.1, y2=0.9, **kwargs):
+    """
+    Plot a pressure versus latitude contour plot from 0.1 to 0.01hPa.  See plotlatlogpre.
+    """
+    return plotlatlogpre(fig, data, lat, pre, ci, cmin, cmax, titlestr, x1, x2, y1, y2,
+                         prange=(0.1, 0.01), **kwargs)
 
+def plotlatlogpre_100to0p01(fig, data, lat, pre, ci, cmin, cmax, titlestr, x1=0.1, x2=0.9, y1=0.1, y2=0.9, **kwargs):
+    """
+    Plot a pressure versus latitude contour plot from 100 to 0.01hPa.  See plotlatlogpre.
+    """
+    return plotlatlogpre(fig, data, lat, pre, ci, cmin, cmax, titlestr, x1, x2, y1, y2,
+                         prange=(100, 0.01), **kwargs)
 
-def plotlatlogpre_to0p01_sayc(fig, data, lat, pre, clevs, titlestr, x1=0.1, x2=0.9, y1=0.1, y2=0.9):
+def plotlatlogpre_to0p01_sayc(fig, data, lat, pre, clevs, titlestr, x1=0.1, x2=0.9, y1=0.1, y2=0.9, **kwargs):
     """
     Plot a pressure versus latitude contour plot up to 0.01hPa.
-    Specify contour levels directly rather than a min and max
+    Specify contour levels directly rather than a min and max.  See plotlatlogpre.
     """
-
-    # set up contour levels and color map
-    nlevs = len(clevs)
-    mymap = mycolors.blue2red_cmap(nlevs)
-
-    plt.rcParams['font.size'] = '12'
-    
-    ax = fig.add_axes([x1, y1, x2-x1, y2-y1])
-
-    ax.contourf(lat,-1.*np.log10(pre), data, levels=clevs, cmap=mymap, extend='max')
-    ax.contour(lat,-1.*np.log10(pre), data, levels=clevs, colors='black', linewidths=0.5)
-    ax.set_ylim(-np.log10(1000.),-np.log10(0.01))
-    ax.set_yticks([-np.log10(1000),-np.log10(100),-np.log10(10),-np.log10(1),-np.log10(0.1),-np.log10(0.01)])
-    ax.set_yticklabels(['1000','100','10','1','0.1','0.01'])
-    ax.set_ylabel('Pressure (hPa)')
-    ax.set_title(titlestr, fontsize=16)
-
-    return ax
-
-
-
+    return plotlatlogpre(fig, data, lat, pre, None, None, None, titlestr, x1, x2, y1, y2,
+                         prange=(1000, 0.01), clevs=clevs, **kwargs)
 
 
 def plotqbowinds(fig, data, time, pre, ci, cmin, cmax, titlestr, x1=None, x2=None, y1=None, y2=None):
@@ -238,9 +243,7 @@ def plotqbowinds(fig, data, time, pre, ci, cmin, cmax, titlestr, x1=None, x2=Non
     """
 
     # set up contour levels and color map
-    nlevs = (cmax-cmin)/ci + 1
-    clevs = np.arange(cmin, cmax+ci, ci)
-    mymap = mycolors.blue2red_cmap(nlevs)
+    clevs, mymap = get_clevs_cmap(ci, cmin, cmax)
 
     plt.rcParams['font.size'] = '12'
 
@@ -249,7 +252,8 @@ def plotqbowinds(fig, data, time, pre, ci, cmin, cmax, titlestr, x1=None, x2=Non
     else:
         ax = fig.add_axes()
 
-    ax.contourf(time,-1.*np.log10(pre),data, levels=clevs, cmap=mymap, extend='max')
+    logpre = get_logpre(pre)
+    ax.contourf(time,logpre,data, levels=clevs, cmap=mymap, extend='max')
     ax.set_ylim(-np.log10(1000.),-np.log10(1))
     ax.set_yticks([-np.log10(1000),-np.log10(300),-np.log10(100),-np.log10(30),-np.log10(10),
                    -np.log10(3),-np.log10(1)])
@@ -461,23 +465,40 @@ def plotprofile_logp_0p1to0p01(fig, data, pre, expname, x1=None, x2=None, y1=Non
 def plotposneghisto(fig, data, binmin, binmax, binint, titlestr, xtitlestr, x1, x2, y1, y2, 
                    yrange=[0,100],xticks=None, xticknames=None):
     """
-    ???? 
+    Plot a histogram of data as the percentage of values in each bin, 
+    with positive bins in red and negative bins in blue.
     """
-    ax = fig.add_axes([x1, y1, x2-x1, y2-y1])
-
-    plt.rcParams['font.size'] = '12'
-
     binvals = np.arange(binmin, binmax, binint)
     histovals, binedges = np.histogram(data, bins=binvals)
     histovals = (histovals/np.size(data))*100.
     binedges = binedges[0:np.size(binedges)-1]
 
+    ax = plotposnegpdf(fig, histovals, binedges, titlestr, xtitlestr, x1, x2, y1, y2, 
+                       xlim=[binmin,binmax], yrange=yrange, xticks=xticks, xticknames=xticknames)
+
+    return ax
+
+def plotposnegpdf(fig, histovals, binedges, titlestr, xtitlestr, x1, x2, y1, y2, 
+                  xlim=None, yrange=[0,100], xticks=None, xticknames=None):
+    """
+    Plot a precomputed PDF (e.g. from pdf_utils.point_pdfs) in the style of plotposneghisto.
+    histovals = the percentage in each bin
+    binedges = the left edges of the bins
+    """
+    ax = fig.add_axes([x1, y1, x2-x1, y2-y1])
+
+    plt.rcParams['font.size'] = '12'
+
+    histovals = np.array(histovals)
+    binedges = np.array(binedges)
+
     ax.bar(binedges[np.where(binedges >= 0)], histovals[np.where(binedges >=0)], 
        width=binedges[1]-binedges[0], bottom=0, align='edge', color='darkred', edgecolor='black')
     ax.bar(binedges[np.where(binedges < 0)], histovals[np.where(binedges < 0)],  
        width=binedges[1]-binedges[0], bottom=0, align='edge', color='royalblue',edgecolor='black')
 
-    ax.set_xlim(binmin,binmax)
+    if (xlim):
+        ax.set_xlim(xlim)
     ax.set_ylim(yrange)
     ax.set_title(titlestr)
     ax.set_ylabel('%')
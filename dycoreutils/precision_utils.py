@@ -0,0 +1,56 @@
+# Floating point precision policy for the diagnostics.
+#
+# By default the TEM calculation is done in float64 and the calendar and filter routines
+# keep the precision of their input.  The CESM history fields are float32, so
+# computing in float32 halves the memory and bandwidth of e.g. the TEM calculation.
+# The precision can be set
+#     globally:      precision_utils.set_precision('float32')
+#                    or the environment variable DYCOREUTILS_PRECISION=float32
+#     for a block:   with precision_utils.precision('float32'): ...
+#     per call:      the dtype argument of the routines that support it (tem_utils.calc_tem,
+#                    filter_utils.calc_season_nharm, calendar_utils.season_mean)
+# Sums that lose precision in float32 (cumulative integrals, long time means) are
+# still accumulated in float64 and only the result is converted.
+
+import contextlib
+import os
+
+import numpy as np
+
+dtypes = ['float32', 'float64']
+
+def _check(dtype):
+    dtype = np.dtype(dtype)
+    if dtype.name not in dtypes:
+        raise ValueError("unsupported precision "+str(dtype)+", use one of "+str(dtypes))
+    return dtype
+
+# None until a precision is asked for
+_precision = [_check(os.environ['DYCOREUTILS_PRECISION']) if os.environ.get('DYCOREUTILS_PRECISION') else None]
+
+def set_precision(dtype):
+    """ set the default precision ('float32' or 'float64') """
+    _precision[0] = _check(dtype)
+
+def get_precision(dtype=None, like=None):
+    """ the numpy dtype to compute in: dtype if given, otherwise the precision set with
+    set_precision, precision or DYCOREUTILS_PRECISION.  If none has been set, the dtype
+    of like (e.g. the input data) if it is float32 or float64, otherwise float64.
+    """
+    if (dtype is not None):
+        return _check(dtype)
+    if (_precision[0] is not None):
+        return _precision[0]
+    if (like is not None) and (np.dtype(like).name in dtypes):
+        return np.dtype(like)
+    return np.dtype('float64')
+
+@contextlib.contextmanager
+def precision(dtype):
+    """ context manager that sets the default precision within a with block """
+    old = _precision[0]
+    set_precision(dtype)
+    try:
+        yield
+    finally:
+        _precision[0] = old
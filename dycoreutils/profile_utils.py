@@ -0,0 +1,140 @@
+# Opt-in profiling of dycoreutils calls.
+#
+# Set the environment variable DYCOREUTILS_PROFILE to 1, true or yes to turn it on.  The
+# records are kept in memory, and if DYCOREUTILS_PROFILE_LOG is set to a file path one
+# JSON line per call is also appended to that file, e.g.
+#     DYCOREUTILS_PROFILE=1 DYCOREUTILS_PROFILE_LOG=/path/to/log.jsonl
+# For every call to a function decorated with @profiled the wall time, peak memory
+# allocated during the call, bytes read by the process and the number of dask tasks in
+# the result are recorded.  summary() gives a table per function.  When profiling is
+# off the decorator just calls the function, and results are never changed.
+
+import functools
+import json
+import os
+import time
+import tracemalloc
+
+try:
+    import resource
+except ImportError:
+    # not available on windows
+    resource = None
+
+_records = []
+_peaks = []
+
+_truthy = ('1', 'true', 'yes')
+
+def profiling_enabled():
+    """ True if DYCOREUTILS_PROFILE is set to 1, true or yes (in any case) """
+    return os.environ.get('DYCOREUTILS_PROFILE', '').strip().lower() in _truthy
+
+def _bytes_read():
+    """ bytes read by this process so far (linux only, None elsewhere) """
+    try:
+        with open('/proc/self/io') as f:
+            for line in f:
+                if line.startswith('rchar'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+def _maxrss():
+    """ high water mark of the resident set size in bytes """
+    if (resource is None):
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss*1024
+
+def _ntasks(obj):
+    """ number of tasks in the dask graph(s) of obj, 0 if it isn't dask backed """
+    if isinstance(obj, (tuple, list)):
+        return sum(_ntasks(i) for i in obj)
+    try:
+        graph = obj.__dask_graph__()
+    except (AttributeError, TypeError):
+        return 0
+    return 0 if (graph is None) else len(graph)
+
+def profiled(func):
+    """ decorator that records the cost of each call to func when profiling is on """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if not profiling_enabled():
+            return func(*args, **kwargs)
+
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+        canreset = hasattr(tracemalloc, 'reset_peak')
+
+        # carry the peak so far up to the caller before resetting it for this call
+        if canreset:
+            if _peaks:
+                _peaks[-1] = max(_peaks[-1], tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+        _peaks.append(0)
+
+        mem0 = tracemalloc.get_traced_memory()[0]
+        rss0 = _maxrss()
+        read0 = _bytes_read()
+        time0 = time.perf_counter()
+
+        result = func(*args, **kwargs)
+
+        walltime = time.perf_counter() - time0
+        read1 = _bytes_read()
+        rss1 = _maxrss()
+        peak = max(tracemalloc.get_traced_memory()[1], _peaks.pop())
+        if canreset and _peaks:
+            _peaks[-1] = max(_peaks[-1], peak)
+
+        record = {'function': func.__module__+'.'+func.__name__,
+                  'depth': len(_peaks),
+                  'start': time.time() - walltime,
+                  'wall_s': walltime,
+                  'peakmem_bytes': (peak - mem0) if canreset else None,
+                  'maxrss_increase_bytes': (rss1 - rss0) if (rss0 is not None) else None,
+                  'bytes_read': (read1 - read0) if (read0 is not None) else None,
+                  'dask_tasks': _ntasks(result),
+                  'pid': os.getpid()}
+        _records.append(record)
+
+        logfile = os.environ.get('DYCOREUTILS_PROFILE_LOG')
+        if logfile:
+            with open(logfile, 'a') as f:
+                f.write(json.dumps(record)+'\n')
+
+        return result
+
+    return wrapper
+
+def get_records():
+    """ list of the records (dictionaries) collected in this process """
+    return list(_records)
+
+def clear():
+    """ forget the records collected so far """
+    del _records[:]
+
+def read_log(logfile):
+    """ read the records back from a DYCOREUTILS_PROFILE_LOG file """
+    with open(logfile) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def summary(records=None):
+    """ pandas DataFrame summarizing the records (default the ones collected in this
+    process) by function: number of calls, total and mean wall time, maximum peak memory,
+    total bytes read and the maximum number of dask tasks
+    """
+    import pandas as pd
+
+    records = _records if (records is None) else records
+    df = pd.DataFrame(records)
+    if df.empty:
+        return df
+
+    table = df.groupby('function').agg(ncalls=('wall_s', 'size'), total_s=('wall_s', 'sum'),
+                                       mean_s=('wall_s', 'mean'), max_peakmem_bytes=('peakmem_bytes', 'max'),
+                                       bytes_read=('bytes_read', 'sum'), max_dask_tasks=('dask_tasks', 'max'))
+    return table.sort_values('total_s', ascending=False)
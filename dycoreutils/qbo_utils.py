@@ -0,0 +1,172 @@
+# QBO diagnostics.  These all work on a monthly equatorial band time series of
+# zonal mean zonal wind, e.g. spatialaverage_utils.cosweightlat(uzm.U, -5, 5),
+# with dimensions (time, level) and do all levels at once.
+
+import xarray as xr
+import numpy as np
+from dycoreutils.profile_utils import profiled
+
+H = 7000.
+levnames = ["lev", "pre", "ilev", "plev", "level"]
+
+def getlevname(darray):
+    """ find the name of the vertical coordinate (lev for CESM, pre for ERA5 etc) """
+    levname = [name for name in levnames if name in darray.dims]
+    if (len(levname) == 0):
+        raise ValueError("can't find a vertical dimension, looked for "+str(levnames))
+    return levname[0]
+
+@profiled
+def deseasonalize_monthly(darray):
+    """ remove the monthly climatology.  The climatology is computed once and
+    subtracted with a single vectorized lookup rather than a second groupby.
+    """
+    clim = darray.groupby('time.month').mean('time')
+    anoms = darray - clim.sel(month=darray['time.month']).drop_vars('month')
+    return anoms
+
+@profiled
+def ddamp(darray):
+    """ Dunkerton and Delisi amplitude at every level
+    (sqrt(2) x the standard deviation of the deseasonalized wind)
+    """
+    ddamp = np.sqrt(2)*deseasonalize_monthly(darray).std(dim='time')
+    return ddamp
+
+def _smooth(darray, smooth):
+    if (smooth > 1):
+        darray = darray.rolling(time=smooth, center=True, min_periods=1).mean()
+    return darray
+
+@profiled
+def westerly_onsets(darray, smooth=5):
+    """ times of the easterly to westerly transitions (upward zero crossings of the
+    deseasonalized, smoothed wind), linearly interpolated between months.
+    Input: darray = (time, lev) monthly data
+           smooth = length in months of the running mean applied before finding crossings
+    Output: levidx, tcross = level index and time (in months since the first time)
+            of every crossing, sorted by level then time
+    """
+    levname = getlevname(darray)
+    anoms = _smooth(deseasonalize_monthly(darray), smooth)
+    anoms = np.array(anoms.transpose(levname, "time"))
+
+    # crossings between month i and i+1 for all levels at once
+    cross = (anoms[:,:-1] < 0) & (anoms[:,1:] >= 0)
+    levidx, tidx = np.nonzero(cross)
+    u0 = anoms[levidx, tidx]
+    u1 = anoms[levidx, tidx+1]
+    tcross = tidx + u0/(u0 - u1)
+
+    return levidx, tcross
+
+@profiled
+def qbo_period(darray, smooth=5):
+    """ QBO period at every level from the spacing of successive westerly onsets.
+    Output: xarray.Dataset with the mean period, its standard deviation (months) and
+            the number of complete cycles at each level
+    """
+    levname = getlevname(darray)
+    nlev = darray[levname].size
+    levidx, tcross = westerly_onsets(darray, smooth=smooth)
+
+    # differences between successive crossings at the same level
+    same = levidx[1:] == levidx[:-1]
+    periods = np.diff(tcross)[same]
+    plev = levidx[1:][same]
+
+    ncycles = np.bincount(plev, minlength=nlev)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = np.bincount(plev, weights=periods, minlength=nlev)/ncycles
+        var = np.bincount(plev, weights=periods**2, minlength=nlev)/ncycles - mean**2
+    std = np.sqrt(np.maximum(var, 0))
+
+    coords = {levname: darray[levname]}
+    period = xr.Dataset({"period": ([levname], mean, {"units": "months"}),
+                         "period_std": ([levname], std, {"units": "months"}),
+                         "ncycles": ([levname], ncycles)}, coords=coords)
+
+    return period
+
+@profiled
+def qbo_descent(darray, reflev=10., smooth=5):
+    """ Descent of the westerly phase.  For each westerly onset at the reference level,
+    find the first onset at every other level within half a mean period and average the lags.
+    Input: darray = (time, lev) monthly data, levels in hPa
+           reflev = reference pressure level (hPa)
+    Output: xarray.Dataset with the mean lag (months, positive = later than reflev) of the
+            westerly onset at each level and the descent rate (km/month) derived from
+            the log-pressure height and lag
+    """
+    levname = getlevname(darray)
+    lev = np.array(darray[levname])
+    nlev = lev.size
+    iref = np.argmin(np.abs(lev - reflev))
+
+    levidx, tcross = westerly_onsets(darray, smooth=smooth)
+    tref = tcross[levidx == iref]
+    maxlag = np.nanmean(qbo_period(darray, smooth=smooth).period.values)/2.
+
+    lag = np.full(nlev, np.nan)
+    for ilev in range(nlev):
+        tlev = tcross[levidx == ilev]
+        if (tlev.size == 0) or (tref.size == 0):
+            continue
+        # nearest onset at this level to each reference onset
+        iafter = np.clip(np.searchsorted(tlev, tref), 0, tlev.size-1)
+        ibefore = np.clip(iafter-1, 0, tlev.size-1)
+        dtafter = tlev[iafter] - tref
+        dtbefore = tlev[ibefore] - tref
+        dt = np.where(np.abs(dtbefore) < np.abs(dtafter), dtbefore, dtafter)
+        dt = dt[np.abs(dt) <= maxlag]
+        if (dt.size > 0):
+            lag[ilev] = dt.mean()
+
+    z = -H*np.log(lev/1000.)/1000.
+    with np.errstate(invalid='ignore', divide='ignore'):
+        rate = -1.*np.gradient(z)/np.gradient(lag)
+
+    coords = {levname: darray[levname]}
+    descent = xr.Dataset({"lag": ([levname], lag, {"units": "months"}),
+                          "descent_rate": ([levname], rate, {"units": "km/month"})}, coords=coords)
+
+    return descent
+
+@profiled
+def qbo_phase(darray, lev1=10., lev2=30., smooth=5):
+    """ QBO phase angle (radians, -pi to pi) from the normalized deseasonalized
+    winds at two levels (e.g. 10 and 30hPa which are roughly in quadrature)
+    """
+    levname = getlevname(darray)
+    anoms = _smooth(deseasonalize_monthly(darray), smooth)
+    u1 = anoms.sel({levname: lev1}, method="nearest")
+    u2 = anoms.sel({levname: lev2}, method="nearest")
+    phase = np.arctan2(u2/u2.std("time"), u1/u1.std("time"))
+    phase = phase.drop_vars(levname, errors="ignore").rename("phase")
+    return phase
+
+@profiled
+def qbo_phase_composite(darray, nphase=8, lev1=10., lev2=30., smooth=5):
+    """ composite of the deseasonalized wind at all levels in nphase bins of QBO phase """
+    phase = qbo_phase(darray, lev1=lev1, lev2=lev2, smooth=smooth)
+    anoms = deseasonalize_monthly(darray)
+    binedges = np.linspace(-np.pi, np.pi, nphase+1)
+    phasebin = xr.DataArray(np.clip(np.digitize(phase, binedges)-1, 0, nphase-1), coords=phase.coords,
+                            name="phasebin")
+    composite = anoms.groupby(phasebin).mean("time")
+    composite = composite.reindex(phasebin=np.arange(nphase))
+    composite = composite.assign_coords(phase=("phasebin", 0.5*(binedges[:-1] + binedges[1:])))
+    return composite
+
+@profiled
+def qbo_diags(darrays, reflev=10., smooth=5):
+    """ All the QBO diagnostics for a dictionary of experiments {expname: darray}.
+    Experiments can be on different vertical grids so a dictionary of
+    xarray.Datasets is returned (ddamp, period, period_std, ncycles, lag, descent_rate).
+    """
+    diags = {}
+    for iexp in darrays:
+        dat = darrays[iexp]
+        diags[iexp] = xr.merge([ddamp(dat).rename("ddamp"), qbo_period(dat, smooth=smooth),
+                                qbo_descent(dat, reflev=reflev, smooth=smooth)])
+    return diags
@@ -1,10 +1,127 @@
 # routines for reading in data in various forms
 
+import glob
+import itertools
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
 import xarray as xr
 import pandas as pd
 import numpy as np
+import cftime
+from dycoreutils.profile_utils import profiled
+
+@profiled
+def time_bnds_midpoint(dat, bndsnames=("time_bnds", "time_bounds")):
+    """Calculate the midpoint of the time bounds for each time.
+    Works directly on the decoded bounds, whether they are numpy datetime64
+    or cftime objects, so it's fine for noleap, 360_day and gregorian
+    calendars alike and the files don't need to be re-read.
+    Args:
+        dat (xarray.Dataset) = dataset containing the time bounds
+        bndsnames (tuple) = possible names of the time bounds variable
+    Returns:
+        timebndavg (numpy array) = the midpoint of the time bounds in the
+                                   same calendar as the input
+    """
+
+    bndsname = [name for name in bndsnames if name in dat.variables]
+    if (len(bndsname) == 0):
+        raise KeyError("no time bounds found, looked for "+str(bndsnames))
+
+    # put time first whatever the bound dimension is called (nbnd, d2, ...)
+    timebnds = dat[bndsname[0]]
+    bnddim = [dim for dim in timebnds.dims if dim != "time"][0]
+    timebnds = np.array(timebnds.transpose("time", bnddim))
+
+    if np.issubdtype(timebnds.dtype, np.datetime64):
+        timebnds = timebnds.astype('datetime64[s]').view('i8')
+        timebndavg = (timebnds[:,0] + (timebnds[:,1] - timebnds[:,0])//2).astype('datetime64[s]')
+    else:
+        # cftime objects: average in numeric time in the dataset's own calendar
+        calendar = timebnds.flat[0].calendar
+        units = "days since 0001-01-01 00:00:00"
+        timenum = cftime.date2num(timebnds, units, calendar=calendar)
+        timebndavg = cftime.num2date(timenum.mean(axis=1), units, calendar=calendar)
 
-def read_cesm_zonalmean(filepath, datestart, dateend):
+    return timebndavg
+
+def _readfile(path):
+    """ the contents of a file read in one go, the part of reading a file that waits on
+    the filesystem """
+    with open(path, 'rb') as f:
+        return f.read()
+
+def _reduce_file(path, contents, datestart, dateend, reduce, cesm):
+    """ open a netcdf file from its contents in memory, take the time slice and reduce it """
+    import netCDF4
+
+    nc = netCDF4.Dataset(path, mode='r', memory=contents)
+    dat = xr.open_dataset(xr.backends.NetCDF4DataStore(nc), decode_times=True)
+    try:
+        if cesm:
+            try:
+                dat['time'] = time_bnds_midpoint(dat)
+            except KeyError:
+                print("warning, you're reading CESM data but there's no time_bnds in "+path)
+        dat = dat.sel(time=slice(datestart, dateend))
+        if (dat.time.size == 0):
+            return None
+        if (reduce is not None):
+            dat = reduce(dat)
+        return dat.load()
+    finally:
+        dat.close()
+
+@profiled
+def read_prefetch(filepath, datestart=None, dateend=None, reduce=None, cesm=False, nprefetch=4):
+    """Read a time slice of a set of netcdf files one file at a time, reducing each file
+    (e.g. the zonal mean) while the next nprefetch files are read in background threads.
+    For filesystems with a high latency per file, where reading the files one after the
+    other is slow whatever the amount of data.
+    Args:
+        filepath (string or list) = glob or list of files, in time order once sorted
+        datestart, dateend (string) = time slice, None for all times
+        reduce (function) = applied to the Dataset of each file e.g. lambda dat: dat.mean("lon")
+        cesm (bool) = set the time axis as the midpoint of time_bnds
+        nprefetch (int) = number of files read ahead at once, 0 to read them one by one.
+                          At most nprefetch+1 files are held in memory.
+    Returns:
+        dat (xarray.Dataset) = the reduced time slice, loaded
+    """
+    files = sorted(glob.glob(filepath)) if isinstance(filepath, str) else list(filepath)
+    if (len(files) == 0):
+        raise FileNotFoundError("no files found for "+str(filepath))
+
+    pieces = []
+    if (nprefetch == 0):
+        for path in files:
+            pieces.append(_reduce_file(path, _readfile(path), datestart, dateend, reduce, cesm))
+    else:
+        with ThreadPoolExecutor(max_workers=nprefetch) as pool:
+            remaining = iter(files)
+            pending = deque((path, pool.submit(_readfile, path))
+                            for path in itertools.islice(remaining, nprefetch))
+            while pending:
+                path, contents = pending.popleft()
+                contents = contents.result()
+                # keep nprefetch reads going while this file is reduced
+                for nextpath in itertools.islice(remaining, 1):
+                    pending.append((nextpath, pool.submit(_readfile, nextpath)))
+                pieces.append(_reduce_file(path, contents, datestart, dateend, reduce, cesm))
+                del contents
+
+    pieces = [piece for piece in pieces if piece is not None]
+    if (len(pieces) == 0):
+        raise ValueError("no times between "+str(datestart)+" and "+str(dateend)+" in "+str(filepath))
+    return xr.concat(pieces, dim="time", data_vars="minimal", coords="minimal",
+                     compat="override", join="override")
+
+def _zonalmean(dat):
+    return dat.mean("lon")
+
+@profiled
+def read_cesm_zonalmean(filepath, datestart, dateend, prefetch=0):
     """Read in a time slice and calculate the zonal mean.
     Accounts for CESM's wierd calendar.  Setting the time axis as the 
     average of time_bnds.
@@ -12,49 +129,41 @@ def read_cesm_zonalmean(filepath, datestart, dateend):
         filepath (string) = location of files
         datestart (string) = start date for timeslice (in a normal calendar)
         dateend (string) = enddate for timeslice (in a normal calendar)
+        prefetch (int) = if > 0 read the files with read_prefetch, that many at once,
+                         and return the zonal mean loaded rather than lazily
     """
 
+    if (prefetch > 0):
+        return read_prefetch(filepath, datestart, dateend, reduce=_zonalmean, cesm=True,
+                             nprefetch=prefetch)
+
+    dat = xr.open_mfdataset(filepath, coords="minimal", join="override", decode_times = True)
+
     try:
+        dat['time'] = time_bnds_midpoint(dat)
+    except KeyError:
+        print("warning, you're reading CESM data but there's no time_bnds")
+        print("make sure you're reading in what you're expecting to")
 
-        dat = xr.open_mfdataset(filepath, coords="minimal", join="override", decode_times = True)
-    
-        try:
-            try:
-                timebndavg = np.array(dat.time_bnds,
-                     dtype='datetime64[s]').view('i8').mean(axis=1).astype('datetime64[s]')
-            except:
-                timebndavg = np.array(dat.time_bounds,
-                     dtype='datetime64[s]').view('i8').mean(axis=1).astype('datetime64[s]')
-    
-            dat['time'] = timebndavg
-        except:
-            print("warning, you're reading CESM data but there's no time_bnds")
-            print("make sure you're reading in what you're expecting to")
-    
-        dat = dat.sel(time=slice(datestart, dateend)).mean("lon")
-
-    except:
-        dat = xr.open_mfdataset(filepath, coords="minimal", join="override")
-        timebnds = dat.time_bnds
-        diff = np.array(timebnds.isel(nbnd=1)) - np.array(timebnds.isel(nbnd=0))
-        diff = diff/2.
-        newtime = np.array(timebnds.isel(nbnd=0)) + diff
-        dat['time'] = newtime
-        dat = dat.sel(time=slice(datestart, dateend)).mean("lon")
+    dat = dat.sel(time=slice(datestart, dateend)).mean("lon")
 
     return dat
 
-def read_zonalmean(filepath, datestart, dateend):
+@profiled
+def read_zonalmean(filepath, datestart, dateend, prefetch=0):
     """Read in a time slice and calculate the zonal mean.
     Args:
         filepath (string) = location of files
         datestart (string) = start date for timeslice (in a normal calendar)
         dateend (string) = enddate for timeslice (in a normal calendar)
+        prefetch (int) = if > 0 read the files with read_prefetch, that many at once,
+                         and return the zonal mean loaded rather than lazily
     """
 
+    if (prefetch > 0):
+        return read_prefetch(filepath, datestart, dateend, reduce=_zonalmean, nprefetch=prefetch)
+
     dat = xr.open_mfdataset(filepath, coords="minimal", join="override", decode_times = True)
     dat = dat.sel(time=slice(datestart, dateend)).mean("lon")
 
     return dat
-
-
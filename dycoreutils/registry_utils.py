@@ -0,0 +1,189 @@
+# Registry of experiments, so that notebooks don't each hard-code basepath, expname lists
+# and case dicts, and so that the diagnostics in a session share the opened datasets
+# (file handles, decoded time axes and coordinates) instead of re-opening the files.
+#
+# The experiments are described in a YAML manifest e.g.
+#
+#     basepath: /project/cas/islas/verticalresolution/
+#     experiments:
+#       sponge5:
+#         files: "{basepath}{name}/{var}_f.e21.FWscHIST.ne30_L81_*_sponge5.001.*.nc"
+#         calendar: noleap        # optional, for files without a calendar attribute
+#       ERA5:
+#         files: {U: "/project/haggis/ERA5/mon/U/*.nc", Q: "/project/haggis/ERA5/mon/Q/*.nc"}
+#         cesm: false             # default true: time from the midpoint of time_bnds
+#         varnames: {U: ua}       # name used here: name in the files
+#         levname: pre
+#
+# files is a glob, or a dict of globs by variable, in which {basepath}, {name} (the
+# experiment) and {var} (the variable in the files) are filled in.  The opened datasets
+# are kept in an in-process LRU of the maxopen most recently used file sets, keyed on
+# the experiment and the filled in glob, so e.g. U and V from the same history files are
+# one dataset.  The experiment is part of the key because its calendar and cesm settings
+# change how the files are decoded.  Everything is lazy (dask backed) so only the
+# metadata is read when a dataset is opened.
+
+import threading
+from collections import OrderedDict
+
+import xarray as xr
+from dycoreutils import readdata_utils as read
+from dycoreutils.profile_utils import profiled
+
+_defaults = {'calendar': None, 'cesm': True, 'varnames': {}, 'levname': 'lev'}
+
+def _setcalendar(calendar):
+    """ preprocess for open_mfdataset that decodes the times of each file with calendar
+    if the file doesn't say which calendar it uses """
+    def _preprocess(ds):
+        for var in ds.variables:
+            if ('units' in ds[var].attrs) and ('since' in str(ds[var].attrs['units'])):
+                ds[var].attrs.setdefault('calendar', calendar)
+        return xr.decode_cf(ds)
+    return _preprocess
+
+class Registry:
+    """ Experiments, their files, calendars and variable names, with an LRU of the opened
+    datasets.
+    Args: experiments = {expname: {'files': ..., 'calendar': ..., 'cesm': ..., 'varnames': ...,
+                                   'levname': ...}}, see the top of registry_utils.py
+          basepath = filled in for {basepath} in the globs
+          maxopen = maximum number of file sets kept open
+    """
+
+    def __init__(self, experiments=None, basepath="", maxopen=16):
+        self.basepath = basepath
+        self.maxopen = maxopen
+        self.experiments = OrderedDict()
+        self._open = OrderedDict()
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        for name in (experiments or {}):
+            self.add(name, **experiments[name])
+
+    @classmethod
+    def from_yaml(cls, path, maxopen=16):
+        """ Registry from a YAML manifest """
+        import yaml
+
+        with open(path) as f:
+            manifest = yaml.safe_load(f)
+        if (manifest is None) or ('experiments' not in manifest):
+            raise ValueError("no experiments in the manifest "+str(path))
+        return cls(manifest['experiments'], basepath=manifest.get('basepath', ""), maxopen=maxopen)
+
+    def add(self, name, files, **kwargs):
+        """ add (or replace) an experiment.  kwargs = calendar, cesm, varnames, levname """
+        unknown = set(kwargs) - set(_defaults)
+        if unknown:
+            raise ValueError("unknown experiment settings "+str(sorted(unknown))+" for "+name)
+        exp = dict(_defaults, files=files, **kwargs)
+        exp['varnames'] = dict(exp['varnames'] or {})
+        self.experiments[name] = exp
+
+    @property
+    def names(self):
+        """ the experiment names in the order of the manifest """
+        return list(self.experiments)
+
+    def __iter__(self):
+        return iter(self.experiments)
+
+    def __contains__(self, name):
+        return name in self.experiments
+
+    def __getitem__(self, name):
+        if name not in self.experiments:
+            raise KeyError("experiment "+str(name)+" isn't in the registry, it has "+str(self.names))
+        return self.experiments[name]
+
+    def filevar(self, name, var):
+        """ name of the variable var in the files of experiment name """
+        return self[name]['varnames'].get(var, var)
+
+    def files(self, name, var=None):
+        """ the glob for variable var (in the names used here) of experiment name """
+        files = self[name]['files']
+        if isinstance(files, dict):
+            if var not in files:
+                raise KeyError("no files for "+str(var)+" in experiment "+name+", only "+str(sorted(files)))
+            files = files[var]
+        filevar = "" if (var is None) else self.filevar(name, var)
+        return files.format(basepath=self.basepath, name=name, var=filevar)
+
+    def _opendataset(self, name, pattern):
+        exp = self[name]
+        kwargs = {'coords': 'minimal', 'join': 'override'}
+        if (exp['calendar'] is not None):
+            kwargs.update(decode_times=False, preprocess=_setcalendar(exp['calendar']))
+        dat = xr.open_mfdataset(pattern, **kwargs)
+
+        if exp['cesm']:
+            try:
+                dat['time'] = read.time_bnds_midpoint(dat)
+            except KeyError:
+                print("warning, "+name+" is set up as CESM data but there's no time_bnds")
+                print("make sure you're reading in what you're expecting to")
+        return dat
+
+    @profiled
+    def open(self, name, var=None):
+        """ the lazily opened dataset for variable var of experiment name (all the variables
+        in the files if the files aren't per variable), with the variables renamed from the
+        names in the files to the names used here.  Comes from the LRU if it's open already.
+        """
+        pattern = self.files(name, var)
+        key = (name, pattern)
+        with self._lock:
+            if key in self._open:
+                self.hits += 1
+                self._open.move_to_end(key)
+                dat = self._open[key]
+            else:
+                self.misses += 1
+                dat = self._opendataset(name, pattern)
+                self._open[key] = dat
+                # evicted datasets aren't closed as they may still be in use, xarray closes
+                # the files when they are no longer referenced
+                while len(self._open) > self.maxopen:
+                    self._open.popitem(last=False)
+
+        rename = {filevar: var for var, filevar in self[name]['varnames'].items()
+                  if filevar in dat.variables and filevar != var}
+        return dat.rename(rename) if rename else dat
+
+    @profiled
+    def get(self, name, var, timeslice=None, zonalmean=False):
+        """ variable var of experiment name as a lazy DataArray
+        Input: timeslice = optional slice of times e.g. slice("1979-01", "1989-12")
+               zonalmean = average over lon
+        """
+        dat = self.open(name, var)[var]
+        if (timeslice is not None):
+            dat = dat.sel(time=timeslice)
+        if zonalmean and ('lon' in dat.dims):
+            dat = dat.mean('lon')
+        return dat
+
+    @profiled
+    def get_experiments(self, var, names=None, timeslice=None, zonalmean=False):
+        """ {expname: DataArray} of var for the experiments in names (default all of them) """
+        names = self.names if (names is None) else names
+        return OrderedDict((name, self.get(name, var, timeslice=timeslice, zonalmean=zonalmean))
+                           for name in names)
+
+    def cache_info(self):
+        """ hits, misses and the number of file sets currently open """
+        return {'hits': self.hits, 'misses': self.misses, 'open': len(self._open), 'maxopen': self.maxopen}
+
+    def close(self):
+        """ close all the open datasets and empty the LRU """
+        with self._lock:
+            while self._open:
+                self._open.popitem()[1].close()
+
+@profiled
+def load_manifest(path, maxopen=16):
+    """ Registry from a YAML manifest, see the top of registry_utils.py """
+    return Registry.from_yaml(path, maxopen=maxopen)
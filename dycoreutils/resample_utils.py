@@ -0,0 +1,115 @@
+# Bootstrap resampling for significance testing of experiment minus reference differences.
+#
+# Resamples are represented as a (nboot, nsample) matrix of the number of times each
+# sample is drawn, so the resampled means for all nboot resamples are one matmul.
+# The matrices are drawn once up front from a seeded random number generator, which
+# makes the results reproducible however the data are chunked.  Dask backed data are
+# processed chunk by chunk (in parallel) over all dimensions other than the ones resampled.
+
+import xarray as xr
+import numpy as np
+from dycoreutils.profile_utils import profiled
+
+@profiled
+def resample_weights(nsample, nboot=1000, seed=0, rng=None):
+    """ (nboot, nsample) counts for nboot resamples of nsample samples with replacement """
+    if (rng is None):
+        rng = np.random.default_rng(seed)
+    draws = rng.integers(0, nsample, size=(nboot, nsample))
+    flat = (np.arange(nboot)[:,None]*nsample + draws).ravel()
+    weights = np.bincount(flat, minlength=nboot*nsample).reshape(nboot, nsample)
+    return weights
+
+@profiled
+def block_resample_weights(nyear, nday, blocklen, nboot=1000, seed=0, rng=None):
+    """ (nboot, nyear*nday) counts for a moving block bootstrap of (year, day) data, e.g.
+    from calendar_utils.group_season_daily.  Each resample is made up of blocks of blocklen
+    consecutive days, each from a random year and start day, with blocks kept within a season.
+    """
+    if (rng is None):
+        rng = np.random.default_rng(seed)
+    if (blocklen > nday):
+        raise ValueError("blocklen ("+str(blocklen)+") is longer than the season ("+str(nday)+" days)")
+
+    nblocks = int(np.ceil(nyear*nday/blocklen))
+    years = rng.integers(0, nyear, size=(nboot, nblocks))
+    starts = rng.integers(0, nday-blocklen+1, size=(nboot, nblocks))
+
+    # (nboot, nblocks*blocklen) flattened (year, day) indices, trimmed to the record length
+    idx = (years*nday + starts)[:,:,None] + np.arange(blocklen)[None,None,:]
+    idx = idx.reshape(nboot, nblocks*blocklen)[:,0:nyear*nday]
+
+    flat = (np.arange(nboot)[:,None]*nyear*nday + idx).ravel()
+    weights = np.bincount(flat, minlength=nboot*nyear*nday).reshape(nboot, nyear*nday)
+    return weights
+
+@profiled
+def weighted_means(dat, weights):
+    """ resampled means of (..., sample) data for (nboot, sample) weights, ignoring NaNs.
+    Output: (..., nboot)
+    """
+    valid = np.isfinite(dat)
+    sums = np.tensordot(np.where(valid, dat, 0.), weights, axes=([-1],[1]))
+    counts = np.tensordot(valid.astype(float), weights, axes=([-1],[1]))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        means = sums/counts
+    return means
+
+def _boot_diff(expdat, refdat, wexp, wref, quantiles):
+    diffs = weighted_means(expdat, wexp) - weighted_means(refdat, wref)
+    return np.moveaxis(np.nanquantile(diffs, quantiles, axis=-1), 0, -1)
+
+def _stack_samples(dat, blocklen):
+    """ put the resampled dimensions into a single trailing 'sample' dimension """
+    if ('day' in dat.dims) and (blocklen is None):
+        # resampling whole seasons, so only the seasonal means are needed
+        dat = dat.mean('day')
+    if ('day' in dat.dims):
+        dat = dat.stack(sample=['year', 'day']).drop_vars(['sample', 'year', 'day'])
+    else:
+        dat = dat.rename({'year': 'sample'})
+    if dat.chunks is not None:
+        dat = dat.chunk({'sample': -1})
+    return dat
+
+@profiled
+def bootstrap_diff(exp, ref, nboot=1000, blocklen=None, siglevel=0.05, seed=0):
+    """ Bootstrap significance of the difference in means between an experiment and a reference.
+    Input: exp, ref = (year, ...) seasonal means or (year, day, ...) daily data from
+                      calendar_utils.group_season_daily, on the same grid.  The number
+                      of years can differ.
+           nboot = number of resamples
+           blocklen = if None, whole years (seasons) are resampled.  Otherwise daily data
+                      are resampled in blocks of blocklen days (block bootstrap) to account
+                      for autocorrelation
+           siglevel = two sided significance level
+           seed = random number seed
+    Output: xarray.Dataset with the difference in means, the lower and upper bounds of its
+            confidence interval and a mask that is True where the interval excludes zero
+    """
+    rng = np.random.default_rng(seed)
+    quantiles = [siglevel/2., 1.-siglevel/2.]
+
+    if (blocklen is None):
+        wexp = resample_weights(exp.year.size, nboot=nboot, rng=rng)
+        wref = resample_weights(ref.year.size, nboot=nboot, rng=rng)
+    else:
+        wexp = block_resample_weights(exp.year.size, exp.day.size, blocklen, nboot=nboot, rng=rng)
+        wref = block_resample_weights(ref.year.size, ref.day.size, blocklen, nboot=nboot, rng=rng)
+
+    expdat = _stack_samples(exp, blocklen)
+    refdat = _stack_samples(ref, blocklen)
+
+    bounds = xr.apply_ufunc(_boot_diff, expdat, refdat,
+                            kwargs={'wexp': wexp, 'wref': wref, 'quantiles': quantiles},
+                            input_core_dims=[['sample'], ['sample']], output_core_dims=[['quantile']],
+                            exclude_dims={'sample'}, dask='parallelized', output_dtypes=[float],
+                            dask_gufunc_kwargs={'output_sizes': {'quantile': 2}})
+    lower = bounds.isel(quantile=0, drop=True)
+    upper = bounds.isel(quantile=1, drop=True)
+
+    diff = expdat.mean('sample') - refdat.mean('sample')
+    boot = xr.Dataset({'diff': diff, 'lower': lower, 'upper': upper,
+                       'sig': (lower > 0) | (upper < 0)})
+
+    return boot
@@ -1,9 +1,31 @@
+from functools import lru_cache
+
 import xarray as xr
 import numpy as np
+from dycoreutils.profile_utils import profiled
+
+@lru_cache(maxsize=None)
+def _latweights(latbytes, lat1, lat2):
+    lat = np.frombuffer(latbytes)
+    weights = np.where((lat >= lat1) & (lat <= lat2), np.cos(np.deg2rad(lat)), 0.)
+    weights = weights/weights.sum()
+    weights.flags.writeable = False
+    return weights
+
+def latweights(lat, lat1, lat2):
+    """ normalized cos(lat) weights for the average over lat1 to lat2, zero outside it,
+    cached on the latitudes so they're only computed once per grid and region.
+    Averaging is then a weighted sum over lat e.g. (darray*weights).sum('lat')
+    Output: xarray.DataArray (lat)
+    """
+    latvals = np.ascontiguousarray(lat, dtype='float64')
+    weights = _latweights(latvals.tobytes(), float(lat1), float(lat2))
+    return xr.DataArray(weights, coords=[('lat', latvals)])
 
+@profiled
 def cosweightlat(darray, lat1, lat2):
     """Calculate the weighted average for an [:,lat] array over the region
-    lat1 to lat2
+    lat1 to lat2.  Any other dimensions (time, member, ...) are kept
     """
 
     # flip latitudes if they are decreasing
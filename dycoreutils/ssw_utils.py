@@ -1,11 +1,11 @@
 # Utilities to calculate SSW dates
 import xarray as xr
 import numpy as np
-import matplotlib.pyplot as plt
 
-from scipy.ndimage import label
 from math import nan
+from dycoreutils.profile_utils import profiled
 
+@profiled
 def getseason_ndjfma(dat):
     """
     pull out the November to April seasons omitting the J-A of the first year and 
@@ -35,11 +35,13 @@ def getseason_ndjfma(dat):
     
     return datseas
 
+@profiled
 def ssw_cp(dat):
     """
     Obtain the SSW dates following the Charlton and Polvani criterion
     Input: dat = 10hPa, 60N, daily zonal mean zonal wind.
     """
+    from scipy.ndimage import label
 
     # get the November - April season
     datseas = getseason_ndjfma(dat)
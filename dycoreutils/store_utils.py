@@ -0,0 +1,150 @@
+# routines for writing and reading derived products (TEM diagnostics, zonal means, ...)
+# as chunked Zarr stores.
+#
+# Each store holds two copies of the data in groups with different chunking:
+#     timeseries: the whole time axis in one chunk and small spatial chunks, so
+#                 extracting the time series at a point reads one small chunk per variable
+#     snapshot:   a few time steps per chunk and the whole (pre, lat) grid, so maps and
+#                 profiles at a given time only read the chunks for those times
+# The metadata of each group is consolidated so opening a store is a single read.
+# zarr is only needed when these routines are used.
+#
+# For single netcdf4 files with variables stored contiguously and uncompressed (the
+# default when xarray writes a dataset without unlimited dimensions) open_memmap maps
+# the variables straight from the file with numpy.memmap at the offsets given by h5py,
+# so points and slabs are views into the file rather than decoded copies.
+
+import os
+from functools import lru_cache
+
+import numpy as np
+import xarray as xr
+from dycoreutils.profile_utils import profiled
+
+layouts = ['timeseries', 'snapshot']
+
+# encoding that is kept from the source files.  The rest (chunksizes, zlib, ...) is
+# netcdf specific and would conflict with the zarr chunking
+_keepencoding = ['units', 'calendar', 'dtype', '_FillValue', 'scale_factor', 'add_offset']
+
+def chunk_layout(dat, layout, pointchunk=4, snapchunk=30):
+    """ chunk sizes for each dimension of dat for one of the layouts
+    Args: dat (xarray.Dataset or DataArray) with a time dimension
+          layout = 'timeseries' or 'snapshot'
+          pointchunk = size of the chunks along the non-time dimensions for 'timeseries'
+          snapchunk = number of time steps per chunk for 'snapshot'
+    """
+    if (layout == 'timeseries'):
+        return {dim: (-1 if (dim == 'time') else min(pointchunk, dat.sizes[dim])) for dim in dat.dims}
+    if (layout == 'snapshot'):
+        return {dim: (min(snapchunk, dat.sizes[dim]) if (dim == 'time') else -1) for dim in dat.dims}
+    raise ValueError("unknown layout "+str(layout)+", use one of "+str(layouts))
+
+@profiled
+def write_zarr(dat, path, layouts=layouts, pointchunk=4, snapchunk=30):
+    """ Write a dataset to a Zarr store with one group per layout (see chunk_layout).
+    An existing group of the same name is overwritten.
+    Input: dat = xarray.Dataset (or DataArray) with a time dimension, e.g. from tem_utils.calc_tem
+           path = path of the store, e.g. outdir+expname+".zarr"
+           layouts = which of 'timeseries' and 'snapshot' to write
+           pointchunk, snapchunk = see chunk_layout
+    """
+    if isinstance(dat, xr.DataArray):
+        dat = dat.to_dataset()
+
+    dat = dat.copy()
+    for var in dat.variables:
+        dat[var].encoding = {key: val for key, val in dat[var].encoding.items() if key in _keepencoding}
+
+    for layout in layouts:
+        chunked = dat.chunk(chunk_layout(dat, layout, pointchunk=pointchunk, snapchunk=snapchunk))
+        chunked.to_zarr(path, group=layout, mode='w', consolidated=True)
+
+@profiled
+def open_zarr(path, layout='snapshot'):
+    """ Open one layout of a store written by write_zarr, lazily.
+    Use layout='timeseries' for anything that works on time series at a few points
+    (e.g. pdf_utils.point_pdfs) and 'snapshot' for maps, profiles and time means.
+    """
+    if layout not in layouts:
+        raise ValueError("unknown layout "+str(layout)+", use one of "+str(layouts))
+    return xr.open_zarr(path, group=layout, consolidated=True)
+
+@profiled
+def point_timeseries(path, lats, pres, varnames=None, prename="pre"):
+    """ Read the time series at a list of (lat, pre) points (nearest grid points) from
+    the timeseries layout of a store.  Only the chunks containing the points are read.
+    Args: path = path of the store
+          lats, pres (lists) = latitudes and pressures of the points
+          varnames (list) = variables to read (default all)
+          prename = name of the pressure coordinate
+    Output: xarray.Dataset with dimensions (time, point)
+    """
+    dat = open_zarr(path, layout='timeseries')
+    if (varnames is not None):
+        dat = dat[varnames]
+
+    points = dat.sel({'lat': xr.DataArray(np.array(lats), dims='point'),
+                      prename: xr.DataArray(np.array(pres), dims='point')}, method='nearest')
+
+    return points.transpose('time', 'point', ...).load()
+
+def _contiguous_offsets(path, varnames):
+    """ (offset, dtype, shape) in the file of each of varnames, which have to be stored
+    contiguously, uncompressed and without packing """
+    import h5py
+
+    offsets = {}
+    with h5py.File(path, 'r') as f:
+        for var in varnames:
+            dset = f[var]
+            offset = dset.id.get_offset()
+            packed = ('scale_factor' in dset.attrs) or ('add_offset' in dset.attrs)
+            if (dset.chunks is not None) or (offset is None) or packed:
+                raise ValueError(var+" in "+path+" is chunked, compressed or packed so can't be "
+                                 "memory mapped, read it with xarray instead")
+            offsets[var] = (offset, dset.dtype, dset.shape)
+    return offsets
+
+@lru_cache(maxsize=16)
+def _open_memmap(path, mtime, varnames):
+    with xr.open_dataset(path) as dat:
+        varnames = list(dat.data_vars) if (varnames is None) else list(varnames)
+        coords = dat.coords.to_dataset().load()
+        dims = {var: dat[var].dims for var in varnames}
+        attrs = {var: dat[var].attrs for var in varnames}
+
+    offsets = _contiguous_offsets(path, varnames)
+    mapped = xr.Dataset(coords=coords.coords)
+    for var in varnames:
+        offset, dtype, shape = offsets[var]
+        data = np.memmap(path, dtype=dtype, mode='r', offset=offset, shape=shape)
+        mapped[var] = xr.DataArray(data, dims=dims[var], attrs=attrs[var])
+    return mapped
+
+@profiled
+def open_memmap(path, varnames=None):
+    """ Open the variables of a single netcdf4 file (e.g. the TEM output of an experiment)
+    as read only memory maps.  Indexing with integers and slices (isel, or sel of single
+    points and slices) then gives views into the file with nothing read until the values
+    are used.  The coordinates are decoded as usual.
+    Cached on the path and modification time, so calling it again is free.
+    Args: path = netcdf4 file with the variables stored contiguously and uncompressed,
+                 otherwise a ValueError is raised and xarray should be used instead
+          varnames (list) = variables to map (default all)
+    Output: xarray.Dataset backed by numpy.memmap.  Fill values are not masked.
+    """
+    varnames = None if (varnames is None) else tuple(varnames)
+    return _open_memmap(os.path.abspath(path), os.path.getmtime(path), varnames)
+
+@profiled
+def memmap_points(path, lats, pres, varnames=None, prename="pre"):
+    """ The time series at a list of (lat, pre) points (nearest grid points) from
+    open_memmap, as views into the file.
+    Args: path, varnames = see open_memmap
+          lats, pres (lists) = latitudes and pressures of the points
+          prename = name of the pressure coordinate
+    Output: list of xarray.Dataset (time), one for each point
+    """
+    dat = open_memmap(path, varnames=varnames)
+    return [dat.sel({'lat': lat, prename: pre}, method='nearest') for lat, pre in zip(lats, pres)]
@@ -0,0 +1,272 @@
+# Out-of-core climatologies: streaming (Welford) accumulators of the count, mean and sum
+# of squared deviations (M2), and optionally a histogram, for each calendar month.
+#
+# The data are consumed one time chunk at a time from any reader (time_blocks of a
+# lazy DataArray, one file at a time, ...) so only one chunk is ever in memory, and the
+# monthly, seasonal and annual statistics all come from the same single pass: the
+# seasons and the whole year are made by merging the monthly moments (Chan et al.
+# 1979), which gives the same answer as reducing the masked data directly.  Two
+# accumulators over different times (files, processes) are merged the same way.
+#
+# Accumulator does the same without the calendar, for samples of the same shape such as
+# the members of an ensemble added one at a time (see calendar_utils.ensemble_reduce).
+#
+# Every time step counts equally, so for monthly mean data the seasonal means aren't
+# weighted by the days per month as in calendar_utils.season_mean.
+
+import numpy as np
+import xarray as xr
+from dycoreutils.profile_utils import profiled
+
+seasons = {'DJF': [12, 1, 2], 'MAM': [3, 4, 5], 'JJA': [6, 7, 8], 'SON': [9, 10, 11]}
+
+def _merge_moments(na, ma, m2a, nb, mb, m2b):
+    """ count, mean and M2 of two sets of samples combined (arrays, NaN free) """
+    n = na + nb
+    with np.errstate(invalid='ignore', divide='ignore'):
+        frac = np.where(n > 0, nb/n, 0.)
+    delta = mb - ma
+    return n, ma + delta*frac, m2a + m2b + delta**2*na*frac
+
+def _block_moments(block):
+    """ count, mean and M2 along the first axis, ignoring NaNs (mean and M2 are 0 where
+    there are no values) """
+    valid = ~np.isnan(block)
+    n = valid.sum(axis=0)
+    block = np.where(valid, block, 0.)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = np.where(n > 0, block.sum(axis=0)/n, 0.)
+    m2 = np.sum(np.where(valid, (block - mean)**2, 0.), axis=0)
+    return n, mean, m2
+
+class SeasonalAccumulator:
+    """ Streaming count, mean, M2 (and optionally histogram) for each calendar month of
+    (time, ...) data, from which the monthly, seasonal and annual statistics follow.
+    Args: bins = optional bin edges for a histogram at every point, e.g.
+                 np.arange(binmin, binmax, binint) as for pdf_utils.point_pdfs
+    Use update() for each time chunk, merge() to combine accumulators and monthly(),
+    seasonal() or annual() for the results.
+    """
+
+    def __init__(self, bins=None):
+        self.bins = None if (bins is None) else np.asarray(bins, dtype='float64')
+        self.count = None
+        self.mean = None
+        self.m2 = None
+        self.hist = None
+        self.dims = None
+        self.coords = None
+
+    def _start(self, chunk):
+        shape = (12,) + chunk.shape[1:]
+        self.count = np.zeros(shape, dtype='int64')
+        self.mean = np.zeros(shape, dtype='float64')
+        self.m2 = np.zeros(shape, dtype='float64')
+        if (self.bins is not None):
+            self.hist = np.zeros(shape+(self.bins.size-1,), dtype='int64')
+        self.dims = chunk.dims[1:]
+        self.coords = {name: coord for name, coord in chunk.coords.items() if 'time' not in coord.dims}
+
+    def _histogram(self, block):
+        """ bin counts (..., nbins) of the (time, ...) block, with the same bins as np.histogram """
+        nbins = self.bins.size - 1
+        npoints = int(np.prod(block.shape[1:]))
+        block = block.reshape(block.shape[0], npoints)
+
+        binidx = np.searchsorted(self.bins, block, side="right") - 1
+        binidx[block == self.bins[-1]] = nbins - 1
+        valid = (binidx >= 0) & (binidx < nbins) & ~np.isnan(block)
+
+        flatidx = np.arange(npoints)[None,:]*nbins + binidx
+        counts = np.bincount(flatidx[valid], minlength=npoints*nbins)
+        return counts.reshape(self.hist.shape[1:])
+
+    @profiled
+    def update(self, chunk):
+        """ add a time chunk, an xarray.DataArray with a time dimension, to the statistics """
+        chunk = chunk.transpose('time', ...)
+        if (self.count is None):
+            self._start(chunk)
+        elif (chunk.shape[1:] != self.count.shape[1:]):
+            raise ValueError("chunk has shape "+str(chunk.shape[1:])+" away from time, expected "
+                             +str(self.count.shape[1:]))
+
+        data = np.asarray(chunk, dtype='float64')
+        month = np.asarray(chunk['time.month'])
+        for imon in np.unique(month):
+            block = data[month == imon]
+            i = imon - 1
+            self.count[i], self.mean[i], self.m2[i] = _merge_moments(self.count[i], self.mean[i], self.m2[i],
+                                                                     *_block_moments(block))
+            if (self.hist is not None):
+                self.hist[i] += self._histogram(block)
+        return self
+
+    @profiled
+    def merge(self, other):
+        """ combine the statistics of another accumulator (e.g. from other files or
+        another process) into this one.  Both need the same histogram bins, or none """
+        if (other.count is None):
+            return self
+        if (self.bins is None) != (other.bins is None):
+            raise ValueError("can't merge an accumulator with a histogram and one without")
+        if (self.bins is not None) and not np.array_equal(self.bins, other.bins):
+            raise ValueError("can't merge accumulators with different histogram bins")
+        if (self.count is None):
+            self.dims, self.coords = other.dims, other.coords
+            self.count, self.mean, self.m2 = other.count.copy(), other.mean.copy(), other.m2.copy()
+            self.hist = None if (other.hist is None) else other.hist.copy()
+            return self
+
+        if (other.count.shape != self.count.shape):
+            raise ValueError("can't merge accumulators with shapes "+str(self.count.shape[1:])+" and "
+                             +str(other.count.shape[1:]))
+        self.count, self.mean, self.m2 = _merge_moments(self.count, self.mean, self.m2,
+                                                        other.count, other.mean, other.m2)
+        if (self.hist is not None):
+            self.hist = self.hist + other.hist
+        return self
+
+    def _groups(self, groups, dimname, ddof):
+        """ statistics for each group of months {name: [months]} """
+        if (self.count is None):
+            raise ValueError("no data have been added to the accumulator")
+
+        stats = {'count': [], 'mean': [], 'm2': [], 'hist': []}
+        for months in groups.values():
+            n, mean, m2 = self.count[months[0]-1], self.mean[months[0]-1], self.m2[months[0]-1]
+            for imon in months[1:]:
+                n, mean, m2 = _merge_moments(n, mean, m2, self.count[imon-1], self.mean[imon-1], self.m2[imon-1])
+            stats['count'].append(n)
+            stats['mean'].append(mean)
+            stats['m2'].append(m2)
+            if (self.hist is not None):
+                stats['hist'].append(sum(self.hist[imon-1] for imon in months))
+
+        count = np.stack(stats['count'])
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = np.where(count > 0, np.stack(stats['mean']), np.nan)
+            var = np.where(count > ddof, np.stack(stats['m2'])/(count - ddof), np.nan)
+
+        dims = (dimname,) + self.dims
+        coords = dict(self.coords)
+        coords[dimname] = list(groups)
+        out = xr.Dataset({'mean': (dims, mean), 'std': (dims, np.sqrt(var)), 'var': (dims, var),
+                          'count': (dims, count)}, coords=coords)
+        if (self.hist is not None):
+            out['hist'] = xr.DataArray(np.stack(stats['hist']), dims=dims+('bin',))
+            out = out.assign_coords(bin=self.bins[0:-1])
+        return out
+
+    @profiled
+    def monthly(self, ddof=0):
+        """ monthly climatology: xarray.Dataset of mean, std, var, count (and hist) with a
+        month dimension.  ddof = delta degrees of freedom of the variance, 0 as in xarray """
+        return self._groups({imon: [imon] for imon in range(1, 13)}, 'month', ddof)
+
+    @profiled
+    def seasonal(self, ddof=0, seasonlist=('DJF', 'MAM', 'JJA', 'SON')):
+        """ seasonal statistics as for monthly, with a season dimension.  DJF is every
+        December, January and February as with groupby('time.season') """
+        return self._groups({season: seasons[season] for season in seasonlist}, 'season', ddof)
+
+    @profiled
+    def annual(self, ddof=0):
+        """ statistics over all times as for monthly, without the month dimension """
+        return self._groups({'all': list(range(1, 13))}, 'group', ddof).isel(group=0, drop=True)
+
+class Accumulator:
+    """ Streaming count, mean and M2 at every point of samples of the same shape, e.g. a
+    reduction of each member of an ensemble.  update() adds a sample, or a block of
+    samples along a dimension, merge() combines accumulators and result() gives the
+    statistics.
+    """
+
+    def __init__(self):
+        self.count = None
+        self.mean = None
+        self.m2 = None
+        self.dims = None
+        self.coords = None
+
+    @profiled
+    def update(self, sample, dim=None):
+        """ add a sample (xarray.DataArray), or all the samples along its dimension dim """
+        if (dim is None):
+            sample = sample.expand_dims('_sample')
+            dim = '_sample'
+        sample = sample.transpose(dim, ...)
+
+        if (self.count is None):
+            shape = sample.shape[1:]
+            self.count = np.zeros(shape, dtype='int64')
+            self.mean = np.zeros(shape, dtype='float64')
+            self.m2 = np.zeros(shape, dtype='float64')
+            self.dims = sample.dims[1:]
+            self.coords = {name: coord for name, coord in sample.coords.items() if dim not in coord.dims}
+        elif (sample.shape[1:] != self.count.shape):
+            raise ValueError("sample has shape "+str(sample.shape[1:])+", expected "+str(self.count.shape))
+
+        self.count, self.mean, self.m2 = _merge_moments(self.count, self.mean, self.m2,
+                                                        *_block_moments(np.asarray(sample, dtype='float64')))
+        return self
+
+    @profiled
+    def merge(self, other):
+        """ combine the statistics of another accumulator into this one """
+        if (other.count is None):
+            return self
+        if (self.count is None):
+            self.dims, self.coords = other.dims, other.coords
+            self.count, self.mean, self.m2 = other.count.copy(), other.mean.copy(), other.m2.copy()
+            return self
+        if (other.count.shape != self.count.shape):
+            raise ValueError("can't merge accumulators with shapes "+str(self.count.shape)+" and "
+                             +str(other.count.shape))
+        self.count, self.mean, self.m2 = _merge_moments(self.count, self.mean, self.m2,
+                                                        other.count, other.mean, other.m2)
+        return self
+
+    def result(self, ddof=1):
+        """ xarray.Dataset of mean, std, var and count.  ddof = delta degrees of freedom
+        of the variance, 1 (the sample variance) by default """
+        if (self.count is None):
+            raise ValueError("no data have been added to the accumulator")
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = np.where(self.count > 0, self.mean, np.nan)
+            var = np.where(self.count > ddof, self.m2/(self.count - ddof), np.nan)
+        return xr.Dataset({'mean': (self.dims, mean), 'std': (self.dims, np.sqrt(var)),
+                           'var': (self.dims, var), 'count': (self.dims, self.count)},
+                          coords=self.coords)
+
+def time_blocks(darray, tchunk=3650):
+    """ blocks of tchunk time steps of darray, loaded one at a time """
+    for tbeg in range(0, darray.time.size, tchunk):
+        yield darray.isel(time=slice(tbeg, tbeg+tchunk)).load()
+
+@profiled
+def accumulate(chunks, bins=None):
+    """ SeasonalAccumulator of an iterable of time chunks (xarray.DataArray), e.g.
+    time_blocks(darray) or the files of an experiment read one at a time """
+    acc = SeasonalAccumulator(bins=bins)
+    for chunk in chunks:
+        acc.update(chunk)
+    return acc
+
+@profiled
+def merge_accumulators(accs):
+    """ one SeasonalAccumulator combining a list of them (e.g. one per file or process),
+    which all need the same histogram bins (or none) """
+    accs = list(accs)
+    merged = SeasonalAccumulator(bins=accs[0].bins if accs else None)
+    for acc in accs:
+        merged.merge(acc)
+    return merged
+
+@profiled
+def stream_stats(darray, tchunk=3650, bins=None):
+    """ monthly and seasonal statistics of (time, ...) data in one pass, reading tchunk
+    time steps at a time so that dask backed data are never all in memory.
+    Output: SeasonalAccumulator, see monthly(), seasonal() and annual()
+    """
+    return accumulate(time_blocks(darray, tchunk=tchunk), bins=bins)
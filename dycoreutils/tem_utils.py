@@ -0,0 +1,275 @@
+# Transformed Eulerian Mean (TEM) diagnostics following the DynVarMIP definitions
+# (Gerber and Manzini 2016, appendix A).
+# Input is zonal mean fluxes Uzm, THzm, VTHzm, Vzm, UVzm, UWzm, Wzm as output by ctem.F90
+# for the FV dycore.  Note that the E-P fluxes are calculated on whatever levels the
+# input is on, which is ok in the stratosphere but not in the troposphere for model levels.
+
+import threading
+import warnings
+
+import xarray as xr
+import numpy as np
+from dycoreutils.profile_utils import profiled
+from dycoreutils.precision_utils import get_precision
+from dycoreutils import operator_utils as ops
+
+# constants for the TEM calculations
+p0=101325.
+a=6.371e6
+om=7.29212e-5
+H=7000.
+g0=9.80665
+
+temattrs = {'uzm': {'long_name':'zonal mean zonal wind', 'units':'m/s'},
+            'epfy': {'long_name':'northward component of E-P flux', 'units':'m3/s2'},
+            'epfz': {'long_name':'upward component of E-P flux', 'units':'m2/s2'},
+            'vtem': {'long_name':'Transformed Eulerian mean northward wind', 'units':'m/s'},
+            'wtem': {'long_name':'Transformed Eulerian mean upward wind','units':',/s'},
+            'psitem': {'long_name':'Transformed Eulerian mean mass stream function','units':'kg/s'},
+            'utendepfd': {'long_name':'tendency of eastward wind due to Eliassen-Palm flux divergence',
+                          'units':'m/s2'},
+            'utendvtem': {'long_name':'tendency of eastward wind due to TEM northward wind advection and the coriolis term',
+                          'units':'m/s2'},
+            'utendwtem': {'long_name':'tendency of eastward wind due to TEM upward wind advection','units':'m/s2'}}
+
+fluxnames = ['Uzm', 'THzm', 'VTHzm', 'Vzm', 'UVzm', 'UWzm', 'Wzm']
+
+def _add_zlogp(tem, prename):
+    """ add the log-pressure height as a coordinate along the pressure dimension """
+    zlogp = xr.DataArray(ops.logp_height(tem[prename]), dims=[prename],
+                         attrs={'long_name': 'log-pressure height', 'units': 'm'})
+    return tem.assign_coords(zlogp=zlogp)
+
+def _calc_tem_lazy(dat, prename, dtype, engine):
+    """ calc_tem applied time chunk by time chunk to dask backed fluxes """
+    fluxes = dat[fluxnames].chunk({prename: -1, 'lat': -1})
+    template = xr.Dataset({name: xr.DataArray(fluxes.Uzm.data.astype(dtype), coords=fluxes.Uzm.coords,
+                                              attrs=temattrs[name]) for name in temattrs})
+    template = _add_zlogp(template, prename)
+    if (engine == 'numba'):
+        _start_numba_threads()
+    return xr.map_blocks(calc_tem, fluxes, kwargs={'prename': prename, 'dtype': dtype, 'engine': engine},
+                         template=template)
+
+def _tem_numpy(uzm, thzm, vthzm, vzm, uvzm, uwzm, wzm, pre, latrad, f):
+    """ TEM diagnostics with numpy.  The derivatives and the stream function integral are
+    matmuls with the operator matrices for the grid (see operator_utils), which are
+    cached so they're only built once per grid.
+    """
+    dtype = uzm.dtype
+    ddp = ops.gradient_matrix(pre*100.)
+    ddphi = ops.gradient_matrix(latrad)
+    intp = ops.cumtrapz_matrix(pre*100.)
+
+    # (pre, 1) and (lat) arrays that broadcast against (time, pre, lat)
+    prepa = (pre*100.)[:,None]
+    coslat = np.cos(latrad)
+    acoslat = a*coslat
+
+    # convert w terms from m/s to Pa/s
+    uwzm = -1.*uwzm*prepa/H
+    wzm = -1.*wzm*prepa/H
+
+    # compute the latitudinal gradient of U
+    dudphi = ops.apply_operator(ddphi, uzm*coslat, 2)/acoslat
+
+    # compute the vertical gradient of theta and u
+    dthdp = ops.apply_operator(ddp, thzm, 1)
+    dudp = ops.apply_operator(ddp, uzm, 1)
+
+    # compute eddy streamfunction and its vertical gradient
+    psieddy = vthzm/dthdp
+    dpsidp = ops.apply_operator(ddp, psieddy, 1)
+
+    # (1/acos(phii))**d(psi*cosphi/dphi) for getting w*
+    dpsidy = ops.apply_operator(ddphi, psieddy*coslat, 2)/acoslat
+
+    # TEM vertical velocity (Eq A7 of dynvarmip)
+    wtem = wzm+dpsidy
+
+    # utendwtem (Eq A10 of dynvarmip)
+    utendwtem = -1.*wtem*dudp
+
+    # vtem (Eq A6 of dynvarmip)
+    vtem = vzm-dpsidp
+
+    # utendvtem (Eq A9 of dynvarmip)
+    utendvtem = vtem*(f - dudphi)
+
+    # calculate E-P fluxes
+    epfy = acoslat*(dudp*psieddy - uvzm) # A2
+    epfz = acoslat*( (f-dudphi)*psieddy - uwzm) # A3
+
+    # calculate E-P flux divergence and zonal wind tendency due to resolved waves (A5)
+    depfydphi = ops.apply_operator(ddphi, epfy*coslat, 2)/acoslat
+    depfzdp = ops.apply_operator(ddp, epfz, 1)
+    utendepfd = (depfydphi + depfzdp)/acoslat
+
+    # TEM stream function, Eq (A8), integrated from the top (p=0) in float64 whatever the precision
+    intv = ops.apply_operator(intp, vzm, 1).astype(dtype)
+    psitem = (2*np.pi*acoslat/g0)*(intv - psieddy)
+
+    # final scaling of E-P fluxes and divergence to transform to log-pressure
+    epfy = epfy*prepa/p0 # A13
+    epfz = -1.*(H/p0)*epfz # A14
+    wtem = -1.*(H/prepa)*wtem # A16
+
+    temvars = {'uzm': uzm, 'epfy': epfy, 'epfz': epfz, 'vtem': vtem, 'wtem': wtem, 'psitem': psitem,
+               'utendepfd': utendepfd, 'utendvtem': utendvtem, 'utendwtem': utendwtem}
+    return temvars
+
+_kernels = {}
+# the kernel is parallel over time already, and numba's default (workqueue) threading
+# layer can't run parallel kernels from several threads at once e.g. dask's threads
+_kernellock = threading.Lock()
+
+def _numba_kernel():
+    """ compile (or load from numba's cache) the fused TEM kernel """
+    if 'tem' in _kernels:
+        return _kernels['tem']
+
+    import numba
+
+    @numba.njit(parallel=True, cache=True)
+    def tem_kernel(uzm, thzm, vthzm, vzm, uvzm, uwzm, wzm, ppa, pidx, pcoef, lidx, lcoef, coslat, f,
+                   epfy, epfz, vtem, wtem, psitem, utendepfd, utendvtem, utendwtem):
+        ntime, npre, nlat = uzm.shape
+        for it in numba.prange(ntime):
+            # (pre, lat) work arrays for one time, small enough to stay in cache
+            dudp = np.empty((npre, nlat), dtype=uzm.dtype)
+            fdudphi = np.empty((npre, nlat), dtype=uzm.dtype)
+            psi = np.empty((npre, nlat), dtype=uzm.dtype)
+            epfyu = np.empty((npre, nlat), dtype=uzm.dtype)
+            epfzu = np.empty((npre, nlat), dtype=uzm.dtype)
+            intv = np.zeros(nlat, dtype=np.float64)
+
+            # pass 1: vertical and meridional gradients of u and theta, eddy stream
+            # function and the stream function integral (in float64) from the top down
+            for k in range(npre):
+                km, kp = pidx[k,0], pidx[k,2]
+                dpint = ppa[k] - ppa[k-1] if (k > 0) else ppa[0]
+                for j in range(nlat):
+                    jm, jp = lidx[j,0], lidx[j,2]
+                    vprev = vzm[it,k-1,j] if (k > 0) else 0.
+                    intv[j] += 0.5*(vprev + vzm[it,k,j])*dpint
+                    dthdp = pcoef[k,0]*thzm[it,km,j] + pcoef[k,1]*thzm[it,k,j] + pcoef[k,2]*thzm[it,kp,j]
+                    dudp[k,j] = pcoef[k,0]*uzm[it,km,j] + pcoef[k,1]*uzm[it,k,j] + pcoef[k,2]*uzm[it,kp,j]
+                    dudphi = (lcoef[j,0]*uzm[it,k,jm]*coslat[jm] + lcoef[j,1]*uzm[it,k,j]*coslat[j] +
+                              lcoef[j,2]*uzm[it,k,jp]*coslat[jp])/(a*coslat[j])
+                    fdudphi[k,j] = f[j] - dudphi
+                    psi[k,j] = vthzm[it,k,j]/dthdp
+                    psitem[it,k,j] = (2.*np.pi*a*coslat[j]/g0)*(intv[j] - psi[k,j])
+
+            # pass 2: gradients of the eddy stream function, residual velocities and E-P fluxes
+            for k in range(npre):
+                km, kp = pidx[k,0], pidx[k,2]
+                for j in range(nlat):
+                    jm, jp = lidx[j,0], lidx[j,2]
+                    dpsidp = pcoef[k,0]*psi[km,j] + pcoef[k,1]*psi[k,j] + pcoef[k,2]*psi[kp,j]
+                    dpsidy = (lcoef[j,0]*psi[k,jm]*coslat[jm] + lcoef[j,1]*psi[k,j]*coslat[j] +
+                              lcoef[j,2]*psi[k,jp]*coslat[jp])/(a*coslat[j])
+                    wt = -1.*wzm[it,k,j]*ppa[k]/H + dpsidy
+                    utendwtem[it,k,j] = -1.*wt*dudp[k,j]
+                    wtem[it,k,j] = -1.*(H/ppa[k])*wt
+                    vt = vzm[it,k,j] - dpsidp
+                    vtem[it,k,j] = vt
+                    utendvtem[it,k,j] = vt*fdudphi[k,j]
+                    epfyu[k,j] = a*coslat[j]*(dudp[k,j]*psi[k,j] - uvzm[it,k,j])
+                    epfzu[k,j] = a*coslat[j]*(fdudphi[k,j]*psi[k,j] + uwzm[it,k,j]*ppa[k]/H)
+
+            # pass 3: E-P flux divergence and the log-pressure scaling of the fluxes
+            for k in range(npre):
+                km, kp = pidx[k,0], pidx[k,2]
+                for j in range(nlat):
+                    jm, jp = lidx[j,0], lidx[j,2]
+                    depfydphi = (lcoef[j,0]*epfyu[k,jm]*coslat[jm] + lcoef[j,1]*epfyu[k,j]*coslat[j] +
+                                 lcoef[j,2]*epfyu[k,jp]*coslat[jp])/(a*coslat[j])
+                    depfzdp = pcoef[k,0]*epfzu[km,j] + pcoef[k,1]*epfzu[k,j] + pcoef[k,2]*epfzu[kp,j]
+                    utendepfd[it,k,j] = (depfydphi + depfzdp)/(a*coslat[j])
+                    epfy[it,k,j] = epfyu[k,j]*ppa[k]/p0
+                    epfz[it,k,j] = -1.*(H/p0)*epfzu[k,j]
+
+    _kernels['tem'] = tem_kernel
+    return tem_kernel
+
+def _tem_numba(uzm, thzm, vthzm, vzm, uvzm, uwzm, wzm, pre, latrad, f):
+    """ TEM diagnostics with the fused numba kernel, all outputs in one pass per time """
+    kernel = _numba_kernel()
+    ppa = pre*100.
+    pidx, pcoef = ops.gradient_coefs(ppa)
+    lidx, lcoef = ops.gradient_coefs(latrad)
+
+    outnames = ['epfy', 'epfz', 'vtem', 'wtem', 'psitem', 'utendepfd', 'utendvtem', 'utendwtem']
+    temvars = {name: np.empty_like(uzm) for name in outnames}
+    with _kernellock:
+        kernel(uzm, thzm, vthzm, vzm, uvzm, uwzm, wzm, ppa, pidx, pcoef, lidx, lcoef, np.cos(latrad), f,
+               *[temvars[name] for name in outnames])
+    temvars['uzm'] = uzm
+    return temvars
+
+def _start_numba_threads():
+    """ Run the kernel once on dummy data from this thread.  numba's thread pool has to be
+    started from the main thread: with the tbb threading layer the interpreter hangs on
+    exit if it's first started from one of dask's threads.
+    """
+    ones = np.ones((1, 2, 2))
+    x = np.array([1., 2.])
+    _tem_numba(ones, ones, ones, ones, ones, ones, ones, x, 0.1*x, x)
+
+def _tem_engine(engine):
+    """ check the engine, numba has to be asked for explicitly and falls back to numpy
+    (with a warning) when numba isn't installed """
+    if engine not in ['numpy', 'numba']:
+        raise ValueError("unknown engine "+str(engine)+", use 'numpy' or 'numba'")
+    if (engine == 'numba'):
+        try:
+            import numba
+        except ImportError:
+            warnings.warn("engine='numba' needs numba to be installed, using engine='numpy'")
+            engine = 'numpy'
+    return engine
+
+@profiled
+def calc_tem(dat, prename="pre", dtype=None, engine='numpy'):
+    """ Calculate the TEM diagnostics.
+    Input: dat = xarray.Dataset of zonal mean fluxes (time, pre, lat), with w in m/s
+           prename = name of the pressure coordinate (hPa), e.g. level for ERA5
+           dtype = precision to compute in (default from precision_utils).  In float32
+                   the stream function integral is still accumulated in float64
+           engine = 'numpy' or 'numba'.  numba computes all the outputs for each time in
+                    one fused pass (same finite differences as np.gradient), which needs
+                    far less memory, but needs numba (without it numpy is used, with a
+                    warning).  The default is numpy
+    Output: xarray.Dataset of uzm, epfy, epfz, vtem, wtem, psitem, utendepfd, utendvtem, utendwtem
+            with the log-pressure height zlogp as an extra vertical coordinate.  The fluxes
+            can be on mid levels or on interfaces (e.g. prename="ilev").  If they are
+            dask backed the output is too, calculated time chunk by time chunk when it's
+            computed (see dask_utils for the chunking)
+    """
+    dtype = get_precision(dtype)
+    engine = _tem_engine(engine)
+    if dat.Uzm.chunks is not None:
+        return _calc_tem_lazy(dat, prename, dtype, engine)
+
+    latrad = np.array((dat.lat/180.)*np.pi, dtype=dtype)
+    f=2.*om*np.sin(latrad[:])
+
+    uzm = np.array(dat.Uzm, dtype=dtype)
+    thzm = np.array(dat.THzm, dtype=dtype)
+    vthzm = np.array(dat.VTHzm, dtype=dtype)
+    vzm = np.array(dat.Vzm, dtype=dtype)
+    uvzm = np.array(dat.UVzm, dtype=dtype)
+    uwzm = np.array(dat.UWzm, dtype=dtype)
+    wzm = np.array(dat.Wzm, dtype=dtype)
+    pre = np.array(dat[prename], dtype=dtype)
+
+    if (engine == 'numba'):
+        temvars = _tem_numba(uzm, thzm, vthzm, vzm, uvzm, uwzm, wzm, pre, latrad, f)
+    else:
+        temvars = _tem_numpy(uzm, thzm, vthzm, vzm, uvzm, uwzm, wzm, pre, latrad, f)
+
+    tem = xr.Dataset({name: xr.DataArray(temvars[name], coords = dat.Uzm.coords, name=name, attrs=temattrs[name])
+                      for name in temattrs})
+    tem = _add_zlogp(tem, prename)
+
+    return tem
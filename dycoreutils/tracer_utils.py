@@ -0,0 +1,180 @@
+# Tracer diagnostics for Q and idealized tracers (e.g. a clock tracer for the age of air).
+#
+# The tropical average is taken over all levels at once with the cached latitude weights
+# from spatialaverage_utils, and values at particular levels are interpolated from that
+# (the latitude average and the vertical interpolation commute), so the data are only
+# read once however many levels are wanted.  tracer_diags does the zonal mean
+# climatology, the tape recorder and the tropical averages at chosen levels for an
+# experiment in a single chunked pass.
+
+import numpy as np
+import xarray as xr
+import dask
+
+from dycoreutils import operator_utils as ops
+from dycoreutils import spatialaverage_utils as avg
+from dycoreutils.profile_utils import profiled
+
+def _zonalmean(darray):
+    return darray.mean('lon') if 'lon' in darray.dims else darray
+
+@profiled
+def tropical_mean(darray, lat1=-10., lat2=10.):
+    """ cos(lat) weighted average over lat1 to lat2 of zonal mean (or lon, lat) data,
+    for all the other dimensions at once, ignoring NaNs.  Stays lazy for dask backed data.
+    """
+    darray = _zonalmean(darray)
+    weights = avg.latweights(darray.lat, lat1, lat2).astype(darray.dtype)
+    # renormalized over the valid points, as cosweightlat does
+    return darray.weighted(weights).mean('lat')
+
+@profiled
+def tape_recorder(darray, lat1=-10., lat2=10., levname="lev", normalize=True):
+    """ Tape recorder: (time, lev) tropical mean anomalies from the time mean at each level
+    Input: darray = tracer (time, lev, lat[, lon]) e.g. Q
+           lat1, lat2 = latitude range of the average
+           normalize = divide the anomalies by their standard deviation at each level
+    """
+    tape = tropical_mean(darray, lat1=lat1, lat2=lat2).transpose('time', levname)
+    tape = tape - tape.mean('time')
+    if normalize:
+        tape = tape/tape.std('time')
+    return tape
+
+def _lagcorr(ref, dat, maxlag):
+    """ lagged correlation of (..., time) data with a (time) reference series, by FFT.
+    Output (..., lag) for lags -maxlag to maxlag, positive where dat lags ref.
+    """
+    from scipy.fft import rfft, irfft, next_fast_len
+
+    ntime = dat.shape[-1]
+    ref = ref - ref.mean()
+    dat = dat - dat.mean(axis=-1, keepdims=True)
+    nfft = next_fast_len(2*ntime - 1)
+    ccov = irfft(np.conj(rfft(ref, n=nfft))*rfft(dat, n=nfft, axis=-1), n=nfft, axis=-1)
+    ccov = np.concatenate((ccov[...,nfft-maxlag:], ccov[...,0:maxlag+1]), axis=-1)
+    return ccov/np.sqrt(np.sum(ref**2)*np.sum(dat**2, axis=-1, keepdims=True))
+
+def _timestep_seconds(time):
+    """ mean time step of a time coordinate in seconds """
+    dtime = np.diff(time.values)
+    if np.issubdtype(dtime.dtype, np.timedelta64):
+        return float(np.mean(dtime/np.timedelta64(1, 's')))
+    return float(np.mean([dt.total_seconds() for dt in dtime]))
+
+@profiled
+def ascent_rate(tape, reflev=100., levname="lev", maxlag=11, plev=(100., 10.)):
+    """ Ascent rate of the tape recorder signal from the lag of maximum correlation of
+    every level with the reference level.
+    Input: tape = (time, lev) from tape_recorder, pressure in hPa
+           reflev = reference level (hPa)
+           maxlag = maximum lag (either way) in time steps.  Keep it below the period of
+                    any dominant cycle, e.g. < 12 months for the water vapour tape recorder,
+                    as the lags are ambiguous beyond that
+           plev = pressure range (hPa) of the levels used for the mean ascent rate
+    Output: xarray.Dataset with
+            lag (lev): lag of maximum correlation in time steps (negative below reflev),
+                       refined by fitting a parabola through the correlation maximum
+            maxcorr (lev): the correlation at that lag
+            w (lev): local ascent rate of log-pressure height (mm/s) from the lags
+            wmean: mean ascent rate over plev from a least squares fit of height against lag
+    """
+    tape = tape.transpose('time', levname).load()
+    ref = np.array(tape.sel({levname: reflev}, method='nearest'))
+    corr = _lagcorr(ref, np.array(tape).T, maxlag)
+
+    ilag = np.argmax(corr, axis=-1)
+    imid = np.clip(ilag, 1, 2*maxlag-1)
+    cm, c0, cp = [np.take_along_axis(corr, (imid+i)[:,None], axis=-1)[:,0] for i in (-1, 0, 1)]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        shift = np.where((ilag > 0) & (ilag < 2*maxlag), 0.5*(cm - cp)/(cm - 2.*c0 + cp), 0.)
+    lag = ilag - maxlag + shift
+    maxcorr = corr[np.arange(corr.shape[0]), ilag]
+
+    dt = _timestep_seconds(tape.time)
+    zlogp = ops.logp_height(tape[levname])
+    with np.errstate(invalid='ignore', divide='ignore'):
+        w = np.gradient(zlogp)/np.gradient(lag*dt)*1e3
+
+    use = (np.array(tape[levname]) <= max(plev)) & (np.array(tape[levname]) >= min(plev))
+    wmean = np.polyfit(lag[use]*dt, zlogp[use], 1)[0]*1e3 if (use.sum() > 1) else np.nan
+
+    levcoord = {levname: tape[levname]}
+    rates = xr.Dataset({'lag': xr.DataArray(lag, coords=levcoord, attrs={'units': 'time steps'}),
+                        'maxcorr': xr.DataArray(maxcorr, coords=levcoord),
+                        'w': xr.DataArray(w, coords=levcoord, attrs={'units': 'mm/s'}),
+                        'wmean': xr.DataArray(wmean, attrs={'units': 'mm/s', 'plev': str(plev)})})
+    return rates
+
+@profiled
+def mean_age(tracer, reference):
+    """ Age of air from a clock tracer: the time since the reference (e.g. the tropical
+    surface value, which has to increase monotonically) last had the tracer's value.
+    Input: tracer = (time, ...) clock tracer
+           reference = (time) reference time series of the same tracer
+    Output: age (time, ...) in days.  NaN where the tracer is below the start of the reference.
+    """
+    tref = np.array(reference.time.values)
+    if np.issubdtype(tref.dtype, np.datetime64):
+        tref = (tref - tref[0])/np.timedelta64(1, 'D')
+    else:
+        tref = np.array([(t - tref[0]).total_seconds()/86400. for t in tref])
+    refvals = np.array(reference, dtype='float64')
+
+    def _age(dat):
+        # dat is (..., time), the whole time axis in each block
+        tsource = np.interp(dat, refvals, tref, left=np.nan)
+        return tref - tsource
+
+    if (tracer.chunks is not None):
+        tracer = tracer.chunk({'time': -1})
+    age = xr.apply_ufunc(_age, tracer, input_core_dims=[['time']], output_core_dims=[['time']],
+                         dask='parallelized', output_dtypes=['float64'])
+    age = age.transpose(*tracer.dims)
+    age.attrs = {'long_name': 'mean age of air', 'units': 'days'}
+    return age
+
+@profiled
+def tracer_diags(darray, levs=(50., 200.), lat1=-10., lat2=10., levname="lev"):
+    """ Tracer diagnostics for one experiment, computed together in one pass through the data.
+    Input: darray = tracer (time, lev, lat[, lon]), e.g. Q, can be dask backed
+           levs = levels (hPa) to interpolate the tropical mean time series to
+    Output: xarray.Dataset with
+            clim (lev, lat): zonal and time mean
+            tropical (time, lev): tropical mean at all levels
+            tape (time, lev): normalized tape recorder anomalies
+            tropical_levs (time, plev): tropical mean interpolated to levs
+    """
+    zm = _zonalmean(darray)
+    clim = zm.mean('time')
+    tropical = tropical_mean(zm, lat1=lat1, lat2=lat2).transpose('time', levname)
+    clim, tropical = dask.compute(clim, tropical)
+
+    tape = tropical - tropical.mean('time')
+    tape = tape/tape.std('time')
+    levs = list(levs)
+    tropical_levs = tropical.interp({levname: xr.DataArray(levs, dims='plev')}).assign_coords(plev=levs)
+
+    diags = xr.Dataset({'clim': clim, 'tropical': tropical, 'tape': tape,
+                        'tropical_levs': tropical_levs.drop_vars(levname)})
+    return diags
+
+@profiled
+def tracer_diags_experiments(paths, var="Q", levs=(50., 200.), lat1=-10., lat2=10., levname="lev",
+                             timeslice=None):
+    """ tracer_diags for a dictionary of experiments {expname: file path or glob}
+    Input: timeslice = optional slice of times e.g. slice("1979-02", "1990-01")
+    Output: xarray.Dataset with an exp dimension.  Experiments with different vertical
+            grids are combined on the union of the levels (NaN elsewhere) for clim, tropical
+            and tape, tropical_levs are on the same levels for all
+    """
+    diags = []
+    for iexp in paths:
+        dat = xr.open_mfdataset(paths[iexp], coords="minimal", join="override")[var]
+        if (timeslice is not None):
+            dat = dat.sel(time=timeslice)
+        diags.append(tracer_diags(dat, levs=levs, lat1=lat1, lat2=lat2, levname=levname))
+
+    diags = xr.concat(diags, dim="exp", join="outer")
+    diags = diags.assign_coords(exp=list(paths))
+    return diags
@@ -0,0 +1,121 @@
+# Stratospheric variability diagnostics for daily zonal mean data (time, pre, lat).
+# Everything is done for all levels and latitudes at once.  Where the input is
+# dask backed the calculations are applied chunk by chunk over pre and lat
+# (time needs to be in a single chunk).
+
+import xarray as xr
+import numpy as np
+
+from dycoreutils import filter_utils as filt
+from dycoreutils.profile_utils import profiled
+
+@profiled
+def deseasonalize_daily(darray, nharms=4):
+    """ remove the seasonal cycle defined as the first nharms harmonics of the
+    day of year climatology
+    """
+    datseas = darray.groupby('time.dayofyear').mean('time')
+    datseas = filt.calc_season_nharm(datseas, nharms, dimtime=0)
+    anoms = darray - datseas.sel(dayofyear=darray['time.dayofyear']).drop_vars('dayofyear')
+    return anoms
+
+@profiled
+def seasonal_std(anoms):
+    """ standard deviation for all four seasons in a single grouped pass
+    Output: (season, ...) with season = DJF, MAM, JJA, SON
+    """
+    std = anoms.groupby('time.season').std('time')
+    std = std.sel(season=['DJF', 'MAM', 'JJA', 'SON'])
+    return std
+
+def _leading_eof(dat, weights):
+    """ leading EOF of (..., time, lat) arrays, batched over the leading dimensions """
+    dat = dat*weights
+    u, s, vt = np.linalg.svd(dat, full_matrices=False)
+    pc = u[...,0]*s[...,0:1]
+    eof = vt[...,0,:]/weights
+    varfrac = s[...,0]**2/np.sum(s**2, axis=-1)
+    return pc, eof, varfrac
+
+@profiled
+def annular_mode_index(anoms, hem='NH', latlim=20., signlat=None):
+    """ Annular mode index at every level from the leading EOF of the deseasonalized
+    (time, lat) field poleward of latlim, with sqrt(cos(lat)) weighting.
+    The sign is set so that the EOF is positive at signlat (default 60N or 60S), so for
+    zonal wind a positive index is a strong vortex.  For geopotential height pass -1 x the anomalies.
+    Output: xarray.Dataset with the standardized index (time, pre), the EOF pattern
+            (pre, lat) in units of the input per standard deviation and the variance fraction.
+    """
+    if (hem == 'NH'):
+        region = anoms.where(anoms.lat >= latlim, drop=True)
+        signlat = 60. if (signlat is None) else signlat
+    else:
+        region = anoms.where(anoms.lat <= -1.*latlim, drop=True)
+        signlat = -60. if (signlat is None) else signlat
+
+    weights = np.sqrt(np.cos(np.deg2rad(np.array(region.lat))))
+
+    # the EOF needs the whole (time, lat) field in each chunk
+    if region.chunks is not None:
+        region = region.chunk({'time': -1, 'lat': -1})
+
+    pc, eof, varfrac = xr.apply_ufunc(_leading_eof, region, kwargs={'weights': weights},
+                             input_core_dims=[['time', 'lat']],
+                             output_core_dims=[['time'], ['lat'], []],
+                             dask='parallelized', output_dtypes=[float, float, float])
+
+    # fix the sign and standardize
+    sign = np.sign(eof.sel(lat=signlat, method='nearest'))
+    pcstd = pc.std('time')
+    index = (sign*pc/pcstd).transpose('time', ...)
+    eof = sign*eof*pcstd
+
+    annmode = xr.Dataset({'index': index, 'eof': eof, 'varfrac': varfrac})
+
+    return annmode
+
+def _acf(dat, maxlag):
+    """ autocorrelation of (..., time) arrays out to maxlag by FFT """
+    from scipy.fft import rfft, irfft, next_fast_len
+
+    ntime = dat.shape[-1]
+    dat = dat - dat.mean(axis=-1, keepdims=True)
+    nfft = next_fast_len(2*ntime - 1)
+    spec = rfft(dat, n=nfft, axis=-1)
+    acov = irfft(spec*np.conj(spec), n=nfft, axis=-1)[...,0:maxlag+1]
+    return acov/acov[...,0:1]
+
+@profiled
+def autocorrelation(anoms, maxlag=120):
+    """ lagged autocorrelation out to maxlag time steps at every point, computed
+    by FFT (biased estimate, i.e. normalized by the lag zero covariance)
+    Output: (..., lag)
+    """
+    if anoms.chunks is not None:
+        anoms = anoms.chunk({'time': -1})
+
+    acf = xr.apply_ufunc(_acf, anoms, kwargs={'maxlag': maxlag},
+                         input_core_dims=[['time']], output_core_dims=[['lag']],
+                         dask='parallelized', output_dtypes=[float],
+                         dask_gufunc_kwargs={'output_sizes': {'lag': maxlag+1}})
+    acf = acf.assign_coords(lag=np.arange(maxlag+1))
+
+    return acf
+
+@profiled
+def efolding_timescale(acf):
+    """ e-folding timescale: the lag at which the autocorrelation first drops
+    below 1/e, linearly interpolated between lags.  NaN if it never does.
+    """
+    def _efold(acf):
+        below = acf < np.exp(-1)
+        ilag = np.argmax(below, axis=-1)
+        ilag = np.maximum(ilag, 1)
+        a0 = np.take_along_axis(acf, (ilag-1)[...,None], axis=-1)[...,0]
+        a1 = np.take_along_axis(acf, ilag[...,None], axis=-1)[...,0]
+        tau = (ilag-1) + (a0 - np.exp(-1))/(a0 - a1)
+        return np.where(below.any(axis=-1), tau, np.nan)
+
+    tau = xr.apply_ufunc(_efold, acf, input_core_dims=[['lag']], dask='parallelized',
+                         output_dtypes=[float])
+    return tau
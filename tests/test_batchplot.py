@@ -0,0 +1,28 @@
+# Tests for batchplot_utils: rendering must not change the caller's matplotlib backend
+
+import os
+
+import matplotlib
+import numpy as np
+
+from dycoreutils import batchplot_utils as batchplot
+
+def _specs(tmpdir, nfigs):
+    lat = np.linspace(-90, 90, 19)
+    pre = np.logspace(-2, 3, 12)
+    data = np.cos(np.deg2rad(lat))[None,:]*np.log(pre)[:,None]
+    return [{'filename': os.path.join(str(tmpdir), 'fig'+str(i)+'.png'),
+             'plotfunc': 'plotlatlogpre_to0p01', 'layout': '4by4', 'figsize': (4,4),
+             'panels': [batchplot.panel(data, lat, pre, 2, -20, 20, 'panel')]}
+            for i in range(nfigs)]
+
+def test_serial_keeps_backend(tmpdir):
+    matplotlib.use('svg')
+    filenames = batchplot.render_figures(_specs(tmpdir, 1), nprocs=1)
+    assert matplotlib.get_backend().lower() == 'svg'
+    assert os.path.getsize(filenames[0]) > 0
+
+def test_parallel(tmpdir):
+    filenames = batchplot.render_figures(_specs(tmpdir, 3), nprocs=2)
+    assert [os.path.basename(f) for f in filenames] == ['fig0.png', 'fig1.png', 'fig2.png']
+    assert all(os.path.getsize(f) > 0 for f in filenames)
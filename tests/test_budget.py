@@ -0,0 +1,123 @@
+# Tests for budget_utils
+
+import cftime
+import numpy as np
+import pytest
+import xarray as xr
+
+from dycoreutils import budget_utils as budget
+
+PRE = np.array([1., 10., 100., 500., 1000.])
+LAT = np.linspace(-80., 80., 9)
+
+def _bounds(nmonths=24):
+    edges = np.array([cftime.DatetimeNoLeap(2000 + (imon // 12), (imon % 12) + 1, 1)
+                      for imon in range(nmonths + 1)])
+    units = "days since 2000-01-01"
+    mid = cftime.num2date(0.5*(cftime.date2num(edges[:-1], units, calendar='noleap')
+                               + cftime.date2num(edges[1:], units, calendar='noleap')),
+                          units, calendar='noleap')
+    return edges, np.asarray(mid)
+
+def _tem():
+    edges, mid = _bounds()
+    rng = np.random.default_rng(8)
+    dims = ('time', 'pre', 'lat')
+    shape = (mid.size, PRE.size, LAT.size)
+    tem = xr.Dataset({var: (dims, 1e-5*rng.standard_normal(shape))
+                      for var in ['utendepfd', 'utendvtem', 'utendwtem', 'psitem']},
+                     coords={'time': mid, 'pre': PRE, 'lat': LAT})
+    tem['uzm'] = (dims, 10. + rng.standard_normal(shape))
+    return tem
+
+LEV = np.logspace(np.log10(0.5), np.log10(1010.), 12)
+
+def _write_gw(path, lat=LAT, nlon=4):
+    """ CESM-like history file: on hybrid levels lev, time at the end of each month,
+    time_bnds and lon.  The zonal mean is linear in log-pressure so it interpolates exactly.
+    Also returns the expected zonal mean on PRE """
+    edges, mid = _bounds()
+    rng = np.random.default_rng(9)
+    base = 1e-5*rng.standard_normal((mid.size, 1, lat.size, nlon))
+    slope = 1e-6*rng.standard_normal((mid.size, 1, 1, 1))
+    gw = xr.Dataset({'UTGWORO': (('time', 'lev', 'lat', 'lon'), base + slope*np.log(LEV)[None,:,None,None]),
+                     'hyam': (('lev',), 1e-3*LEV),
+                     'time_bnds': (('time', 'nbnd'), np.stack([edges[:-1], edges[1:]], axis=1))},
+                    coords={'time': edges[1:], 'lev': LEV, 'lat': lat, 'lon': np.arange(nlon)*90.})
+    gw.to_netcdf(path)
+    onpre = base.mean(axis=-1) + slope[...,0]*np.log(PRE)[None,:,None]
+    return xr.DataArray(onpre, dims=('time', 'pre', 'lat'), coords={'pre': PRE, 'lat': lat})
+
+def test_read_gwtend(tmp_path):
+    expected = _write_gw(str(tmp_path/"gw.nc"))
+    onlev = budget.read_gwtend(str(tmp_path/"gw.nc"))
+    assert list(onlev.data_vars) == ['UTGWORO']
+    assert onlev.UTGWORO.dims == ('time', 'lev', 'lat')
+
+    tem = _tem()
+    onpre = budget.read_gwtend(str(tmp_path/"gw.nc"), tem=tem)
+    assert onpre.UTGWORO.dims == ('time', 'pre', 'lat')
+    np.testing.assert_array_equal(onpre.time, tem.time)
+    np.testing.assert_allclose(onpre.UTGWORO, expected, rtol=1e-10, atol=1e-20)
+
+def test_seasonal_budget_with_gw(tmp_path):
+    _tem().to_netcdf(str(tmp_path/"tem.nc"))
+    expected = _write_gw(str(tmp_path/"gw.nc"))
+    clims = budget.seasonal_budget_experiments({'exp': str(tmp_path/"tem.nc")},
+                                               gwpaths={'exp': str(tmp_path/"gw.nc")})
+
+    # on the TEM grid at the same (midpoint) times as the TEM output
+    djf = expected.isel(time=[0, 1, 11, 12, 13, 23]).mean('time')
+    np.testing.assert_allclose(clims.UTGWORO.sel(exp='exp', season='DJF'), djf, rtol=1e-10, atol=1e-20)
+    forcing = clims.utendepfd + clims.UTGWORO
+    np.testing.assert_allclose(clims.forcing, forcing)
+
+def test_gw_grid_must_match(tmp_path):
+    tem = _tem()
+    _write_gw(str(tmp_path/"gw.nc"))
+    with pytest.raises(ValueError):
+        budget.momentum_budget(tem, gwtend=budget.read_gwtend(str(tmp_path/"gw.nc")))
+    with pytest.raises(ValueError):
+        budget.momentum_budget(tem, gwtend={'UTGWORO': tem.utendepfd.assign_coords(lat=LAT + 1.)})
+    with pytest.raises(ValueError):
+        budget.momentum_budget(tem, gwtend={'UTGWORO': tem.utendepfd.isel(pre=slice(1, None))})
+    with pytest.raises(ValueError):
+        budget.momentum_budget(tem, gwtend={'UTGWORO': tem.utendepfd.rename(pre='lev')})
+
+def _cumtrapz(v, x):
+    """ cumulative trapezoidal integral of v along its last axis from 0 at x=0 """
+    from scipy.integrate import cumulative_trapezoid
+    v0 = np.concatenate((np.zeros(v.shape[:-1]+(1,)), v), axis=-1)
+    return cumulative_trapezoid(v0, np.concatenate(([0.], x)), axis=-1)
+
+def test_downward_control():
+    # away from the equator where fhat = 0
+    tem = _tem().sel(lat=LAT[LAT != 0.])
+    forcing = tem.utendepfd.isel(time=0).transpose('lat', 'pre')
+    latrad = np.deg2rad(tem.lat.values)
+    f = 2.*budget.om*np.sin(latrad)
+    coslat = np.cos(latrad)
+
+    expected = (2.*np.pi*budget.a*coslat/budget.g0)[:,None]*_cumtrapz(-forcing.values/f[:,None], 100.*PRE)
+    psidc = budget.downward_control(forcing)
+    assert psidc.dims == forcing.dims
+    np.testing.assert_allclose(psidc, expected, rtol=1e-10)
+
+    # with the angular momentum gradient in fhat
+    uzm = tem.uzm.isel(time=0).transpose('lat', 'pre')
+    dudphi = np.gradient(uzm.values*coslat[:,None], latrad, axis=0)
+    fhat = f[:,None] - dudphi/(budget.a*coslat[:,None])
+    expected = (2.*np.pi*budget.a*coslat/budget.g0)[:,None]*_cumtrapz(-forcing.values/fhat, 100.*PRE)
+    np.testing.assert_allclose(budget.downward_control(forcing, uzm=uzm), expected, rtol=1e-10)
+
+def test_read_tem_chunks_in_time(tmp_path):
+    tem = _tem()
+    tem.to_netcdf(str(tmp_path/"tem.nc"))
+    lazy = budget.read_tem(str(tmp_path/"tem.nc"), target_mb=0.002)
+    assert len(lazy.uzm.chunks[0]) > 1
+    assert lazy.uzm.chunks[1:] == ((PRE.size,), (LAT.size,))
+
+    expected = budget.seasonal_budget(tem)
+    clim = budget.seasonal_budget(lazy)
+    for var in expected.data_vars:
+        np.testing.assert_allclose(clim[var], expected[var], rtol=1e-10, atol=1e-20)
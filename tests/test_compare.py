@@ -0,0 +1,43 @@
+# Tests for compare_utils
+
+import numpy as np
+import pytest
+import xarray as xr
+
+from dycoreutils import compare_utils as compare
+
+SEASONS = ['DJF', 'MAM', 'JJA', 'SON']
+REFPRE = np.array([800., 500., 200., 100., 50., 10.])
+REFLAT = np.linspace(-80., 80., 17)
+
+def _field(lev, lat, seasons=SEASONS, offset=0.):
+    """ linear in log-pressure and latitude so that the interpolation is exact """
+    values = (offset + np.log(lev)[:,None] + 0.01*lat[None,:])[None,:,:]*np.ones((len(seasons), 1, 1))
+    return xr.DataArray(values, dims=('season', 'lev', 'lat'),
+                        coords={'season': seasons, 'lev': lev, 'lat': lat})
+
+def _reference(seasons=SEASONS):
+    return _field(REFPRE, REFLAT, seasons=seasons).rename(lev='pre')
+
+def test_bias_fields_different_grids():
+    experiments = {'L32': _field(np.logspace(0, 3, 32), np.linspace(-90, 90, 46), offset=1.),
+                   'L83': _field(np.logspace(-1, 3, 83), np.linspace(-90, 90, 96), offset=2.),
+                   'L32b': _field(np.logspace(0, 3, 32), np.linspace(-90, 90, 46), offset=3.)}
+    bias = compare.bias_fields(experiments, _reference())
+    assert list(bias.exp.values) == ['L32', 'L83', 'L32b']
+    assert list(bias.season.values) == SEASONS
+    for iexp, offset in zip(experiments, [1., 2., 3.]):
+        np.testing.assert_allclose(bias.sel(exp=iexp), offset)
+
+def test_bias_fields_coordinates_must_match():
+    lev = np.logspace(0, 3, 32)
+    lat = np.linspace(-90, 90, 46)
+    experiments = {'a': _field(lev, lat), 'b': _field(lev, lat, seasons=['MAM', 'JJA', 'SON', 'DJF'])}
+    with pytest.raises(ValueError):
+        compare.bias_fields(experiments, _reference())
+    # on different grids, so not stacked together
+    experiments['b'] = _field(lev, lat + 1., seasons=['MAM', 'JJA', 'SON', 'DJF'])
+    with pytest.raises(ValueError):
+        compare.bias_fields(experiments, _reference())
+    with pytest.raises(ValueError):
+        compare.bias_fields({'a': _field(lev, lat)}, _reference(seasons=['JJA', 'DJF', 'MAM', 'SON']))
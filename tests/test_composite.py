@@ -0,0 +1,83 @@
+# Tests for composite_utils
+
+import cftime
+import numpy as np
+import pytest
+import xarray as xr
+
+from dycoreutils import composite_utils as comp
+from dycoreutils import resample_utils as resample
+
+from benchmarks import synthetic
+
+def _daily(ndays=200, nlat=3):
+    """ noleap daily data equal to the day number (plus the latitude index) """
+    time = synthetic.noleap_days(1)[0:ndays]
+    values = np.arange(ndays)[:,None] + np.arange(nlat)[None,:]
+    return xr.DataArray(values.astype('float64'), dims=('time', 'lat'),
+                        coords={'time': time, 'lat': np.arange(nlat)})
+
+def test_lag_composite_pads_record_edges():
+    darray = _daily()
+    ievent = [5, 100, 190]
+    dates = [darray.time[i] for i in ievent]
+    result = comp.lag_composite(darray, dates, lagmin=-10, lagmax=20)
+    assert result.dims == ('event', 'lag', 'lat')
+    np.testing.assert_array_equal(result.lag, np.arange(-10, 21))
+    np.testing.assert_array_equal(result.eventdate, darray.time.values[ievent])
+
+    expected = (np.array(ievent)[:,None] + np.arange(-10, 21)[None,:]).astype('float64')
+    expected[(expected < 0) | (expected >= darray.time.size)] = np.nan
+    np.testing.assert_array_equal(result.isel(lat=0), expected)
+    # NaN before the start of the record for the first event and after the end for the last
+    assert np.isnan(result.isel(event=0, lat=0).values[:5]).all()
+    assert np.isnan(result.isel(event=2, lat=0).values[-11:]).all()
+    assert not np.isnan(result.isel(event=1)).any()
+
+def test_lag_composite_dates_as_cftime():
+    darray = _daily()
+    dates = [cftime.DatetimeNoLeap(1979, 2, 1), cftime.DatetimeNoLeap(1979, 3, 1)]
+    result = comp.lag_composite(darray, dates, lagmin=0, lagmax=0)
+    np.testing.assert_array_equal(result.isel(lat=0, lag=0), [31., 59.])
+    with pytest.raises(ValueError):
+        comp.lag_composite(darray, [cftime.DatetimeNoLeap(1980, 3, 1)])
+
+def test_lag_composite_lazy():
+    darray = _daily()
+    dates = [darray.time[i] for i in [5, 100, 190]]
+    expected = comp.lag_composite(darray, dates, lagmin=-10, lagmax=20)
+    lazy = comp.lag_composite(darray.chunk({'time': 50}), dates, lagmin=-10, lagmax=20)
+    assert lazy.chunks is not None
+    xr.testing.assert_identical(lazy.compute(), expected)
+
+def _events(nevent=40, nlag=30, seed=0):
+    """ (event, lag) noise with a signal of 2 at lags 10 to 14 """
+    rng = np.random.default_rng(seed)
+    signal = np.where((np.arange(nlag) >= 10) & (np.arange(nlag) < 15), 2., 0.)
+    return xr.DataArray(signal[None,:] + rng.standard_normal((nevent, nlag)), dims=('event', 'lag'),
+                        coords={'lag': np.arange(nlag)})
+
+def test_bootstrap_composite_significance():
+    events = _events()
+    boot = comp.bootstrap_composite(events, nboot=500, seed=1)
+    np.testing.assert_allclose(boot['mean'], events.mean('event'))
+    assert boot.sig.sel(lag=slice(10, 14)).all()
+    # at most a few false positives at the 25 lags without a signal
+    assert int(boot.sig.drop_sel(lag=range(10, 15)).sum()) <= 3
+    assert (boot.lower <= boot['mean']).all() and (boot['mean'] <= boot.upper).all()
+
+def test_bootstrap_composite_reproducible_and_lazy():
+    events = _events()
+    # NaN padded events, as at the ends of the record, are left out of the means
+    events[0, 0:5] = np.nan
+    expected = comp.bootstrap_composite(events, nboot=300, seed=2)
+    xr.testing.assert_identical(expected, comp.bootstrap_composite(events, nboot=300, seed=2))
+    lazy = comp.bootstrap_composite(events.chunk({'event': 10, 'lag': 7}), nboot=300, seed=2)
+    xr.testing.assert_allclose(lazy.compute(), expected)
+    assert not np.isnan(expected.lower).any()
+
+def test_bootstrap_weights():
+    weights = comp.bootstrap_weights(7, nboot=50, seed=4)
+    assert weights.shape == (50, 7)
+    np.testing.assert_array_equal(weights.sum(axis=1), 7)
+    np.testing.assert_array_equal(weights, resample.resample_weights(7, nboot=50, seed=4))
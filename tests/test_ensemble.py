@@ -0,0 +1,73 @@
+# Tests for calendar_utils.ensemble_reduce and stream_utils.Accumulator
+
+import numpy as np
+import pytest
+import xarray as xr
+
+from dycoreutils import calendar_utils as cal
+from dycoreutils import stream_utils as stream
+
+from benchmarks import synthetic
+
+NMEMBER = 5
+
+def _member(seed, nlev=4, nlat=6):
+    """ one year of daily (time, lev, lat) U, a different realization for each seed """
+    rng = np.random.default_rng(seed)
+    time = synthetic.noleap_days(1)
+    u = 10. + rng.standard_normal((time.size, nlev, nlat))
+    return xr.Dataset({'U': (('time', 'lev', 'lat'), u)},
+                      coords={'time': time, 'lev': synthetic.pressure(nlev), 'lat': synthetic.latitude(nlat)})
+
+def _write_members(tmp_path):
+    paths = {}
+    for imem in range(NMEMBER):
+        paths['mem'+str(imem)] = str(tmp_path/("member"+str(imem)+".nc"))
+        _member(imem).to_netcdf(paths['mem'+str(imem)])
+    return paths
+
+def _reduce(ds):
+    return ds.U.sel(time=ds['time.season'] == 'JJA').mean('time')
+
+@pytest.mark.parametrize('nthreads', [2, NMEMBER + 3])
+def test_ensemble_reduce_matches_concat(tmp_path, nthreads):
+    paths = _write_members(tmp_path)
+    members = xr.concat([_reduce(_member(imem)) for imem in range(NMEMBER)], dim='member')
+
+    result = cal.ensemble_reduce(paths, _reduce, nthreads=nthreads)
+    np.testing.assert_allclose(result['mean'], members.mean('member'))
+    np.testing.assert_allclose(result['std'], members.std('member', ddof=1))
+    np.testing.assert_array_equal(result['count'], NMEMBER)
+    xr.testing.assert_equal(result.lat, members.lat)
+
+    # a list of paths and the population spread
+    result = cal.ensemble_reduce(list(paths.values()), _reduce, nthreads=nthreads, ddof=0)
+    np.testing.assert_allclose(result['std'], members.std('member', ddof=0))
+
+def test_accumulator_matches_concat():
+    samples = [_reduce(_member(imem)) for imem in range(NMEMBER)]
+    members = xr.concat(samples, dim='member')
+
+    # one sample at a time, a block of samples, and two merged accumulators
+    single = stream.Accumulator()
+    for sample in samples:
+        single.update(sample)
+    block = stream.Accumulator().update(members, dim='member')
+    merged = stream.Accumulator().update(members.isel(member=slice(0, 2)), dim='member')
+    merged.merge(stream.Accumulator().update(members.isel(member=slice(2, None)), dim='member'))
+
+    for acc in [single, block, merged]:
+        result = acc.result()
+        np.testing.assert_allclose(result['mean'], members.mean('member'))
+        np.testing.assert_allclose(result['std'], members.std('member', ddof=1))
+        np.testing.assert_allclose(result['var'], members.var('member', ddof=1))
+        assert result['mean'].dims == members.dims[1:]
+
+def test_accumulator_errors():
+    with pytest.raises(ValueError):
+        stream.Accumulator().result()
+    acc = stream.Accumulator().update(_reduce(_member(0)))
+    with pytest.raises(ValueError):
+        acc.update(_reduce(_member(1)).isel(lat=slice(1, None)))
+    # a single sample has no sample spread
+    assert np.isnan(acc.result()['std']).all()
@@ -0,0 +1,90 @@
+# Tests for operator_utils against numpy/scipy
+
+import numpy as np
+import pytest
+from scipy.integrate import cumulative_trapezoid
+
+from dycoreutils import operator_utils as ops
+
+def _grid(decreasing=False):
+    """ non-uniform grid, e.g. pressures in hPa """
+    x = np.array([0.5, 1., 3., 7., 20., 50., 120., 300., 600., 1000.])
+    return x[::-1].copy() if decreasing else x
+
+def _fields(x, nother=4):
+    rng = np.random.default_rng(11)
+    return np.sin(np.log(x))[None,:]*rng.uniform(1., 2., (nother, 1)) + rng.standard_normal((nother, x.size))
+
+@pytest.mark.parametrize('decreasing', [False, True])
+def test_gradient_matches_numpy(decreasing):
+    x = _grid(decreasing)
+    f = _fields(x)
+    op = ops.gradient_matrix(x)
+    expected = np.gradient(f, x, axis=-1, edge_order=1)
+    np.testing.assert_allclose(ops.apply_operator(op, f, -1), expected, rtol=1e-12)
+    # first order at the ends, unlike edge_order=2
+    assert not np.allclose(expected[:,0], np.gradient(f, x, axis=-1, edge_order=2)[:,0])
+
+def test_gradient_float32():
+    x = _grid().astype('float32')
+    f = _fields(x).astype('float32')
+    out = ops.apply_operator(ops.gradient_matrix(x), f, -1)
+    assert out.dtype == np.float32
+    np.testing.assert_allclose(out, np.gradient(f.astype('float64'), x.astype('float64'), axis=-1),
+                               rtol=1e-4, atol=1e-6)
+
+@pytest.mark.parametrize('decreasing', [False, True])
+def test_cumtrapz_matches_scipy(decreasing):
+    x = _grid(decreasing)
+    f = _fields(x)
+    x0 = 1100. if decreasing else 0.
+    op = ops.cumtrapz_matrix(x, x0=x0)
+    # the integrand is 0 at x0
+    expected = cumulative_trapezoid(np.concatenate((np.zeros((f.shape[0], 1)), f), axis=-1),
+                                    np.concatenate(([x0], x)), axis=-1)
+    np.testing.assert_allclose(ops.apply_operator(op, f, -1), expected, rtol=1e-12)
+    assert op.dtype == np.float64
+
+@pytest.mark.parametrize('decreasing', [False, True])
+def test_interp_matches_numpy(decreasing):
+    x = _grid(decreasing)
+    f = _fields(x)
+    # the last two are outside the grid
+    xnew = np.array([0.5, 2., 10., 333., 999., 1000., 0.1, 2000.])
+    op, inside = ops.interp_matrix(x, xnew)
+    np.testing.assert_array_equal(inside, [True]*6 + [False]*2)
+
+    out = ops.apply_operator(op, f, -1)
+    order = np.argsort(x)
+    for i in range(f.shape[0]):
+        np.testing.assert_allclose(out[i,inside], np.interp(xnew[inside], x[order], f[i,order]), rtol=1e-12)
+    # no weights outside, where the callers set NaN
+    np.testing.assert_array_equal(out[:,~inside], 0.)
+    assert op[np.flatnonzero(~inside)].nnz == 0
+
+def test_apply_operator_any_axis():
+    x = _grid()
+    rng = np.random.default_rng(12)
+    arr = rng.standard_normal((3, x.size, 5))
+    op = ops.gradient_matrix(x)
+    np.testing.assert_allclose(ops.apply_operator(op, arr, 1), np.gradient(arr, x, axis=1), rtol=1e-12)
+    np.testing.assert_allclose(ops.apply_operator(op, np.moveaxis(arr, 1, 0), 0),
+                               np.gradient(np.moveaxis(arr, 1, 0), x, axis=0), rtol=1e-12)
+
+def test_cache_shared_between_dtypes_and_byte_orders():
+    # the grid values are exact in float32
+    x = _grid()
+    for other in [x.astype('>f8'), x.astype('float32'), x.astype('>f4'), list(x)]:
+        assert ops.cumtrapz_matrix(other) is ops.cumtrapz_matrix(x)
+        assert ops.interp_matrix(other, x[::3])[0] is ops.interp_matrix(x, x[::3])[0]
+        assert ops.interp_matrix(x, other)[0] is ops.interp_matrix(x, x)[0]
+
+    assert ops.gradient_matrix(x.astype('>f8')) is ops.gradient_matrix(x)
+    # float32 grids get the same operator, stored in float32 (and cached too)
+    single = ops.gradient_matrix(x.astype('float32'))
+    assert single.dtype == np.float32
+    assert single is ops.gradient_matrix(x.astype('>f4'))
+    np.testing.assert_array_equal(single.toarray(), ops.gradient_matrix(x).toarray().astype('float32'))
+
+    # different grids don't share
+    assert ops.gradient_matrix(x*2.) is not ops.gradient_matrix(x)
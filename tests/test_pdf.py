@@ -0,0 +1,71 @@
+# Tests for pdf_utils against np.histogram with the plotposneghisto normalization
+
+import numpy as np
+import pytest
+import xarray as xr
+
+from dycoreutils import calendar_utils as cal
+from dycoreutils import pdf_utils as pdf
+
+from benchmarks import synthetic
+
+BINMIN, BINMAX, BININT = -3., 3., 0.5
+
+def _daily(nyears=3, nlev=4, nlat=6):
+    rng = np.random.default_rng(10)
+    time = synthetic.noleap_days(nyears)
+    values = 1.5*rng.standard_normal((time.size, nlev, nlat))
+    # values on the last bin edge count in the last bin, as in np.histogram
+    values[0:20] = BINMAX - BININT
+    return xr.DataArray(values, dims=('time', 'pre', 'lat'),
+                        coords={'time': time, 'pre': synthetic.pressure(nlev), 'lat': synthetic.latitude(nlat)})
+
+def _expected(darray, lat, pre, season, scale=1.):
+    """ as plotposneghisto: the percentage of all the days of the season in each bin.
+    The incomplete DJFs at the ends of the record are left out, as in group_season_daily """
+    point = darray.sel(lat=lat, pre=pre, method='nearest')
+    data = point.values[np.array(cal.season_mask_daily(point.time, season))]/scale
+    histovals = np.histogram(data, bins=np.arange(BINMIN, BINMAX, BININT))[0]
+    return histovals/np.size(data)*100.
+
+@pytest.mark.parametrize('tchunk', [100, 3650])
+def test_point_pdfs_match_histogram(tchunk):
+    darray = _daily()
+    lats, pres = [-90., 30., 85.], [1000., 0.01, 20.]
+    scale = [1., 2., 0.5]
+    seasons = ('DJF', 'JJA')
+    pdfs = pdf.point_pdfs(darray, lats, pres, BINMIN, BINMAX, BININT, seasons=seasons, scale=scale,
+                          tchunk=tchunk)
+    assert pdfs.dims == ('season', 'point', 'bin')
+    assert list(pdfs.season.values) == list(seasons)
+    np.testing.assert_allclose(pdfs.bin, np.arange(BINMIN, BINMAX, BININT)[:-1])
+    for season in seasons:
+        for i in range(len(lats)):
+            np.testing.assert_allclose(pdfs.sel(season=season).isel(point=i),
+                                       _expected(darray, lats[i], pres[i], season, scale=scale[i]))
+
+def test_point_pdfs_djf_complete_seasons():
+    darray = _daily()
+    pdfs = pdf.point_pdfs(darray, [0.], [100.], BINMIN, BINMAX, BININT)
+    # two complete DJFs in three years
+    point = darray.sel(lat=0., pre=100., method='nearest')
+    months = point.time.dt.month
+    djf = (months == 12) & (point.time.dt.year < 1981) | ((months <= 2) & (point.time.dt.year > 1979))
+    data = point.values[np.array(djf)]
+    assert data.size == 2*90
+    np.testing.assert_allclose(pdfs.isel(season=0, point=0),
+                               np.histogram(data, bins=np.arange(BINMIN, BINMAX, BININT))[0]/data.size*100.)
+
+def test_point_pdfs_default_season_and_lazy():
+    darray = _daily()
+    expected = pdf.point_pdfs(darray, [0.], [100.], BINMIN, BINMAX, BININT)
+    assert list(expected.season.values) == ['DJF']
+    lazy = pdf.point_pdfs(darray.chunk({'time': 200}), [0.], [100.], BINMIN, BINMAX, BININT, tchunk=300)
+    xr.testing.assert_identical(lazy, expected)
+
+def test_point_pdfs_experiments():
+    darrays = {'exp1': _daily(), 'exp2': 2.*_daily()}
+    pdfs = pdf.point_pdfs_experiments(darrays, [0.], [100.], BINMIN, BINMAX, BININT, seasons=('MAM',))
+    assert list(pdfs.exp.values) == ['exp1', 'exp2']
+    np.testing.assert_allclose(pdfs.sel(exp='exp2', season='MAM').isel(point=0),
+                               _expected(darrays['exp2'], 0., 100., 'MAM'))
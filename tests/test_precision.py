@@ -0,0 +1,73 @@
+# Tests for the precision policy of precision_utils and the routines that use it
+
+import numpy as np
+import pandas as pd
+import pytest
+import xarray as xr
+
+from dycoreutils import calendar_utils as cal
+from dycoreutils import filter_utils as filt
+from dycoreutils import precision_utils
+from dycoreutils import tem_utils as tem
+
+from benchmarks import synthetic
+
+def _monthly(dtype, nyears=3, nlat=5):
+    time = pd.date_range('2000-01-01', periods=12*nyears, freq='MS')
+    rng = np.random.default_rng(1)
+    values = 250. + 10.*rng.standard_normal((time.size, nlat))
+    return xr.DataArray(values.astype(dtype), dims=('time', 'lat'),
+                        coords={'time': time, 'lat': np.linspace(-60, 60, nlat)}, name='T')
+
+def test_season_mean_keeps_input_dtype():
+    assert cal.season_mean(_monthly('float32'), season='DJF').dtype == np.float32
+    assert cal.season_mean(_monthly('float64'), season='DJF').dtype == np.float64
+    ds = _monthly('float32').to_dataset()
+    assert cal.season_mean(ds, season='JJA')['T'].dtype == np.float32
+
+def _cesm_dataset():
+    """ float32 U with the datetime64 time_bnds and int32 date of read_cesm_zonalmean output """
+    ds = _monthly('float32').rename('U').to_dataset()
+    time = ds.time.values
+    ds['time_bnds'] = (('time', 'nbnd'), np.stack([time, time], axis=1))
+    ds['date'] = ('time', np.arange(time.size, dtype='int32'))
+    return ds
+
+@pytest.mark.parametrize('season', ['all', 'DJF'])
+@pytest.mark.parametrize('calendar', ['none', 'noleap'])
+def test_season_mean_cesm_dataset(season, calendar):
+    ds = _cesm_dataset()
+    smean = cal.season_mean(ds, season=season, cal=calendar)
+    assert list(smean.data_vars) == ['U', 'time_bnds', 'date']
+    assert smean['U'].dtype == np.float32
+    assert np.issubdtype(smean['time_bnds'].dtype, np.datetime64)
+    np.testing.assert_allclose(smean['U'], cal.season_mean(ds, var='U', season=season, cal=calendar))
+    assert cal.season_mean(ds, season=season, cal=calendar, dtype='float64')['U'].dtype == np.float64
+
+def test_season_mean_requested_dtype():
+    darray = _monthly('float32')
+    assert cal.season_mean(darray, season='DJF', dtype='float64').dtype == np.float64
+    with precision_utils.precision('float64'):
+        assert cal.season_mean(darray, season='DJF').dtype == np.float64
+    assert cal.season_mean(darray, season='DJF').dtype == np.float32
+
+def test_season_mean_float32_tolerance():
+    darray = _monthly('float32')
+    single = cal.season_mean(darray, season='all', cal='noleap')
+    double = cal.season_mean(darray, season='all', cal='noleap', dtype='float64')
+    np.testing.assert_allclose(single, double, rtol=2e-6)
+
+def test_calc_season_nharm_keeps_input_dtype():
+    darray = _monthly('float32', nyears=1).rename(time='dayofyear')
+    darray = darray.assign_coords(dayofyear=np.arange(1, 13))
+    assert filt.calc_season_nharm(darray, 2, dimtime=0).dtype == np.float32
+    assert filt.calc_season_nharm(darray, 2, dimtime=0, dtype='float64').dtype == np.float64
+
+def test_calc_tem_float32_tolerance():
+    fluxes = synthetic.tem_fluxes(1, 16, 24).isel(time=slice(0, 30))
+    double = tem.calc_tem(fluxes, dtype='float64', engine='numpy')
+    single = tem.calc_tem(fluxes, dtype='float32', engine='numpy')
+    for var in double.data_vars:
+        assert single[var].dtype == np.float32
+        error = float(np.abs(single[var] - double[var]).max()/np.abs(double[var]).max())
+        assert error < 1e-5, var
@@ -0,0 +1,42 @@
+# Tests for profile_utils
+
+import pytest
+
+from dycoreutils import profile_utils as profile
+
+@profile.profiled
+def _add(a, b):
+    return a + b
+
+@pytest.mark.parametrize('value', ['1', 'true', 'True', 'yes', 'YES'])
+def test_enabled(monkeypatch, value):
+    monkeypatch.setenv('DYCOREUTILS_PROFILE', value)
+    assert profile.profiling_enabled()
+
+@pytest.mark.parametrize('value', ['', '0', 'false', 'no', '/tmp/log.jsonl'])
+def test_disabled(monkeypatch, value):
+    monkeypatch.setenv('DYCOREUTILS_PROFILE', value)
+    assert not profile.profiling_enabled()
+
+def test_records_and_log(monkeypatch, tmp_path):
+    logfile = str(tmp_path/"log.jsonl")
+    monkeypatch.setenv('DYCOREUTILS_PROFILE', 'yes')
+    monkeypatch.delenv('DYCOREUTILS_PROFILE_LOG', raising=False)
+    profile.clear()
+    assert _add(1, 2) == 3
+    assert [record['function'] for record in profile.get_records()] == [__name__+'._add']
+    assert not (tmp_path/"log.jsonl").exists()
+
+    monkeypatch.setenv('DYCOREUTILS_PROFILE_LOG', logfile)
+    _add(3, 4)
+    assert len(profile.get_records()) == 2
+    assert [record['function'] for record in profile.read_log(logfile)] == [__name__+'._add']
+    profile.clear()
+
+def test_log_needs_profiling_on(monkeypatch, tmp_path):
+    monkeypatch.delenv('DYCOREUTILS_PROFILE', raising=False)
+    monkeypatch.setenv('DYCOREUTILS_PROFILE_LOG', str(tmp_path/"log.jsonl"))
+    profile.clear()
+    assert _add(1, 2) == 3
+    assert profile.get_records() == []
+    assert not (tmp_path/"log.jsonl").exists()
@@ -0,0 +1,74 @@
+# Tests for qbo_utils on a synthetic descending QBO
+
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+from dycoreutils import qbo_utils as qbo
+
+PERIOD = 28.
+LEV = np.array([70., 50., 30., 20., 15., 10., 7., 5.])
+Z = -qbo.H*np.log(LEV/1000.)/1000.
+# 30hPa lags 10hPa by a quarter period, so the two are in quadrature
+RATE = (Z[LEV == 10.][0] - Z[LEV == 30.][0])/(PERIOD/4.)
+
+def _qbo(nyears=28, amp=20.):
+    """ monthly u = amp*sin(2 pi (t - lag)/PERIOD) with the westerlies descending at RATE
+    km/month, lag = 0 at 10hPa.  28 years is a whole number of periods for every calendar
+    month, so the monthly climatology is zero """
+    time = pd.date_range('1980-01-01', periods=12*nyears, freq='MS')
+    t = np.arange(time.size)
+    lag = (Z[LEV == 10.][0] - Z)/RATE
+    u = amp*np.sin(2.*np.pi*(t[:,None] - lag[None,:])/PERIOD)
+    return xr.DataArray(u, dims=('time', 'lev'), coords={'time': time, 'lev': LEV}), lag
+
+def test_period():
+    u, lag = _qbo()
+    period = qbo.qbo_period(u)
+    np.testing.assert_allclose(period.period, PERIOD, atol=0.1)
+    # the running mean is one sided at the ends of the record, which can move a crossing there
+    assert (period.period_std < 0.3).all()
+    assert (period.ncycles >= 10).all()
+
+def test_westerly_onsets():
+    u, lag = _qbo()
+    levidx, tcross = qbo.westerly_onsets(u, smooth=1)
+    iref = np.flatnonzero(LEV == 10.)[0]
+    # onsets at every multiple of the period, as the lag is 0 there
+    onsets = tcross[levidx == iref]
+    ncycle = np.round(onsets/PERIOD)
+    np.testing.assert_array_equal(np.diff(ncycle), 1)
+    np.testing.assert_allclose(onsets, PERIOD*ncycle, atol=0.05)
+
+def test_descent():
+    u, lag = _qbo()
+    descent = qbo.qbo_descent(u, reflev=10.)
+    np.testing.assert_allclose(descent.lag, lag, atol=0.1)
+    np.testing.assert_allclose(descent.descent_rate, RATE, rtol=0.02)
+
+def test_phase():
+    u, lag = _qbo()
+    phase = qbo.qbo_phase(u, lev1=10., lev2=30.)
+    t = np.arange(u.time.size)
+    # u10 = sin(theta), u30 = -cos(theta), so the phase is theta - pi/2
+    expected = np.angle(np.exp(1j*(2.*np.pi*t/PERIOD - np.pi/2.)))
+    diff = np.angle(np.exp(1j*(phase.values - expected)))
+    # away from the ends of the running mean
+    assert np.abs(diff[3:-3]).max() < 0.05
+
+def test_phase_composite():
+    u, lag = _qbo()
+    composite = qbo.qbo_phase_composite(u, nphase=8)
+    assert composite.sizes['phasebin'] == 8
+    # u10 = cos(phase), largest in the bins next to phase 0
+    u10 = composite.sel(lev=10.)
+    assert np.corrcoef(u10, np.cos(composite.phase))[0,1] > 0.99
+
+def test_qbo_diags():
+    u, lag = _qbo()
+    diags = qbo.qbo_diags({'exp1': u, 'exp2': u.isel(lev=slice(1, None))})
+    assert list(diags) == ['exp1', 'exp2']
+    assert set(['ddamp', 'period', 'lag', 'descent_rate']) <= set(diags['exp1'].data_vars)
+    # sqrt(2) x the standard deviation of a sinusoid is its amplitude
+    np.testing.assert_allclose(diags['exp1'].ddamp, 20., rtol=0.01)
+    np.testing.assert_allclose(diags['exp2'].lag, diags['exp1'].lag.isel(lev=slice(1, None)))
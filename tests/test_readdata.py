@@ -0,0 +1,76 @@
+# Tests for readdata_utils
+
+import cftime
+import numpy as np
+import pandas as pd
+import pytest
+import xarray as xr
+
+from dycoreutils import readdata_utils as read
+
+from benchmarks import synthetic
+
+UNITS = "days since 2000-01-01 00:00:00"
+
+def _monthly_bounds(calendar, bnddim, cftimes=True, nmonths=14):
+    """ monthly data with time at the end of each month, as in the CESM history files,
+    and time bounds from the start to the end of the month, decoded to cftime or
+    datetime64.  Also returns the midpoints in UNITS """
+    starts = [cftime.datetime(2000 + (imon // 12), (imon % 12) + 1, 1, calendar=calendar)
+              for imon in range(nmonths + 1)]
+    edges = cftime.date2num(starts, UNITS, calendar=calendar)
+    if cftimes:
+        decoded = np.array(cftime.num2date(edges, UNITS, calendar=calendar))
+    else:
+        decoded = np.asarray(pd.Timestamp("2000-01-01") + pd.to_timedelta(edges, unit='D'))
+    bounds = np.stack([decoded[:-1], decoded[1:]], axis=1)
+    ds = xr.Dataset({'time_bnds': (('time', bnddim), bounds)}, coords={'time': decoded[1:]})
+    return ds, 0.5*(edges[:-1] + edges[1:])
+
+@pytest.mark.parametrize('calendar', ['noleap', '360_day', 'standard', 'gregorian'])
+@pytest.mark.parametrize('bnddim', ['nbnd', 'd2'])
+def test_midpoint_cftime(calendar, bnddim):
+    ds, expected = _monthly_bounds(calendar, bnddim)
+    midpoint = read.time_bnds_midpoint(ds)
+    assert isinstance(midpoint[0], cftime.datetime)
+    assert midpoint[0].calendar == ds.time_bnds.values[0,0].calendar
+    np.testing.assert_allclose(cftime.date2num(midpoint, UNITS, calendar=calendar), expected)
+
+@pytest.mark.parametrize('calendar', ['standard', 'gregorian'])
+@pytest.mark.parametrize('bnddim', ['nbnd', 'd2'])
+def test_midpoint_datetime64(calendar, bnddim):
+    ds, expected = _monthly_bounds(calendar, bnddim, cftimes=False)
+    assert np.issubdtype(ds.time_bnds.dtype, np.datetime64)
+    midpoint = read.time_bnds_midpoint(ds)
+    assert np.issubdtype(midpoint.dtype, np.datetime64)
+    days = (pd.DatetimeIndex(midpoint) - pd.Timestamp("2000-01-01"))/pd.Timedelta(days=1)
+    np.testing.assert_allclose(days, expected)
+    # mid-February 2000 is 14.5 days into the (leap year) month
+    assert midpoint[1] == np.datetime64("2000-02-15T12:00:00")
+
+def test_midpoint_bounds_first():
+    ds, expected = _monthly_bounds('noleap', 'nbnd')
+    ds = ds.rename(time_bnds='time_bounds')
+    ds['time_bounds'] = ds.time_bounds.transpose('nbnd', 'time')
+    midpoint = read.time_bnds_midpoint(ds)
+    np.testing.assert_allclose(cftime.date2num(midpoint, UNITS, calendar='noleap'), expected)
+
+def test_midpoint_no_bounds():
+    ds, expected = _monthly_bounds('noleap', 'nbnd')
+    with pytest.raises(KeyError):
+        read.time_bnds_midpoint(ds.drop_vars('time_bnds'))
+
+@pytest.mark.parametrize('nprefetch', [1, 3])
+@pytest.mark.parametrize('dates', [(None, None), ("1979-06", "1980-08")])
+def test_read_prefetch_matches_zonalmean(tmp_path, nprefetch, dates):
+    # five files that don't line up with the years, so the subrange starts and ends mid-file
+    # and leaves out the last two files altogether
+    files = synthetic.write_cesm_monthly(str(tmp_path), 3, 3, 4, 5, nfiles=5)
+    expected = read.read_cesm_zonalmean(files, *dates).load()
+
+    prefetched = read.read_prefetch(files, *dates, reduce=lambda dat: dat.mean("lon"), cesm=True,
+                                    nprefetch=nprefetch)
+    xr.testing.assert_identical(prefetched, expected)
+    xr.testing.assert_identical(read.read_cesm_zonalmean(files, *dates, prefetch=nprefetch), expected)
+    if (dates[0] is not None):
+        assert expected.time.size == 15
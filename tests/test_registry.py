@@ -0,0 +1,30 @@
+# Tests for registry_utils
+
+import numpy as np
+import xarray as xr
+
+from dycoreutils import registry_utils as registry
+
+def _write(path):
+    ds = xr.Dataset({'U': (('time', 'lat'), np.ones((3, 2))), 'V': (('time', 'lat'), np.zeros((3, 2)))},
+                    coords={'time': ('time', [15., 45., 75.], {'units': 'days since 2000-01-01'}),
+                            'lat': [-45., 45.]})
+    ds.to_netcdf(path)
+
+def test_cache_keyed_on_experiment_and_glob(tmp_path):
+    _write(str(tmp_path/"hist.nc"))
+    files = str(tmp_path)+"/hist.nc"
+    reg = registry.Registry({'exp': {'files': files, 'cesm': False},
+                             'exp360': {'files': files, 'cesm': False, 'calendar': '360_day'}})
+
+    # U and V of the same files are one dataset
+    reg.get('exp', 'U')
+    reg.get('exp', 'V')
+    assert reg.cache_info()['misses'] == 1
+    assert reg.cache_info()['hits'] == 1
+
+    # the same files decoded with another calendar aren't
+    time = reg.get('exp360', 'U').time
+    assert reg.cache_info()['misses'] == 2
+    assert time.values[0].calendar == '360_day'
+    reg.close()
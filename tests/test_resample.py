@@ -0,0 +1,71 @@
+# Tests for resample_utils
+
+import numpy as np
+import pytest
+import xarray as xr
+
+from dycoreutils import resample_utils as resample
+
+def _seasonal(nyear, npoint=40, shift=0., seed=0):
+    """ (year, lat) seasonal means, N(shift, 1) """
+    rng = np.random.default_rng(seed)
+    return xr.DataArray(shift + rng.standard_normal((nyear, npoint)), dims=('year', 'lat'),
+                        coords={'year': np.arange(nyear), 'lat': np.linspace(-90, 90, npoint)})
+
+def test_weights_rows_sum_to_the_sample_count():
+    weights = resample.resample_weights(17, nboot=200, seed=1)
+    assert weights.shape == (200, 17)
+    np.testing.assert_array_equal(weights.sum(axis=1), 17)
+
+    weights = resample.block_resample_weights(6, 90, 7, nboot=200, seed=1)
+    assert weights.shape == (200, 6*90)
+    np.testing.assert_array_equal(weights.sum(axis=1), 6*90)
+    with pytest.raises(ValueError):
+        resample.block_resample_weights(6, 5, 7)
+
+def test_weights_reproducible():
+    np.testing.assert_array_equal(resample.resample_weights(10, seed=3), resample.resample_weights(10, seed=3))
+    assert not np.array_equal(resample.resample_weights(10, seed=3), resample.resample_weights(10, seed=4))
+    np.testing.assert_array_equal(resample.block_resample_weights(4, 30, 5, seed=3),
+                                  resample.block_resample_weights(4, 30, 5, seed=3))
+
+def test_weighted_means_ignore_nans():
+    dat = np.array([[1., 2., np.nan, 4.], [np.nan, np.nan, np.nan, np.nan]])
+    weights = np.array([[1, 1, 1, 1], [0, 0, 4, 0], [2, 0, 0, 2]])
+    means = resample.weighted_means(dat, weights)
+    np.testing.assert_allclose(means[0], [7./3., np.nan, 2.5])
+    assert np.isnan(means[1]).all()
+
+def test_bootstrap_diff_reproducible():
+    exp, ref = _seasonal(30, shift=0.3, seed=1), _seasonal(25, seed=2)
+    first = resample.bootstrap_diff(exp, ref, nboot=300, seed=5)
+    xr.testing.assert_identical(first, resample.bootstrap_diff(exp, ref, nboot=300, seed=5))
+    assert not np.array_equal(first.lower, resample.bootstrap_diff(exp, ref, nboot=300, seed=6).lower)
+    np.testing.assert_allclose(first['diff'], exp.mean('year') - ref.mean('year'))
+
+def test_bootstrap_diff_independent_of_chunking():
+    exp, ref = _seasonal(30, shift=0.3, seed=1), _seasonal(25, seed=2)
+    expected = resample.bootstrap_diff(exp, ref, nboot=300, seed=5)
+    lazy = resample.bootstrap_diff(exp.chunk({'lat': 7, 'year': 10}), ref.chunk({'lat': 13}), nboot=300, seed=5)
+    assert lazy.lower.chunks is not None
+    xr.testing.assert_allclose(lazy.compute(), expected)
+
+def test_bootstrap_diff_significance():
+    # no difference at the first half of the points, a difference of 8 standard errors at the rest
+    npoint = 200
+    shift = np.where(np.arange(npoint) < npoint//2, 0., 2.)
+    exp = _seasonal(30, npoint=npoint, seed=1) + shift
+    ref = _seasonal(30, npoint=npoint, seed=2)
+    boot = resample.bootstrap_diff(exp, ref, nboot=500, siglevel=0.05, seed=0)
+    assert boot.sig[npoint//2:].all()
+    assert float(boot.sig[:npoint//2].mean()) < 0.15
+    assert (boot.lower <= boot['diff']).all() and (boot['diff'] <= boot.upper).all()
+
+def test_block_bootstrap_daily():
+    rng = np.random.default_rng(4)
+    exp = xr.DataArray(1. + rng.standard_normal((20, 90, 3)), dims=('year', 'day', 'lat'))
+    ref = xr.DataArray(rng.standard_normal((15, 90, 3)), dims=('year', 'day', 'lat'))
+    boot = resample.bootstrap_diff(exp, ref, nboot=200, blocklen=10, seed=2)
+    np.testing.assert_allclose(boot['diff'], exp.mean(('year', 'day')) - ref.mean(('year', 'day')))
+    assert boot.sig.all()
+    xr.testing.assert_identical(boot, resample.bootstrap_diff(exp, ref, nboot=200, blocklen=10, seed=2))
@@ -0,0 +1,89 @@
+# Tests for store_utils
+
+import numpy as np
+import pytest
+import xarray as xr
+
+from dycoreutils import store_utils as store
+
+from benchmarks import synthetic
+
+def _tem(nyears=1, nlev=6, nlat=8):
+    """ TEM-like output (time, pre, lat) on a noleap calendar """
+    rng = np.random.default_rng(7)
+    time = synthetic.noleap_days(nyears)
+    pre = synthetic.pressure(nlev)
+    lat = synthetic.latitude(nlat)
+    dims = ('time', 'pre', 'lat')
+    shape = (time.size, nlev, nlat)
+    dat = xr.Dataset({'epfz': (dims, rng.standard_normal(shape).astype('float32'), {'units': 'm3/s2'}),
+                      'utendepfd': (dims, rng.standard_normal(shape), {'units': 'm/s2'})},
+                     coords={'time': time, 'pre': pre, 'lat': lat})
+    return dat
+
+@pytest.mark.parametrize('layout', store.layouts)
+def test_zarr_round_trip(tmp_path, layout):
+    pytest.importorskip('zarr')
+    dat = _tem()
+    path = str(tmp_path/"tem.zarr")
+    store.write_zarr(dat, path, pointchunk=3, snapchunk=30)
+
+    back = store.open_zarr(path, layout=layout)
+    chunks = dict(zip(back.epfz.dims, back.epfz.data.chunksize))
+    if (layout == 'timeseries'):
+        assert chunks == {'time': dat.time.size, 'pre': 3, 'lat': 3}
+    else:
+        assert chunks == {'time': 30, 'pre': dat.pre.size, 'lat': dat.lat.size}
+
+    xr.testing.assert_identical(back.compute(), dat)
+    assert back.epfz.dtype == np.float32
+    assert back.time.values[0].calendar == 'noleap'
+
+def test_zarr_one_layout(tmp_path):
+    pytest.importorskip('zarr')
+    path = str(tmp_path/"tem.zarr")
+    store.write_zarr(_tem().epfz, path, layouts=['timeseries'])
+    assert list(store.open_zarr(path, layout='timeseries').data_vars) == ['epfz']
+    with pytest.raises(ValueError):
+        store.open_zarr(path, layout='columns')
+
+def test_point_timeseries(tmp_path):
+    pytest.importorskip('zarr')
+    dat = _tem()
+    path = str(tmp_path/"tem.zarr")
+    store.write_zarr(dat, path)
+
+    lats, pres = [60., -30.], [10., 100.]
+    points = store.point_timeseries(path, lats, pres, varnames=['epfz'])
+    assert points.epfz.dims == ('time', 'point')
+    for i in range(len(lats)):
+        expected = dat.epfz.sel(lat=lats[i], pre=pres[i], method='nearest')
+        np.testing.assert_array_equal(points.epfz.isel(point=i), expected)
+
+def test_open_memmap_matches_xarray(tmp_path):
+    pytest.importorskip('h5py')
+    path = str(tmp_path/"tem.nc")
+    _tem().to_netcdf(path, engine='netcdf4')
+
+    mapped = store.open_memmap(path)
+    assert isinstance(mapped.epfz.data, np.memmap)
+    with xr.open_dataset(path) as expected:
+        xr.testing.assert_equal(mapped, expected.load())
+    # cached on the path and modification time
+    assert store.open_memmap(path) is mapped
+    assert list(store.open_memmap(path, varnames=['utendepfd']).data_vars) == ['utendepfd']
+
+    points = store.memmap_points(path, [60., -30.], [10., 100.])
+    for point, lat, pre in zip(points, [60., -30.], [10., 100.]):
+        xr.testing.assert_equal(point, mapped.sel(lat=lat, pre=pre, method='nearest'))
+
+@pytest.mark.parametrize('encoding', [{'zlib': True}, {'chunksizes': (30, 6, 8)},
+                                      {'dtype': 'int16', 'scale_factor': 0.001}])
+def test_open_memmap_refuses_chunked_files(tmp_path, encoding):
+    pytest.importorskip('h5py')
+    path = str(tmp_path/"tem.nc")
+    _tem().to_netcdf(path, engine='netcdf4', encoding={'utendepfd': encoding})
+    with pytest.raises(ValueError):
+        store.open_memmap(path)
+    # the other variables can still be mapped
+    assert isinstance(store.open_memmap(path, varnames=['epfz']).epfz.data, np.memmap)
@@ -0,0 +1,44 @@
+# Tests for stream_utils
+
+import numpy as np
+import pandas as pd
+import pytest
+import xarray as xr
+
+from dycoreutils import stream_utils as stream
+
+BINS = np.arange(-4., 4.5, 0.5)
+
+def _daily(nyears=2, nlat=4):
+    time = pd.date_range('2000-01-01', periods=365*nyears, freq='D')
+    rng = np.random.default_rng(2)
+    return xr.DataArray(rng.standard_normal((time.size, nlat)), dims=('time', 'lat'),
+                        coords={'time': time, 'lat': np.linspace(-60, 60, nlat)})
+
+def test_merge_with_histograms():
+    darray = _daily()
+    half = darray.time.size // 2
+    accs = [stream.accumulate([darray.isel(time=slice(0, half))], bins=BINS),
+            stream.accumulate([darray.isel(time=slice(half, None))], bins=BINS)]
+    merged = stream.merge_accumulators(accs).seasonal()
+    expected = stream.stream_stats(darray, tchunk=100, bins=BINS).seasonal()
+    np.testing.assert_array_equal(merged['hist'], expected['hist'])
+    np.testing.assert_array_equal(merged['count'], expected['count'])
+    np.testing.assert_allclose(merged['mean'], expected['mean'])
+    np.testing.assert_allclose(merged['var'], expected['var'])
+
+    djf = darray.sel(time=darray['time.season'] == 'DJF')
+    hist = np.histogram(djf.isel(lat=0), bins=BINS)[0]
+    np.testing.assert_array_equal(merged['hist'].sel(season='DJF').isel(lat=0), hist)
+
+def test_merge_bins_must_match():
+    darray = _daily(nyears=1)
+    withhist = stream.accumulate([darray], bins=BINS)
+    with pytest.raises(ValueError):
+        stream.accumulate([darray]).merge(withhist)
+    with pytest.raises(ValueError):
+        withhist.merge(stream.accumulate([darray]))
+    with pytest.raises(ValueError):
+        withhist.merge(stream.accumulate([darray], bins=BINS[::2]))
+    with pytest.raises(ValueError):
+        stream.SeasonalAccumulator().merge(withhist)
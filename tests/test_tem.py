@@ -0,0 +1,42 @@
+# Tests for the tem_utils engines
+
+import sys
+
+import numpy as np
+import pytest
+import xarray as xr
+
+from dycoreutils import tem_utils as tem
+
+from benchmarks import synthetic
+
+def _fluxes():
+    return synthetic.tem_fluxes(1, 16, 24).isel(time=slice(0, 30))
+
+def _assert_close(actual, expected):
+    for var in expected.data_vars:
+        scale = float(np.abs(expected[var]).max())
+        np.testing.assert_allclose(actual[var], expected[var], rtol=1e-10, atol=1e-10*scale, err_msg=var)
+
+def test_numba_matches_numpy():
+    pytest.importorskip('numba')
+    fluxes = _fluxes()
+    expected = tem.calc_tem(fluxes, dtype='float64', engine='numpy')
+    _assert_close(tem.calc_tem(fluxes, dtype='float64', engine='numba'), expected)
+
+    # dask backed, time chunk by time chunk
+    lazy = tem.calc_tem(fluxes.chunk({'time': 7}), dtype='float64', engine='numba')
+    assert lazy.epfz.chunks is not None
+    _assert_close(lazy.compute(), expected)
+
+def test_numba_missing_falls_back_to_numpy(monkeypatch):
+    # a None entry in sys.modules makes the import fail as if numba weren't installed
+    monkeypatch.setitem(sys.modules, 'numba', None)
+    fluxes = _fluxes()
+    with pytest.warns(UserWarning, match='numba'):
+        fallback = tem.calc_tem(fluxes, dtype='float64', engine='numba')
+    xr.testing.assert_identical(fallback, tem.calc_tem(fluxes, dtype='float64', engine='numpy'))
+
+def test_unknown_engine():
+    with pytest.raises(ValueError):
+        tem.calc_tem(_fluxes(), engine='fortran')
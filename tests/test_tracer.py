@@ -0,0 +1,41 @@
+# Tests for tracer_utils
+
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+from dycoreutils import spatialaverage_utils as avg
+from dycoreutils import tracer_utils as tracer
+
+def _clock(ntime=24, nlev=6, nlat=3):
+    time = pd.date_range('2000-01-01', periods=ntime, freq='MS')
+    days = np.asarray((time - time[0]).days, dtype='float64')
+    delay = 30.*np.arange(1, nlev+1)
+    # tracer = clock value at the surface delay days earlier
+    values = (days[:,None] - delay[:,None].T)[:,:,None]*np.ones(nlat)
+    tracer_ = xr.DataArray(values, dims=('time', 'lev', 'lat'),
+                           coords={'time': time, 'lev': np.arange(nlev), 'lat': np.linspace(-10, 10, nlat)})
+    reference = xr.DataArray(days, dims='time', coords={'time': time})
+    return tracer_, reference, delay
+
+def test_mean_age_numpy():
+    clock, reference, delay = _clock()
+    age = tracer.mean_age(clock, reference)
+    assert age.dims == clock.dims
+    # exact once the source time is within the reference record
+    np.testing.assert_allclose(age.isel(time=-1, lat=0).values, delay)
+
+def test_mean_age_dask_matches_numpy():
+    clock, reference, delay = _clock()
+    expected = tracer.mean_age(clock, reference)
+    age = tracer.mean_age(clock.chunk({'time': 6, 'lev': 3}), reference)
+    assert age.chunks is not None
+    xr.testing.assert_allclose(age.compute(), expected)
+
+def test_tropical_mean_ignores_nans():
+    lat = np.linspace(-20, 20, 9)
+    dat = xr.DataArray(np.ones((2, lat.size)), dims=('time', 'lat'), coords={'lat': lat})
+    dat[0, 4] = np.nan
+    trop = tracer.tropical_mean(dat, lat1=-10., lat2=10.)
+    np.testing.assert_allclose(trop.values, [1., 1.])
+    np.testing.assert_allclose(trop.values, avg.cosweightlat(dat, -10., 10.).values)
@@ -0,0 +1,29 @@
+# Tests for variability_utils on lazy (dask backed) input as from open_mfdataset
+
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+from dycoreutils import variability_utils as var
+
+def _anoms(ntime=400, nlev=3, nlat=24):
+    rng = np.random.default_rng(0)
+    lat = np.linspace(-88.5, 88.5, nlat)
+    pattern = np.exp(-((np.abs(lat) - 60.)/15.)**2)
+    pcs = rng.standard_normal((ntime, nlev))
+    anoms = pcs[:,:,None]*pattern + 0.1*rng.standard_normal((ntime, nlev, nlat))
+    return xr.DataArray(anoms, dims=('time', 'pre', 'lat'),
+                        coords={'time': pd.date_range('2000-01-01', periods=ntime),
+                                'pre': [10., 50., 100.], 'lat': lat})
+
+def test_annular_mode_index_lazy():
+    anoms = _anoms()
+    expected = var.annular_mode_index(anoms)
+    lazy = var.annular_mode_index(anoms.chunk({'time': 100, 'lat': 6}))
+    xr.testing.assert_allclose(lazy.compute(), expected)
+
+def test_autocorrelation_lazy():
+    anoms = _anoms()
+    expected = var.autocorrelation(anoms, maxlag=10)
+    lazy = var.autocorrelation(anoms.chunk({'time': 100}), maxlag=10)
+    xr.testing.assert_allclose(lazy.compute(), expected)